@@ -0,0 +1,97 @@
+"""
+リクエストライン・ヘッダのパースのマイクロベンチマーク
+以前の実装(ヘッダ全体をデコードし、1行ずつre.splitで分割して辞書に入れる)と、
+fango.http.parserの実装を比較する
+
+STEP13ディレクトリで実行する
+$ python benchmarks/parse_request.py
+"""
+import os
+import re
+import sys
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from fango.http.parser import parse_request_head
+from fango.http.request import HTTPRequest
+
+# ブラウザが送る程度のリクエスト
+HEAD = (
+    b"GET /user/3/profile?tab=posts HTTP/1.1\r\n"
+    b"Host: localhost:8080\r\n"
+    b"User-Agent: Mozilla/5.0 (X11; Linux x86_64; rv:128.0) Gecko/20100101 Firefox/128.0\r\n"
+    b"Accept: text/html,application/xhtml+xml,application/xml;q=0.9,*/*;q=0.8\r\n"
+    b"Accept-Language: ja,en-US;q=0.7,en;q=0.3\r\n"
+    b"Accept-Encoding: gzip, deflate, br\r\n"
+    b"Referer: http://localhost:8080/now\r\n"
+    b"Connection: keep-alive\r\n"
+    b"Cookie: sessionid=0123456789abcdef0123456789abcdef; csrftoken=abcdefabcdefabcdefabcdef\r\n"
+    b"Upgrade-Insecure-Requests: 1\r\n"
+    b"Sec-Fetch-Dest: document\r\n"
+    b"Sec-Fetch-Mode: navigate\r\n"
+    b"Sec-Fetch-Site: same-origin\r\n"
+    b"If-None-Match: \"5f3c-1a2b3c\"\r\n"
+    b"\r\n"
+)
+
+
+def old_parse_request_head(head: bytes) -> HTTPRequest:
+    """
+    以前のHTTPHandler.parse_request_head
+    """
+    request_line, _, request_header = head.rstrip(b"\r\n").partition(b"\r\n")
+    method, path, http_version = request_line.decode().split(" ")
+    headers = {}
+    if request_header:
+        for header_row in request_header.decode().split("\r\n"):
+            key, value = re.split(r": *", header_row, maxsplit=1)
+            headers[key] = value
+    request = HTTPRequest(method=method, path=path, http_version=http_version)
+    # 現在のHTTPRequestはdictをHeadersに変換するので、変換せずに以前と同じdictを持たせる
+    request.headers = headers
+    return request
+
+
+def old_get_header(request: HTTPRequest, name: str):
+    """
+    以前のHTTPRequest.get_header(辞書を先頭から探す)
+    """
+    name = name.lower()
+    for key, value in request.headers.items():
+        if key.lower() == name:
+            return value
+    return None
+
+
+def parse_only(parse) -> None:
+    parse(HEAD)
+
+
+def old_typical() -> None:
+    # サーバが必ず読むヘッダ(ボディの長さ、Keep-Alive)と、viewが読む程度のヘッダを取得する
+    request = old_parse_request_head(HEAD)
+    for name in ("Transfer-Encoding", "Content-Length", "Connection", "Accept-Encoding", "If-None-Match"):
+        old_get_header(request, name)
+
+
+def new_typical() -> None:
+    request = parse_request_head(HEAD)
+    for name in ("Transfer-Encoding", "Content-Length", "Connection", "Accept-Encoding", "If-None-Match"):
+        request.get_header(name)
+
+
+def bench(name: str, function, number: int = 100000) -> float:
+    seconds = min(timeit.repeat(function, number=number, repeat=5))
+    per_call = seconds / number * 1e6
+    print(f"{name:<40} {per_call:8.3f} us")
+    return per_call
+
+
+if __name__ == "__main__":
+    old = bench("old: parse", lambda: parse_only(old_parse_request_head))
+    new = bench("new: parse (headers not accessed)", lambda: parse_only(parse_request_head))
+    print(f"{'':<40} {old / new:8.2f} x")
+    old = bench("old: parse + 5 header lookups", old_typical)
+    new = bench("new: parse + 5 header lookups", new_typical)
+    print(f"{'':<40} {old / new:8.2f} x")
@@ -0,0 +1,117 @@
+"""
+リクエスト1つあたりのメモリ確保のベンチマーク
+1. tracemalloc: パースしたリクエストを保持したときの、1リクエストあたりのメモリブロック数とバイト数
+   __slots__を使う現在のHTTPRequestと、__dict__を持つ以前の形のクラスを比較する
+2. 一定数のリクエストを同時に処理しながらパースと破棄(またはプールへの返却)を繰り返したときの、
+   GC(世代0)の実行回数、tracemallocで計測したピークのメモリ使用量、1リクエストあたりの時間
+   RequestPoolで使い回す場合と、毎回生成する場合を比較する
+
+STEP13ディレクトリで実行する
+$ python benchmarks/request_allocations.py
+"""
+import gc
+import os
+import sys
+import time
+import tracemalloc
+from collections import deque
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from fango.http import parser
+from fango.http.reader import body_framing
+from fango.http.request import RequestPool
+from fango.http.stream import BytesBodyStream
+from parse_request import HEAD, old_parse_request_head
+
+REQUESTS = 10000
+CYCLES = 200000
+# churnで同時に処理しているリクエストの数
+INFLIGHT = 128
+
+
+class LegacyRequest:
+    """
+    以前のHTTPRequestと同じ属性を持つ、__dict__を持つクラス
+    """
+
+    def __init__(self, path="", method="", http_version="", headers=None, body=None, params=None):
+        self.path = path
+        self.method = method
+        self.http_version = http_version
+        self.headers = headers if headers is not None else {}
+        self._body = body
+        self.stream = BytesBodyStream(body or b"")
+        self.params = params if params is not None else {}
+        self._form = None
+        self._files = None
+
+
+def legacy_parse(head: bytes) -> LegacyRequest:
+    request = old_parse_request_head(head)
+    return LegacyRequest(request.path, request.method, request.http_version, request.headers)
+
+
+def new_parse(head: bytes):
+    request = parser.parse_request_head(head)
+    # サーバは必ずボディの長さを調べるので、ヘッダも解析される
+    body_framing(request)
+    return request
+
+
+def footprint(name: str, parse) -> None:
+    gc.collect()
+    tracemalloc.start()
+    before = tracemalloc.take_snapshot()
+    requests = [parse(HEAD) for _ in range(REQUESTS)]
+    after = tracemalloc.take_snapshot()
+    tracemalloc.stop()
+
+    stats = after.compare_to(before, "filename")
+    blocks = sum(stat.count_diff for stat in stats)
+    size = sum(stat.size_diff for stat in stats)
+    print(f"{name:<32} {blocks / REQUESTS:8.1f} blocks {size / REQUESTS:10.1f} bytes / request")
+    del requests
+
+
+def churn(name: str, pool: RequestPool = None) -> None:
+    """
+    INFLIGHT個のリクエストを同時に処理している状態で、パースと破棄(またはプールへの返却)を繰り返す
+    """
+    collections = [0]
+
+    def count(phase, info):
+        if phase == "start" and info["generation"] == 0:
+            collections[0] += 1
+
+    inflight = deque()
+    gc.collect()
+    gc.callbacks.append(count)
+    tracemalloc.start()
+    started = time.perf_counter()
+    for _ in range(CYCLES):
+        request = parser.parse_request_head(HEAD, pool.acquire() if pool else None)
+        body_framing(request)
+        request.params["user_id"] = 3
+        inflight.append(request)
+        if len(inflight) > INFLIGHT:
+            finished = inflight.popleft()
+            if pool:
+                pool.release(finished)
+    elapsed = time.perf_counter() - started
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    gc.callbacks.remove(count)
+    print(
+        f"{name:<32} {collections[0]:8d} gen0 GCs / {CYCLES} requests, "
+        f"peak {peak / 1024:8.1f} KiB, {elapsed / CYCLES * 1e6:6.2f} us / request (tracemalloc有効)"
+    )
+
+
+if __name__ == "__main__":
+    print("== 1リクエストあたりのメモリ")
+    footprint("legacy (__dict__, dict headers)", legacy_parse)
+    footprint("current (__slots__, Headers)", new_parse)
+    print("== パースと破棄の繰り返し")
+    churn("new object per request")
+    churn("RequestPool", RequestPool(256))
@@ -0,0 +1,71 @@
+"""
+レスポンスラインとヘッダの組み立てのマイクロベンチマーク
+以前の実装(文字列を+=で連結し、毎回datetimeで日時を文字列にしてからまとめてエンコードする)と、
+HTTPHandler.build_response_headの実装を比較する
+
+STEP13ディレクトリで実行する
+$ python benchmarks/response_head.py
+"""
+import os
+import sys
+import timeit
+from datetime import datetime
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from fango.http.mime import guess_content_type
+from fango.http.request import HTTPRequest
+from fango.http.response import HTTPResponse
+from fango.server.handler import HTTPHandler
+
+handler = HTTPHandler()
+request = HTTPRequest(method="GET", path="/user/3/profile")
+response = HTTPResponse(body=b"<html><body>profile</body></html>", content_type="text/html; charset=UTF-8")
+# 静的ファイルのレスポンスと同じ程度のヘッダ
+static_response = HTTPResponse(body=b"body { margin: 0; }", content_type="text/css", headers={
+    "ETag": "\"5f3c-1a2b3c\"",
+    "Last-Modified": "Sat, 17 Oct 2026 10:00:00 GMT",
+    "Accept-Ranges": "bytes",
+    "Cache-Control": "max-age=3600",
+})
+
+
+def old_build_response_head(response: HTTPResponse, request: HTTPRequest, keep_alive: bool, remaining_requests: int) -> bytes:
+    """
+    以前のbuild_response_line + build_response_header
+    """
+    status_line = HTTPHandler.STATUS_LINES[response.status_code]
+    response_line = f"HTTP/1.1 {status_line}\r\n"
+    if response.content_type is None:
+        response.content_type = guess_content_type(request.path)
+
+    response_header = ""
+    response_header += f"Date: {datetime.utcnow().strftime('%a, %d %b %Y %H:%M:%S GMT')}\r\n"
+    response_header += "Host: FunaServer/0.1\r\n"
+    if response.status_code not in (204, 304):
+        if response.content_length is not None:
+            response_header += f"Content-Length: {response.content_length}\r\n"
+    if keep_alive:
+        response_header += "Connection: keep-alive\r\n"
+        response_header += f"Keep-Alive: timeout=5, max={remaining_requests}\r\n"
+    else:
+        response_header += "Connection: close\r\n"
+    if response.status_code not in (204, 304):
+        response_header += f"Content-Type: {response.content_type}\r\n"
+    for key, value in response.headers.items():
+        response_header += f"{key}: {value}\r\n"
+    return (response_line + response_header + "\r\n").encode()
+
+
+def bench(name: str, function, number: int = 200000) -> float:
+    seconds = min(timeit.repeat(function, number=number, repeat=5))
+    per_call = seconds / number * 1e6
+    print(f"{name:<40} {per_call:8.3f} us")
+    return per_call
+
+
+if __name__ == "__main__":
+    for label, target in (("view", response), ("static", static_response)):
+        old = bench(f"old: {label}", lambda: old_build_response_head(target, request, True, 99))
+        new = bench(f"new: {label}", lambda: handler.build_response_head(target, request, True, 99))
+        print(f"{'':<40} {old / new:8.2f} x")
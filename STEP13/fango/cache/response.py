@@ -0,0 +1,310 @@
+import asyncio
+import functools
+import inspect
+import threading
+import time
+from collections import OrderedDict
+from typing import Awaitable, Callable, Dict, Iterable, List, Optional, Tuple
+
+import settings
+from fango.http.request import HTTPRequest
+from fango.http.response import HTTPResponse
+
+View = Callable[[HTTPRequest], HTTPResponse]
+AsyncView = Callable[[HTTPRequest], Awaitable[HTTPResponse]]
+
+# キャッシュに保持するレスポンスの合計サイズのデフォルトの上限(バイト)
+DEFAULT_MAX_BYTES = 16 * 1024 * 1024
+# 同じキーのviewの実行が終わるのを待つデフォルトの最大時間(秒)
+DEFAULT_WAIT_TIMEOUT = 10.0
+
+# キャッシュから返すメソッド(それ以外のメソッドは毎回viewを呼び出す)
+CACHEABLE_METHODS = ("GET", "HEAD")
+# Cache-Controlにこれらが含まれるレスポンスは、他のクライアントに返してはいけないのでキャッシュしない
+PRIVATE_DIRECTIVES = ("private", "no-store")
+
+# キャッシュのキー: (viewごとの番号, path, パラメータ, Varyに指定したヘッダの値)
+CacheKey = Tuple[int, str, tuple, tuple]
+
+
+class CachedResponse:
+    """
+    キャッシュしたレスポンス
+    ボディはエンコード済みのbytesで持ち、キャッシュから返すたびに同じオブジェクトを使い回す
+    """
+    __slots__ = ("status_code", "content_type", "headers", "body", "expires")
+
+    def __init__(self, response: HTTPResponse, body: bytes, expires: float):
+        self.status_code = response.status_code
+        self.content_type = response.content_type
+        self.headers = dict(response.headers)
+        self.body = body
+        self.expires = expires
+
+    def to_response(self) -> HTTPResponse:
+        # ミドルウェアがヘッダを書き換えても、キャッシュしたヘッダに影響しないように複製する
+        return HTTPResponse(
+            status_code=self.status_code, content_type=self.content_type, body=self.body, headers=dict(self.headers),
+        )
+
+
+class Flight:
+    """
+    キャッシュにないレスポンスを生成している最中のview呼び出し
+    同じキーのリクエストはviewを呼ばずに、この呼び出しが終わるのを待って結果を使う
+    """
+    __slots__ = ("done", "response", "waiters")
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.response: Optional[CachedResponse] = None
+        # async defのviewで待っているリクエストのFuture
+        # スレッドのサーバではリクエストごとに別のイベントループで実行するので、それぞれのループに通知する
+        self.waiters: List[asyncio.Future] = []
+
+    def finish(self) -> None:
+        """
+        待っているリクエストに呼び出しが終わったことを通知する
+        ResponseCache.flightsから取り除いた後に呼び出す(それ以降はwaitersに追加されない)
+        """
+        self.done.set()
+        for waiter in self.waiters:
+            try:
+                waiter.get_loop().call_soon_threadsafe(wake_waiter, waiter)
+            except RuntimeError:
+                # 待っていたイベントループが既に終了している
+                pass
+
+
+def wake_waiter(waiter: asyncio.Future) -> None:
+    # 待つのをやめた(タイムアウトした)Futureには結果を設定できない
+    if not waiter.done():
+        waiter.set_result(None)
+
+
+class ResponseCache:
+    """
+    viewが返したレスポンスのLRUキャッシュ
+    保持するボディの合計サイズがmax_bytesを超えた場合は、最も長く使われていないものから破棄する
+    有効期限を過ぎたエントリは、次に取得しようとしたときに破棄する
+    """
+
+    def __init__(self, max_bytes: int, wait_timeout: float = DEFAULT_WAIT_TIMEOUT):
+        self.max_bytes = max_bytes
+        # 同じキーのviewの実行が終わるのを待つ最大時間(秒)
+        # 最初のリクエストのviewが終わらない場合でも、待っているリクエストが止まり続けないようにする
+        self.wait_timeout = wait_timeout
+        self.lock = threading.Lock()
+        self.entries: "OrderedDict[CacheKey, CachedResponse]" = OrderedDict()
+        self.total_bytes = 0
+        # viewを実行している最中のキー
+        self.flights: Dict[CacheKey, Flight] = {}
+
+    def get_or_call(self, key: CacheKey, ttl: float, view: View, request: HTTPRequest) -> HTTPResponse:
+        """
+        キャッシュにあるレスポンスを返す
+        ない場合はviewを呼び出し、キャッシュできるレスポンスであればキャッシュする
+        同じキーのviewを実行している最中であれば、viewを呼ばずにその結果を待つ
+        """
+        with self.lock:
+            cached = self.lookup(key)
+            if cached is not None:
+                return cached
+
+            flight = self.flights.get(key)
+            is_leader = flight is None
+            if is_leader:
+                flight = self.flights[key] = Flight()
+
+        if not is_leader:
+            if flight.done.wait(self.wait_timeout) and flight.response is not None:
+                return flight.response.to_response()
+            # キャッシュできないレスポンスだった(または例外が発生した、時間内に終わらなかった)場合は、
+            # それぞれでviewを呼び出す
+            return view(request)
+
+        try:
+            return self.store(key, ttl, view(request), flight)
+        finally:
+            self.finish(key, flight)
+
+    async def get_or_call_async(self, key: CacheKey, ttl: float, view: AsyncView, request: HTTPRequest) -> HTTPResponse:
+        """
+        async defのview用のget_or_call
+        同じキーのviewを実行している最中であれば、イベントループを止めずにその結果を待つ
+        """
+        with self.lock:
+            cached = self.lookup(key)
+            if cached is not None:
+                return cached
+
+            flight = self.flights.get(key)
+            is_leader = flight is None
+            if is_leader:
+                flight = self.flights[key] = Flight()
+            else:
+                waiter = asyncio.get_running_loop().create_future()
+                flight.waiters.append(waiter)
+
+        if not is_leader:
+            try:
+                await asyncio.wait_for(waiter, self.wait_timeout)
+            except asyncio.TimeoutError:
+                pass
+            if flight.response is not None:
+                return flight.response.to_response()
+            return await view(request)
+
+        try:
+            return self.store(key, ttl, await view(request), flight)
+        finally:
+            self.finish(key, flight)
+
+    def lookup(self, key: CacheKey) -> Optional[HTTPResponse]:
+        """
+        有効期限内のエントリがあればレスポンスを返す
+        self.lockを取得した状態で呼び出す
+        """
+        entry = self.entries.get(key)
+        if entry is None:
+            return None
+        if entry.expires > time.monotonic():
+            self.entries.move_to_end(key)
+            return entry.to_response()
+        self.remove(key)
+        return None
+
+    def store(self, key: CacheKey, ttl: float, response: HTTPResponse, flight: Flight) -> HTTPResponse:
+        """
+        viewのレスポンスがキャッシュできるものであればキャッシュし、待っているリクエストにも渡す
+        """
+        entry = self.make_entry(response, ttl)
+        if entry is None:
+            return response
+        self.set(key, entry)
+        flight.response = entry
+        return entry.to_response()
+
+    def finish(self, key: CacheKey, flight: Flight) -> None:
+        with self.lock:
+            del self.flights[key]
+        flight.finish()
+
+    @staticmethod
+    def make_entry(response: HTTPResponse, ttl: float) -> Optional[CachedResponse]:
+        """
+        キャッシュするエントリを生成する
+        200以外のレスポンスや、ボディをイテレータやファイルから送信するレスポンスはキャッシュしない
+        Set-Cookieを含むレスポンスや、Cache-Controlでprivate・no-storeが指定されたレスポンスは
+        そのクライアントだけに向けたものなのでキャッシュしない
+        """
+        if response.status_code != 200 or response.is_streaming or type(response) is not HTTPResponse:
+            return None
+        if response.find_header("Set-Cookie") is not None:
+            return None
+        cache_control = response.find_header("Cache-Control")
+        if cache_control is not None:
+            values = response.headers[cache_control]
+            directives = {
+                directive.strip().split("=", 1)[0].lower()
+                for value in (values if isinstance(values, list) else [values])
+                for directive in str(value).split(",")
+            }
+            if any(directive in directives for directive in PRIVATE_DIRECTIVES):
+                return None
+        body = response.body
+        if isinstance(body, str):
+            body = body.encode()
+        return CachedResponse(response, bytes(body), time.monotonic() + ttl)
+
+    def set(self, key: CacheKey, entry: CachedResponse) -> None:
+        if len(entry.body) > self.max_bytes:
+            return
+
+        with self.lock:
+            self.remove(key)
+            self.entries[key] = entry
+            self.total_bytes += len(entry.body)
+
+            # 上限を超えた分を古いものから破棄する
+            while self.total_bytes > self.max_bytes:
+                _, evicted = self.entries.popitem(last=False)
+                self.total_bytes -= len(evicted.body)
+
+    def remove(self, key: CacheKey) -> None:
+        # self.lockを取得した状態で呼び出す
+        entry = self.entries.pop(key, None)
+        if entry is not None:
+            self.total_bytes -= len(entry.body)
+
+    def clear(self) -> None:
+        with self.lock:
+            self.entries.clear()
+            self.total_bytes = 0
+
+
+response_cache = ResponseCache(
+    getattr(settings, "RESPONSE_CACHE_MAX_BYTES", DEFAULT_MAX_BYTES),
+    getattr(settings, "RESPONSE_CACHE_WAIT_TIMEOUT", DEFAULT_WAIT_TIMEOUT),
+)
+
+# cache_pageを適用したviewごとに振る番号(キーが他のviewと衝突しないようにする)
+_view_ids = iter(range(1 << 62))
+
+
+def cache_page(ttl: float, vary: Iterable[str] = ()) -> Callable[[View], View]:
+    """
+    viewのレスポンスをttl秒間キャッシュするデコレータ
+    キャッシュのキーはpath(クエリ文字列を含む)、URLのパラメータ、varyに指定したリクエストヘッダの値とする
+    キャッシュを使うのはGETとHEAD(GETと同じキャッシュを使う)だけで、POSTなどは毎回viewを呼び出す
+    ex) URLPattern("/user/<int:user_id>/profile", cache_page(60)(views.user_profile))
+
+    varyに指定したヘッダはレスポンスのVaryにも追加する
+    同じキーのリクエストが同時に届いた場合、viewを実行するのは最初の1つだけで、残りはその結果を待つ
+    async defのviewに適用した場合はasync defのviewを返す
+    """
+    vary = tuple(vary)
+
+    def add_vary(response: HTTPResponse) -> HTTPResponse:
+        if vary and response.status_code == 200:
+            values = [response.headers["Vary"]] if "Vary" in response.headers else []
+            response.headers["Vary"] = ", ".join(values + list(vary))
+        return response
+
+    def decorator(view: View) -> View:
+        view_id = next(_view_ids)
+
+        def make_key(request: HTTPRequest) -> CacheKey:
+            # HEADはGETのviewを実行するのでGETと同じレスポンスになる
+            return (
+                view_id,
+                request.path,
+                tuple(sorted(request.params.items())),
+                tuple(request.get_header(name) for name in vary),
+            )
+
+        if inspect.iscoroutinefunction(view):
+            @functools.wraps(view)
+            async def async_wrapper(request: HTTPRequest) -> HTTPResponse:
+                if request.method not in CACHEABLE_METHODS:
+                    return await async_cached_view(request)
+                return await response_cache.get_or_call_async(make_key(request), ttl, async_cached_view, request)
+
+            async def async_cached_view(request: HTTPRequest) -> HTTPResponse:
+                return add_vary(await view(request))
+
+            return async_wrapper
+
+        @functools.wraps(view)
+        def wrapper(request: HTTPRequest) -> HTTPResponse:
+            if request.method not in CACHEABLE_METHODS:
+                # 状態を変更するメソッドのレスポンスは、キャッシュから返さずキャッシュもしない
+                return cached_view(request)
+            return response_cache.get_or_call(make_key(request), ttl, cached_view, request)
+
+        def cached_view(request: HTTPRequest) -> HTTPResponse:
+            return add_vary(view(request))
+
+        return wrapper
+
+    return decorator
@@ -0,0 +1,290 @@
+import ctypes
+import ctypes.util
+import os
+import struct
+import sys
+import threading
+from collections import OrderedDict
+from typing import Dict, Optional
+
+import settings
+from fango.http.conditional import make_etag, make_last_modified
+from fango.http.mime import guess_content_type
+from fango.server.log import get_logger
+
+
+class CachedFile:
+    """
+    キャッシュした静的ファイルの内容と、事前に計算しておいたレスポンスヘッダ
+    """
+    __slots__ = ("path", "body", "content_type", "headers", "mtime", "mtime_ns", "size")
+
+    def __init__(self, path: str, body: bytes, stat: os.stat_result):
+        self.path = path
+        self.body = body
+        self.content_type = guess_content_type(path)
+        self.headers = {
+            "ETag": make_etag(stat),
+            "Last-Modified": make_last_modified(stat),
+            "Accept-Ranges": "bytes",
+        }
+        self.mtime = stat.st_mtime
+        self.mtime_ns = stat.st_mtime_ns
+        self.size = stat.st_size
+
+
+class StaticFileCache:
+    """
+    静的ファイルの内容をメモリに保持するLRUキャッシュ
+    保持するファイルの合計サイズがmax_bytesを超えた場合は、最も長く使われていないものから破棄する
+
+    invalidationが"mtime"の場合は、取得のたびにファイルの更新日時を確認して変更されていれば読み込み直す
+    "inotify"の場合は、inotifyでファイルの変更を監視してキャッシュを破棄するので、取得時にシステムコールを発行しない
+    inotifyが使えない環境では"mtime"として動作する
+    "inotify"の場合は存在しないファイルも覚えておき、圧縮済みの.gzファイルの有無の確認などでもシステムコールを発行しない
+    キャッシュしない大きなファイルは、"inotify"の場合はpathを覚えておき、"mtime"の場合はstatでサイズを確認して、
+    取得のたびにファイルを開かない(ファイルを開くのはレスポンスを送信するserve_fileの1回だけにする)
+    """
+
+    # 存在しないファイル・大きすぎるファイルとして覚えておくpathのそれぞれの最大数
+    MAX_MISSING_PATHS = 10000
+
+    def __init__(self, max_bytes: int, max_file_size: int, invalidation: str = "mtime"):
+        self.max_bytes = max_bytes
+        self.max_file_size = max_file_size
+        self.lock = threading.Lock()
+        self.entries: "OrderedDict[str, CachedFile]" = OrderedDict()
+        self.total_bytes = 0
+        # 存在しないファイルのpath(inotifyで監視している場合だけ使う)
+        self.missing = set()
+        # 大きすぎてキャッシュしないファイルのpath(inotifyで監視している場合だけ使う)
+        self.too_large = set()
+        # キャッシュを破棄するたびに増やす
+        # ファイルを読み込んでいる間に破棄された場合は、読み込んだ内容が古い可能性があるのでキャッシュしない
+        self.generation = 0
+
+        self.watcher: Optional[InotifyWatcher] = None
+        if invalidation == "inotify":
+            try:
+                self.watcher = InotifyWatcher(self.invalidate, self.invalidate_directory, self.clear)
+            except OSError:
+                get_logger().exception("StaticFileCache: inotifyが使えないため更新日時で変更を確認します")
+
+    def get(self, path: str) -> Optional[CachedFile]:
+        """
+        pathのファイルのキャッシュを返す
+        キャッシュにない場合は読み込んでキャッシュする
+        ファイルが大きすぎてキャッシュしない場合はNoneを返す
+        ファイルが存在しない場合はOSErrorを送出する
+        """
+        with self.lock:
+            if path in self.missing:
+                raise FileNotFoundError(path)
+            if path in self.too_large:
+                return None
+            entry = self.entries.get(path)
+            if entry is not None:
+                self.entries.move_to_end(path)
+
+        if self.watcher is not None:
+            return entry if entry is not None else self.load(path)
+
+        # ファイルが変更されていないか確認する
+        stat = os.stat(path)
+        if entry is not None:
+            if stat.st_mtime_ns == entry.mtime_ns and stat.st_size == entry.size:
+                return entry
+            self.invalidate(path)
+        if stat.st_size > self.max_file_size:
+            return None
+
+        return self.load(path)
+
+    def load(self, path: str) -> Optional[CachedFile]:
+        generation = self.generation
+        if self.watcher is not None:
+            # 読み込んでいる間の変更も検知できるように、読み込む前に監視を始める
+            self.watcher.watch(os.path.dirname(path))
+
+        try:
+            f = open(path, "rb")
+        except FileNotFoundError:
+            if self.watcher is not None:
+                with self.lock:
+                    if len(self.missing) >= self.MAX_MISSING_PATHS:
+                        self.missing.clear()
+                    if generation == self.generation:
+                        self.missing.add(path)
+            raise
+
+        with f:
+            stat = os.fstat(f.fileno())
+            if stat.st_size > self.max_file_size:
+                if self.watcher is not None:
+                    with self.lock:
+                        if len(self.too_large) >= self.MAX_MISSING_PATHS:
+                            self.too_large.clear()
+                        if generation == self.generation:
+                            self.too_large.add(path)
+                return None
+            entry = CachedFile(path, f.read(), stat)
+
+        with self.lock:
+            if generation != self.generation:
+                return entry
+
+            old_entry = self.entries.pop(path, None)
+            if old_entry is not None:
+                self.total_bytes -= old_entry.size
+            self.entries[path] = entry
+            self.total_bytes += entry.size
+
+            # 上限を超えた分を古いものから破棄する
+            while self.total_bytes > self.max_bytes and self.entries:
+                _, evicted = self.entries.popitem(last=False)
+                self.total_bytes -= evicted.size
+
+        return entry
+
+    def invalidate(self, path: str) -> None:
+        with self.lock:
+            self.generation += 1
+            self.missing.discard(path)
+            self.too_large.discard(path)
+            entry = self.entries.pop(path, None)
+            if entry is not None:
+                self.total_bytes -= entry.size
+
+    def invalidate_directory(self, directory: str) -> None:
+        prefix = os.path.join(directory, "")
+        with self.lock:
+            self.generation += 1
+            self.missing = {path for path in self.missing if not path.startswith(prefix)}
+            self.too_large = {path for path in self.too_large if not path.startswith(prefix)}
+            for path in [path for path in self.entries if path.startswith(prefix)]:
+                self.total_bytes -= self.entries.pop(path).size
+
+    def clear(self) -> None:
+        with self.lock:
+            self.generation += 1
+            self.missing.clear()
+            self.too_large.clear()
+            self.entries.clear()
+            self.total_bytes = 0
+
+
+class InotifyWatcher:
+    """
+    inotifyでディレクトリ内のファイルの変更を監視し、変更されたファイルのpathをコールバックに渡す
+    """
+
+    IN_MODIFY = 0x00000002
+    IN_ATTRIB = 0x00000004
+    IN_CLOSE_WRITE = 0x00000008
+    IN_MOVED_FROM = 0x00000040
+    IN_MOVED_TO = 0x00000080
+    IN_CREATE = 0x00000100
+    IN_DELETE = 0x00000200
+    IN_DELETE_SELF = 0x00000400
+    IN_MOVE_SELF = 0x00000800
+    IN_Q_OVERFLOW = 0x00004000
+    IN_IGNORED = 0x00008000
+
+    WATCH_MASK = (
+        IN_MODIFY | IN_ATTRIB | IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO
+        | IN_CREATE | IN_DELETE | IN_DELETE_SELF | IN_MOVE_SELF
+    )
+
+    # struct inotify_event { int wd; uint32_t mask; uint32_t cookie; uint32_t len; char name[]; }
+    EVENT_HEADER = struct.Struct("iIII")
+
+    def __init__(self, on_file_changed, on_directory_changed, on_overflow):
+        if not sys.platform.startswith("linux"):
+            raise OSError("inotify is only available on Linux")
+
+        self.libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+        self.fd = self.libc.inotify_init1(os.O_CLOEXEC)
+        if self.fd < 0:
+            errno = ctypes.get_errno()
+            raise OSError(errno, os.strerror(errno))
+
+        self.on_file_changed = on_file_changed
+        self.on_directory_changed = on_directory_changed
+        self.on_overflow = on_overflow
+        self.lock = threading.Lock()
+        # 監視ディスクリプタと監視しているディレクトリの対応
+        self.directories: Dict[int, str] = {}
+        self.watched = set()
+
+        threading.Thread(target=self.run, daemon=True).start()
+
+    def watch(self, directory: str) -> None:
+        if directory in self.watched:
+            return
+
+        with self.lock:
+            if directory in self.watched:
+                return
+            wd = self.libc.inotify_add_watch(self.fd, os.fsencode(directory), self.WATCH_MASK)
+            if wd < 0:
+                errno = ctypes.get_errno()
+                raise OSError(errno, os.strerror(errno), directory)
+            self.directories[wd] = directory
+            self.watched.add(directory)
+
+    def run(self) -> None:
+        while True:
+            data = os.read(self.fd, 65536)
+            position = 0
+            while position < len(data):
+                wd, mask, _, name_length = self.EVENT_HEADER.unpack_from(data, position)
+                position += self.EVENT_HEADER.size
+                name = data[position:position + name_length].rstrip(b"\0")
+                position += name_length
+                self.dispatch(wd, mask, os.fsdecode(name))
+
+    def dispatch(self, wd: int, mask: int, name: str) -> None:
+        if mask & self.IN_Q_OVERFLOW:
+            # イベントを取りこぼしたので全て破棄する
+            self.on_overflow()
+            return
+
+        directory = self.directories.get(wd)
+        if directory is None:
+            return
+
+        if mask & (self.IN_IGNORED | self.IN_DELETE_SELF | self.IN_MOVE_SELF):
+            # ディレクトリ自体が削除・移動されたので、次に読み込むときに監視し直す
+            with self.lock:
+                if mask & self.IN_IGNORED:
+                    self.directories.pop(wd, None)
+                self.watched.discard(directory)
+            self.on_directory_changed(directory)
+        elif name:
+            self.on_file_changed(os.path.join(directory, name))
+
+
+# プロセスごとに1つのキャッシュを使う
+# forkした子プロセスで監視スレッドが動くように、最初に使われたときに生成する
+_static_cache: Optional[StaticFileCache] = None
+_static_cache_lock = threading.Lock()
+
+
+def get_static_cache() -> Optional[StaticFileCache]:
+    """
+    静的ファイルのキャッシュを返す
+    STATIC_CACHE_ENABLEDがFalseの場合はNoneを返す
+    """
+    global _static_cache
+    if not getattr(settings, "STATIC_CACHE_ENABLED", False):
+        return None
+
+    if _static_cache is None:
+        with _static_cache_lock:
+            if _static_cache is None:
+                _static_cache = StaticFileCache(
+                    max_bytes=getattr(settings, "STATIC_CACHE_MAX_BYTES", 64 * 1024 * 1024),
+                    max_file_size=getattr(settings, "STATIC_CACHE_MAX_FILE_SIZE", 1024 * 1024),
+                    invalidation=getattr(settings, "STATIC_CACHE_INVALIDATION", "mtime"),
+                )
+    return _static_cache
@@ -0,0 +1,66 @@
+import os
+from email.utils import formatdate, parsedate_to_datetime
+from typing import Optional
+
+from fango.http.request import HTTPRequest
+
+
+def make_etag(stat: os.stat_result) -> str:
+    """
+    ファイルのサイズと更新日時から強いETagを生成する
+    """
+    return f'"{stat.st_size:x}-{stat.st_mtime_ns:x}"'
+
+
+def make_last_modified(stat: os.stat_result) -> str:
+    """
+    ファイルの更新日時からLast-Modifiedの値を生成する
+    """
+    return formatdate(stat.st_mtime, usegmt=True)
+
+
+def etag_matches(if_none_match: str, etag: str) -> bool:
+    """
+    If-None-Matchに指定されたETagのどれかがetagと一致するか判定する
+    If-None-Matchは弱い比較なので、W/の有無は無視する
+    """
+    if if_none_match.strip() == "*":
+        return True
+
+    etag = etag.removeprefix("W/")
+    for candidate in if_none_match.split(","):
+        if candidate.strip().removeprefix("W/") == etag:
+            return True
+    return False
+
+
+def parse_http_date(value: str) -> Optional[float]:
+    """
+    HTTPの日付をUNIX時間に変換する
+    解釈できない場合はNoneを返す
+    """
+    try:
+        return parsedate_to_datetime(value).timestamp()
+    except (TypeError, ValueError, IndexError):
+        return None
+
+
+def is_not_modified(request: HTTPRequest, etag: str, mtime: float) -> bool:
+    """
+    条件付きGETで、クライアントが持っているキャッシュがまだ有効(304を返せる)か判定する
+    If-None-Matchが指定されている場合はそちらを優先し、If-Modified-Sinceは無視する
+    """
+    if request.method not in ("GET", "HEAD"):
+        return False
+
+    if_none_match = request.get_header("If-None-Match")
+    if if_none_match is not None:
+        return etag_matches(if_none_match, etag)
+
+    if_modified_since = request.get_header("If-Modified-Since")
+    if if_modified_since is not None:
+        since = parse_http_date(if_modified_since)
+        # Last-Modifiedは秒単位なので、秒未満を切り捨てて比較する
+        return since is not None and int(mtime) <= since
+
+    return False
@@ -0,0 +1,9 @@
+class HTTPError(Exception):
+    """
+    リクエストが不正な場合などに、指定したステータスコードのレスポンスを返して処理を打ち切るための例外
+    """
+    status_code: int
+
+    def __init__(self, status_code: int, message: str = ""):
+        super().__init__(message or str(status_code))
+        self.status_code = status_code
@@ -0,0 +1,155 @@
+from collections.abc import MutableMapping
+from typing import Dict, Iterator, List, Mapping, Optional, Tuple, Union
+
+from fango.http.errors import HTTPError
+
+
+class Headers(MutableMapping):
+    """
+    ヘッダ名の大文字小文字を区別しない、同じ名前の値を複数持てるヘッダ
+    受信したヘッダのバイト列(raw)をそのまま保持しておき、最初にヘッダにアクセスしたときに解析する
+    同じ名前のヘッダが複数ある場合、headers[name]は値を", "で連結したもの、get_all(name)は値のリストを返す
+
+    リクエストごとに生成されるので、解析結果は小文字のヘッダ名と値だけを持つ
+    元の表記のヘッダ名は、ヘッダ名を列挙するときにrawから取り出す
+    """
+    __slots__ = ("raw", "offset", "_values", "_names")
+
+    def __init__(self, raw: bytes = b"", offset: int = 0, headers: Mapping[str, str] = None):
+        """
+        rawのoffset以降が、リクエストラインの次の行から空行までのヘッダ
+        headersを指定した場合は、その内容をヘッダとする
+        """
+        self.reset(raw, offset)
+        if headers is not None:
+            for name, value in headers.items():
+                self.add(name, value)
+
+    def reset(self, raw: bytes = b"", offset: int = 0) -> None:
+        """
+        別のリクエストのヘッダとして使い回せるように、rawを設定し直して解析結果を捨てる
+        """
+        self.raw = raw
+        self.offset = offset
+        # 小文字のヘッダ名と値(同じ名前のヘッダが複数ある場合は値のリスト)
+        self._values: Optional[Dict[str, Union[str, List[str]]]] = None
+        # add・代入で追加したヘッダの、元の表記のヘッダ名
+        self._names: Optional[Dict[str, str]] = None
+
+    def lines(self) -> List[str]:
+        # latin-1はどのバイト列もそのまま1文字ずつ対応させるので、まとめてデコードしても失敗しない
+        return self.raw[self.offset:].decode("latin-1").split("\r\n")
+
+    def parse(self) -> Dict[str, Union[str, List[str]]]:
+        """
+        rawを解析する
+        ヘッダの行が不正な場合は400とする
+        """
+        if self._values is not None:
+            return self._values
+
+        values = {}
+        for line in self.lines():
+            if not line:
+                continue
+            name, separator, value = line.partition(":")
+            # ヘッダ名と:の間に空白は入れられない
+            if not separator or not name or name[-1] in " \t":
+                raise HTTPError(400, f"invalid header: {line!r}")
+            key = name.lower()
+            value = value.strip(" \t")
+            existing = values.get(key)
+            if existing is None:
+                values[key] = value
+            elif isinstance(existing, list):
+                existing.append(value)
+            else:
+                values[key] = [existing, value]
+        self._values = values
+        return values
+
+    def get_all(self, name: str) -> List[str]:
+        """
+        nameのヘッダの値を全て返す
+        """
+        value = self.parse().get(name.lower())
+        if value is None:
+            return []
+        return list(value) if isinstance(value, list) else [value]
+
+    def add(self, name: str, value: str) -> None:
+        """
+        既に同じ名前のヘッダがあっても置き換えずに値を追加する
+        """
+        values = self.parse()
+        key = name.lower()
+        existing = values.get(key)
+        if existing is None:
+            values[key] = value
+            self.set_name(key, name)
+        elif isinstance(existing, list):
+            existing.append(value)
+        else:
+            values[key] = [existing, value]
+
+    def set_name(self, key: str, name: str) -> None:
+        if name != key:
+            if self._names is None:
+                self._names = {}
+            self._names[key] = name
+
+    def get(self, name: str, default: str = None) -> Optional[str]:
+        value = self.parse().get(name.lower())
+        if value is None:
+            return default
+        return ", ".join(value) if isinstance(value, list) else value
+
+    def __getitem__(self, name: str) -> str:
+        value = self.get(name)
+        if value is None:
+            raise KeyError(name)
+        return value
+
+    def __setitem__(self, name: str, value: str) -> None:
+        key = name.lower()
+        self.parse()[key] = value
+        self.set_name(key, name)
+
+    def __delitem__(self, name: str) -> None:
+        del self.parse()[name.lower()]
+
+    def __contains__(self, name) -> bool:
+        return isinstance(name, str) and name.lower() in self.parse()
+
+    def names(self) -> Dict[str, str]:
+        """
+        小文字のヘッダ名と元の表記のヘッダ名の対応
+        """
+        names = {}
+        for line in self.lines():
+            name = line.partition(":")[0]
+            names.setdefault(name.lower(), name)
+        if self._names is not None:
+            names.update(self._names)
+        return names
+
+    def __iter__(self) -> Iterator[str]:
+        names = self.names()
+        return iter([names.get(key, key) for key in self.parse()])
+
+    def __len__(self) -> int:
+        return len(self.parse())
+
+    def multi_items(self) -> List[Tuple[str, str]]:
+        """
+        同じ名前のヘッダを連結せずに(ヘッダ名, 値)のリストを返す
+        """
+        names = self.names()
+        return [
+            (names.get(key, key), value)
+            for key, values in self.parse().items()
+            for value in (values if isinstance(values, list) else [values])
+        ]
+
+    def __repr__(self) -> str:
+        return repr(dict(self.items()))
@@ -0,0 +1,27 @@
+import settings
+
+# リクエストヘッダの最大サイズ(リクエストラインを含む)
+DEFAULT_MAX_HEADER_SIZE = 65536
+# メモリに読み込むリクエストボディの最大サイズ
+DEFAULT_MAX_BODY_SIZE = 10 * 1024 * 1024
+# ストリームで少しずつ読み込むリクエストボディの最大サイズ
+DEFAULT_MAX_STREAMED_BODY_SIZE = 1024 * 1024 * 1024
+
+
+def max_header_size() -> int:
+    return getattr(settings, "MAX_REQUEST_HEADER_SIZE", DEFAULT_MAX_HEADER_SIZE)
+
+
+def max_body_size() -> int:
+    """
+    ボディ全体をメモリに読み込む場合(request.body、application/x-www-form-urlencodedのフォーム、
+    リクエスト全体を受信してから処理するイベントループのサーバ)の上限
+    """
+    return getattr(settings, "MAX_REQUEST_BODY_SIZE", DEFAULT_MAX_BODY_SIZE)
+
+
+def max_streamed_body_size() -> int:
+    """
+    request.streamから少しずつ読み込む場合(multipartのアップロードなど)の上限
+    """
+    return getattr(settings, "MAX_STREAMED_BODY_SIZE", DEFAULT_MAX_STREAMED_BODY_SIZE)
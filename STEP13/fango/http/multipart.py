@@ -0,0 +1,262 @@
+import re
+from tempfile import SpooledTemporaryFile
+from typing import Dict, Iterator, List, Tuple, Union
+
+import settings
+from fango.http.errors import HTTPError
+from fango.http.stream import RequestBodyStream
+
+# ファイルをメモリに保持する上限のデフォルト値(これを超えると一時ファイルに書き出す)
+DEFAULT_SPOOL_THRESHOLD = 1024 * 1024
+# ファイル以外のフィールドの値の最大サイズのデフォルト値
+DEFAULT_MAX_FIELD_SIZE = 1024 * 1024
+# パートのヘッダの最大サイズ
+MAX_PART_HEADER_SIZE = 16384
+# 1つのボディに含められるパートの最大数のデフォルト値
+DEFAULT_MAX_PARTS = 1000
+# 1つのボディのパースでメモリに保持する合計サイズの上限のデフォルト値
+DEFAULT_MAX_MEMORY = 10 * 1024 * 1024
+
+# Content-Dispositionなどのヘッダのパラメータ(name="value"またはname=value)
+PARAM_PATTERN = re.compile(r';\s*([^\s=;]+)\s*=\s*("(?:[^"\\]|\\.)*"|[^;]*)')
+
+
+def parse_header_params(value: str) -> Tuple[str, Dict[str, str]]:
+    """
+    'form-data; name="file"; filename="a.png"'のようなヘッダの値を
+    ('form-data', {'name': 'file', 'filename': 'a.png'})に分解する
+    """
+    main_value, _, params = value.partition(";")
+    result = {}
+    for key, param in PARAM_PATTERN.findall(";" + params):
+        param = param.strip()
+        if len(param) >= 2 and param[0] == param[-1] == '"':
+            param = re.sub(r"\\(.)", r"\1", param[1:-1])
+        result[key.lower()] = param
+    return main_value.strip().lower(), result
+
+
+class UploadedFile:
+    """
+    multipart/form-dataでアップロードされたファイル
+    内容は一定サイズまではメモリに、超えた分は一時ファイルに保持する
+    """
+
+    def __init__(self, name: str, filename: str, content_type: str, spool_threshold: int):
+        self.name = name
+        self.filename = filename
+        self.content_type = content_type
+        self.size = 0
+        self.file = SpooledTemporaryFile(max_size=spool_threshold)
+
+    def write(self, data: bytes) -> None:
+        self.file.write(data)
+        self.size += len(data)
+
+    def read(self, size: int = -1) -> bytes:
+        return self.file.read(size)
+
+    def seek(self, offset: int) -> None:
+        self.file.seek(offset)
+
+    def close(self) -> None:
+        # 一時ファイルはcloseしたときに削除される
+        self.file.close()
+
+    def __repr__(self) -> str:
+        return f"<UploadedFile name={self.name!r} filename={self.filename!r} size={self.size}>"
+
+
+class MultipartField:
+    """
+    multipart/form-dataのファイル以外のフィールド
+    """
+
+    def __init__(self, name: str, charset: str):
+        self.name = name
+        self.charset = charset
+        self.data = bytearray()
+
+    def write(self, data: bytes) -> None:
+        self.data += data
+        if len(self.data) > getattr(settings, "MULTIPART_MAX_FIELD_SIZE", DEFAULT_MAX_FIELD_SIZE):
+            raise HTTPError(413, f"multipart field too large: {self.name}")
+
+    @property
+    def value(self) -> str:
+        return self.data.decode(self.charset, "replace")
+
+
+class MultipartParser:
+    """
+    multipart/form-dataのボディをストリームから少しずつ読み込みながらパースする
+    ボディ全体をメモリに載せず、ファイルの内容はUploadedFileに書き出していく
+    """
+
+    # ストリームから1回に読み込むサイズ
+    READ_SIZE = 65536
+
+    def __init__(self, stream: RequestBodyStream, boundary: str, charset: str = "utf-8", spool_threshold: int = None):
+        if not boundary:
+            raise HTTPError(400, "multipart boundary is missing")
+        if spool_threshold is None:
+            spool_threshold = getattr(settings, "MULTIPART_SPOOL_THRESHOLD", DEFAULT_SPOOL_THRESHOLD)
+
+        self.stream = stream
+        self.charset = charset
+        self.spool_threshold = spool_threshold
+        # 最初の区切りはボディの先頭にあるのでCRLFを伴わない
+        self.first_delimiter = b"--" + boundary.encode("latin-1")
+        self.delimiter = b"\r\n" + self.first_delimiter
+        self.buffer = bytearray()
+        self.eof = False
+
+        # パートの数と、フィールドの値・ファイルのメモリに保持する分の合計サイズ
+        # パートごとの上限だけでは、パートを大量に送ることでメモリを使い切れてしまう
+        self.max_parts = getattr(settings, "MULTIPART_MAX_PARTS", DEFAULT_MAX_PARTS)
+        self.max_memory = getattr(settings, "MULTIPART_MAX_MEMORY", DEFAULT_MAX_MEMORY)
+        self.part_count = 0
+        self.memory_size = 0
+
+    def fill(self) -> bool:
+        """
+        ストリームから読み込んでbufferに追加する
+        ボディの終わりに達していた場合はFalseを返す
+        """
+        if self.eof:
+            return False
+        chunk = self.stream.read1(self.READ_SIZE)
+        if not chunk:
+            self.eof = True
+            return False
+        self.buffer += chunk
+        return True
+
+    def __iter__(self) -> Iterator[Union[MultipartField, UploadedFile]]:
+        """
+        パートを1つずつパースして返す
+        ファイル以外のフィールドはMultipartField、ファイルはUploadedFileとして返す
+        """
+        # 最初の区切りまで(プリアンブル)を読み飛ばす
+        while True:
+            position = self.buffer.find(self.first_delimiter)
+            if position != -1:
+                del self.buffer[:position + len(self.first_delimiter)]
+                break
+            # 区切りが読み込みの境目をまたいでいる場合に備えて末尾を残す
+            del self.buffer[:max(0, len(self.buffer) - len(self.first_delimiter))]
+            if not self.fill():
+                raise HTTPError(400, "multipart boundary not found")
+
+        while True:
+            # 区切りの直後が"--"なら終端、CRLFなら次のパートが続く
+            while len(self.buffer) < 2:
+                if not self.fill():
+                    raise HTTPError(400, "unexpected end of multipart body")
+            if self.buffer[:2] == b"--":
+                # 終端の後ろ(エピローグ)は読み捨てる
+                self.stream.drain()
+                return
+
+            part = self.read_part_header()
+            try:
+                self.read_part_body(part)
+            except BaseException:
+                if isinstance(part, UploadedFile):
+                    part.close()
+                raise
+            if isinstance(part, UploadedFile):
+                part.seek(0)
+            yield part
+
+    def read_part_header(self) -> Union[MultipartField, UploadedFile]:
+        """
+        パートのヘッダを読み込み、内容の書き出し先を生成する
+        """
+        self.part_count += 1
+        if self.part_count > self.max_parts:
+            raise HTTPError(413, "too many multipart parts")
+
+        while True:
+            header_end = self.buffer.find(b"\r\n\r\n")
+            if header_end != -1:
+                break
+            if len(self.buffer) > MAX_PART_HEADER_SIZE:
+                raise HTTPError(400, "multipart part header too large")
+            if not self.fill():
+                raise HTTPError(400, "unexpected end of multipart body")
+
+        # 区切りの後ろのCRLFからヘッダの終わりまで
+        header_lines = bytes(self.buffer[2:header_end]).decode(self.charset, "replace").split("\r\n")
+        del self.buffer[:header_end + 4]
+
+        headers = {}
+        for line in header_lines:
+            key, _, value = line.partition(":")
+            headers[key.strip().lower()] = value.strip()
+
+        _, params = parse_header_params(headers.get("content-disposition", ""))
+        name = params.get("name", "")
+        filename = params.get("filename")
+        if filename is None:
+            return MultipartField(name, self.charset)
+
+        content_type = headers.get("content-type", "application/octet-stream")
+        return UploadedFile(name, filename, content_type, self.spool_threshold)
+
+    def read_part_body(self, part: Union[MultipartField, UploadedFile]) -> None:
+        """
+        次の区切りまでのパートの内容を書き出す
+        """
+        while True:
+            position = self.buffer.find(self.delimiter)
+            if position != -1:
+                self.write_part(part, bytes(self.buffer[:position]))
+                del self.buffer[:position + len(self.delimiter)]
+                return
+
+            # 区切りの途中までかもしれない末尾だけ残して書き出す
+            flush_size = len(self.buffer) - len(self.delimiter) + 1
+            if flush_size > 0:
+                self.write_part(part, bytes(self.buffer[:flush_size]))
+                del self.buffer[:flush_size]
+            if not self.fill():
+                raise HTTPError(400, "unexpected end of multipart body")
+
+    def write_part(self, part: Union[MultipartField, UploadedFile], data: bytes) -> None:
+        """
+        パートの内容を書き出し、メモリに保持する合計サイズが上限を超えた場合は413とする
+        ファイルはspool_thresholdを超えると一時ファイルに書き出してメモリから解放されるので、それまでの分を数える
+        """
+        if isinstance(part, UploadedFile):
+            size = part.size + len(data)
+            if size > self.spool_threshold:
+                # 一時ファイルに書き出される(既に書き出されている)
+                self.memory_size -= part.size if part.size <= self.spool_threshold else 0
+            else:
+                self.memory_size += len(data)
+        else:
+            self.memory_size += len(data)
+        if self.memory_size > self.max_memory:
+            raise HTTPError(413, "multipart body too large to hold in memory")
+        part.write(data)
+
+
+def parse_multipart(
+    stream: RequestBodyStream, content_type: str,
+) -> Tuple[Dict[str, List[str]], Dict[str, List[UploadedFile]]]:
+    """
+    multipart/form-dataのボディをパースし、(フィールドの辞書, ファイルの辞書)を返す
+    どちらも同じ名前の値が複数ある場合に備えて値はリストで持つ
+    """
+    _, params = parse_header_params(content_type)
+    parser = MultipartParser(stream, params.get("boundary", ""), params.get("charset", "utf-8"))
+
+    form: Dict[str, List[str]] = {}
+    files: Dict[str, List[UploadedFile]] = {}
+    for part in parser:
+        if isinstance(part, UploadedFile):
+            files.setdefault(part.name, []).append(part)
+        else:
+            form.setdefault(part.name, []).append(part.value)
+    return form, files
@@ -0,0 +1,40 @@
+from fango.http.errors import HTTPError
+from fango.http.request import HTTPRequest
+
+# メソッド(token)に使える文字
+TOKEN_CHARS = b"!#$%&'*+-.^_`|~0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz"
+
+
+def parse_request_head(head: bytes, request: HTTPRequest = None) -> HTTPRequest:
+    """
+    リクエストライン・ヘッダ(空行まで)のバイト列をHTTPRequestにパースする
+    正規表現やデコードはリクエストラインだけに行い、ヘッダは最初にアクセスされたときに解析する
+    リクエストラインが不正な場合は400とする
+    requestを指定した場合は、新しく生成せずにそのHTTPRequestを設定し直して返す
+    """
+    line_end = head.find(b"\r\n")
+    if line_end == -1:
+        line_end = len(head)
+
+    # リクエストラインをパースする(例 GET / HTTP/1.1)
+    method_end = head.find(b" ", 0, line_end)
+    path_end = head.find(b" ", method_end + 1, line_end)
+    if method_end <= 0 or path_end == -1 or path_end == method_end + 1 or head.find(b" ", path_end + 1, line_end) != -1:
+        raise HTTPError(400, f"invalid request line: {head[:line_end]!r}")
+
+    method = head[:method_end]
+    http_version = head[path_end + 1:line_end]
+    # メソッドにtoken以外の文字が含まれていないか
+    if method.translate(None, TOKEN_CHARS) or not (http_version.startswith(b"HTTP/") and len(http_version) == 8):
+        raise HTTPError(400, f"invalid request line: {head[:line_end]!r}")
+    try:
+        path = head[method_end + 1:path_end].decode()
+    except UnicodeDecodeError:
+        raise HTTPError(400, f"invalid request line: {head[:line_end]!r}")
+
+    if request is None:
+        request = HTTPRequest()
+    request.reset(method=method.decode("ascii"), path=path, http_version=http_version.decode("ascii"), raw_head=head)
+    # ヘッダはコピーせずに受信したバイト列を参照しておき、アクセスされたときに解析する
+    request.headers.reset(head, line_end + 2)
+    return request
@@ -0,0 +1,87 @@
+from typing import List, Optional, Tuple
+
+from fango.http.conditional import parse_http_date
+from fango.http.request import HTTPRequest
+
+# 1つのリクエストで指定できる範囲の最大数
+# これを超える場合は小さな範囲を大量に指定する攻撃とみなし、Rangeを無視してファイル全体を返す
+MAX_RANGES = 16
+
+
+def parse_range(value: str, size: int) -> Optional[List[Tuple[int, int]]]:
+    """
+    Rangeヘッダ(例 bytes=0-99,200-,-50)を、サイズがsizeのファイルの(先頭, 末尾)のリストに変換する
+    末尾はその位置を含む
+    書式が不正な場合などRangeを無視してファイル全体を返すべき場合はNoneを、
+    満たせる範囲が1つもない(416を返すべき)場合は空のリストを返す
+    重なっている範囲や隣接している範囲は1つにまとめる
+    """
+    unit, _, range_set = value.partition("=")
+    if unit.strip().lower() != "bytes":
+        return None
+
+    ranges = []
+    specs = range_set.split(",")
+    if len(specs) > MAX_RANGES:
+        return None
+
+    for spec in specs:
+        first, dash, last = spec.strip().partition("-")
+        if not dash:
+            return None
+        try:
+            if first:
+                # bytes=start- または bytes=start-end
+                start = int(first)
+                end = int(last) if last else start
+                if start < 0 or end < start:
+                    return None
+                if not last:
+                    end = size - 1
+            else:
+                # bytes=-suffix_length(末尾からsuffix_lengthバイト)
+                suffix_length = int(last)
+                if suffix_length < 0:
+                    return None
+                if suffix_length == 0:
+                    continue
+                start = max(size - suffix_length, 0)
+                end = size - 1
+        except ValueError:
+            return None
+
+        if start >= size:
+            # ファイルの外を指している範囲は満たせないので除く
+            continue
+        ranges.append((start, min(end, size - 1)))
+
+    if len(ranges) <= 1:
+        return ranges
+
+    ranges.sort()
+    merged = [ranges[0]]
+    for start, end in ranges[1:]:
+        last_start, last_end = merged[-1]
+        if start <= last_end + 1:
+            merged[-1] = (last_start, max(last_end, end))
+        else:
+            merged.append((start, end))
+    return merged
+
+
+def if_range_matches(request: HTTPRequest, etag: str, mtime: float) -> bool:
+    """
+    If-Rangeが指定されていない、またはファイルが変更されていない場合にTrueを返す
+    Falseの場合はRangeを無視してファイル全体を返す
+    """
+    if_range = request.get_header("If-Range")
+    if if_range is None:
+        return True
+
+    if_range = if_range.strip()
+    if if_range.startswith('"') or if_range.startswith("W/"):
+        # ETagの場合は強い比較で一致する必要がある
+        return if_range == etag and not etag.startswith("W/")
+
+    since = parse_http_date(if_range)
+    return since is not None and int(mtime) == since
@@ -0,0 +1,387 @@
+import asyncio
+from socket import socket
+from typing import Optional, Tuple
+
+from fango.http.errors import HTTPError
+from fango.http.limits import max_body_size, max_header_size, max_streamed_body_size
+from fango.http.request import HTTPRequest
+from fango.http.stream import RequestBodyStream
+
+
+def body_framing(request: HTTPRequest, max_size: int = None) -> Tuple[int, bool]:
+    """
+    リクエストヘッダからボディの長さの決め方を取得する
+    (Content-Lengthの値, chunkedかどうか)を返す
+    Transfer-Encoding: chunkedが指定されている場合はContent-Lengthより優先する
+    Content-Lengthがmax_size(省略した場合はストリームで読み込むボディの上限)を超える場合は413とする
+    """
+    transfer_encoding = request.headers.get("Transfer-Encoding")
+    if transfer_encoding is not None:
+        codings = [coding.strip().lower() for coding in transfer_encoding.split(",")]
+        if codings[-1] != "chunked":
+            # chunked以外の転送エンコーディングには対応しない
+            raise HTTPError(400, f"unsupported Transfer-Encoding: {transfer_encoding}")
+        return 0, True
+
+    content_lengths = set(request.headers.get_all("Content-Length"))
+    if len(content_lengths) > 1:
+        # 値の異なるContent-Lengthが複数ある場合は、どれを信じるかで解釈がずれるので受け付けない
+        raise HTTPError(400, f"conflicting Content-Length: {sorted(content_lengths)}")
+    content_length = 0
+    for value in content_lengths:
+        if not (value.isascii() and value.isdigit()):
+            raise HTTPError(400, f"invalid Content-Length: {value}")
+        content_length = int(value)
+
+    if content_length > (max_streamed_body_size() if max_size is None else max_size):
+        raise HTTPError(413, f"Content-Length too large: {content_length}")
+    return content_length, False
+
+
+def parse_chunk_size(line: bytes) -> int:
+    """
+    chunkedのチャンクサイズの行(拡張を含む)からチャンクサイズを取得する
+    """
+    size, _, _ = line.partition(b";")
+    try:
+        return int(size.strip(), 16)
+    except ValueError:
+        raise HTTPError(400, f"invalid chunk size: {size!r}")
+
+
+def find_chunked_end(buffer, start: int, max_size: int) -> Optional[int]:
+    """
+    bufferのstart以降にchunkedのボディが全て届いているか判定する
+    届いている場合はボディの終端の位置を返し、まだ届いていない場合はNoneを返す
+    ボディがmax_sizeを超える場合は413とする
+    """
+    position = start
+    body_size = 0
+    while True:
+        line_end = buffer.find(b"\r\n", position)
+        if line_end == -1:
+            return None
+        chunk_size = parse_chunk_size(bytes(buffer[position:line_end]))
+        position = line_end + 2
+
+        if chunk_size == 0:
+            # 最後のチャンクの後はトレーラーが空行まで続く
+            while True:
+                line_end = buffer.find(b"\r\n", position)
+                if line_end == -1:
+                    return None
+                if line_end == position:
+                    return line_end + 2
+                position = line_end + 2
+
+        body_size += chunk_size
+        if body_size > max_size:
+            raise HTTPError(413, "chunked body too large")
+        position += chunk_size + 2
+        if position > len(buffer):
+            return None
+
+
+def decode_chunked(data: bytes) -> bytes:
+    """
+    全て届いているchunkedのボディをデコードする
+    """
+    chunks = []
+    position = 0
+    while True:
+        line_end = data.index(b"\r\n", position)
+        chunk_size = parse_chunk_size(data[position:line_end])
+        position = line_end + 2
+        if chunk_size == 0:
+            return b"".join(chunks)
+        chunks.append(data[position:position + chunk_size])
+        position += chunk_size + 2
+
+
+def find_request_end(buffer, parse_head, max_body: int = None) -> Optional[int]:
+    """
+    bufferにリクエストが1つ分全て届いているか判定する
+    届いている場合はリクエストの終端の位置を返し、まだ届いていない場合はNoneを返す
+    parse_headはリクエストライン・ヘッダのバイト列をHTTPRequestに変換する関数
+    max_bodyはボディの最大サイズで、省略した場合はリクエスト全体をメモリに受信するものとしてmax_body_sizeとする
+    """
+    if max_body is None:
+        max_body = max_body_size()
+    header_end = buffer.find(b"\r\n\r\n")
+    if header_end == -1:
+        if len(buffer) > max_header_size():
+            raise HTTPError(431, "request header too large")
+        return None
+    if header_end > max_header_size():
+        raise HTTPError(431, "request header too large")
+
+    body_start = header_end + 4
+    content_length, chunked = body_framing(parse_head(bytes(buffer[:body_start])), max_body)
+    if chunked:
+        return find_chunked_end(buffer, body_start, max_body)
+
+    request_end = body_start + content_length
+    if len(buffer) < request_end:
+        return None
+    return request_end
+
+
+class RequestReader:
+    """
+    ブロッキングモードのsocketからリクエストを読み込むバッファ付きのリーダー
+    受信したデータは1つのbytearrayにrecv_intoで直接書き込み、bytesの連結を繰り返さない
+    1回のrecvで次のリクエストの一部まで受信した場合は、そのまま次のリクエストとして読み込める
+    """
+
+    # 1回のrecv_intoで受信できるように最低限空けておく領域のサイズ
+    RECV_SIZE = 65536
+
+    def __init__(self, client_socket: socket):
+        self.client_socket = client_socket
+        self.buffer = bytearray(self.RECV_SIZE)
+        # bufferのうち、まだ読み込まれていないデータの範囲
+        self.start = 0
+        self.end = 0
+
+    def has_complete_request(self, parse_head) -> bool:
+        """
+        受信済みのデータに次のリクエストが1つ分全て届いているか判定する
+        parse_headはリクエストライン・ヘッダのバイト列をHTTPRequestに変換する関数
+        届いていないボディはストリームで読み込むので、ボディの上限はストリームの上限とする
+        """
+        if self.buffer.find(b"\r\n\r\n", self.start, self.end) == -1:
+            return False
+        return find_request_end(self.buffer[self.start:self.end], parse_head, max_streamed_body_size()) is not None
+
+    def fill(self) -> int:
+        """
+        socketから受信してbufferの末尾に追加し、受信したバイト数を返す
+        クライアントが接続を閉じた場合は0を返す
+        """
+        if len(self.buffer) - self.end < self.RECV_SIZE:
+            if self.start > 0:
+                # 読み込み済みの領域を詰めて空きを作る
+                remaining = self.end - self.start
+                self.buffer[:remaining] = self.buffer[self.start:self.end]
+                self.start, self.end = 0, remaining
+            if len(self.buffer) - self.end < self.RECV_SIZE:
+                # それでも足りない場合はbufferを拡張する
+                self.buffer.extend(bytes(max(len(self.buffer), self.RECV_SIZE)))
+
+        with memoryview(self.buffer) as view:
+            received = self.client_socket.recv_into(view[self.end:])
+        self.end += received
+        return received
+
+    def consume(self, size: int) -> bytes:
+        """
+        読み込まれていないデータの先頭からsizeバイトを取り出す
+        """
+        with memoryview(self.buffer) as view:
+            data = bytes(view[self.start:self.start + size])
+        self.start += size
+        if self.start == self.end:
+            self.start = self.end = 0
+        return data
+
+    def read_head(self) -> Optional[bytes]:
+        """
+        リクエストライン・ヘッダを空行まで読み込む(空行を含む)
+        リクエストの読み込みを始める前にクライアントが接続を閉じた場合はNoneを返す
+        """
+        limit = max_header_size()
+        # 探索済みの位置(未読み込みデータの先頭からの相対位置)
+        # fillでbufferが詰められても位置がずれないように相対位置で持つ
+        searched = 0
+        while True:
+            header_end = self.buffer.find(b"\r\n\r\n", self.start + searched, self.end)
+            if header_end != -1:
+                if header_end - self.start > limit:
+                    raise HTTPError(431, "request header too large")
+                return self.consume(header_end + 4 - self.start)
+
+            if self.end - self.start > limit:
+                raise HTTPError(431, "request header too large")
+            # 空行の区切りが受信データの境目をまたいでいる場合に備えて、末尾3バイトから探し直す
+            searched = max(0, self.end - self.start - 3)
+
+            if self.fill() == 0:
+                if self.start == self.end:
+                    return None
+                raise HTTPError(400, "connection closed while reading request header")
+
+    def read_exact(self, size: int) -> bytes:
+        """
+        ちょうどsizeバイトを読み込む
+        受信済みのボディやチャンクの区切りなど、小さいデータの読み込みに使う
+        大きなボディはSocketBodyStreamで少しずつ読み込む
+        """
+        while self.end - self.start < size:
+            if self.fill() == 0:
+                raise HTTPError(400, "connection closed while reading request body")
+        return self.consume(size)
+
+    def read_line(self) -> bytes:
+        """
+        CRLFまでの1行を読み込む(CRLFは含まない)
+        """
+        searched = 0
+        while True:
+            line_end = self.buffer.find(b"\r\n", self.start + searched, self.end)
+            if line_end != -1:
+                line = self.consume(line_end - self.start)
+                self.consume(2)
+                return line
+
+            if self.end - self.start > max_header_size():
+                raise HTTPError(400, "line too long")
+            searched = max(0, self.end - self.start - 1)
+
+            if self.fill() == 0:
+                raise HTTPError(400, "connection closed while reading request body")
+
+    def buffered_size(self) -> int:
+        """
+        受信済みでまだ読み込まれていないデータのサイズを返す
+        """
+        return self.end - self.start
+
+    def read_some(self, size: int) -> bytes:
+        """
+        最大sizeバイトを読み込む
+        受信済みのデータがあればそれを返し、なければ1回だけ受信して返す
+        """
+        if self.start == self.end and self.fill() == 0:
+            raise HTTPError(400, "connection closed while reading request body")
+        return self.consume(min(size, self.end - self.start))
+
+
+class SocketBodyStream(RequestBodyStream):
+    """
+    RequestReaderから必要になった分だけボディを受信して読み込むストリーム
+    ボディ全体をメモリに載せないので、大きなアップロードでもメモリ使用量は増えない
+    """
+
+    def __init__(self, reader: RequestReader, content_length: int, chunked: bool):
+        self.reader = reader
+        self.chunked = chunked
+        # Content-Lengthの場合の残りのバイト数
+        self.remaining = content_length
+        # chunkedの場合の読み込み中のチャンクの残りのバイト数と、これまでのボディのサイズ
+        self.chunk_remaining = 0
+        self.total = 0
+        self.eof = not chunked and content_length == 0
+
+    @property
+    def received(self) -> bool:
+        return self.eof
+
+    @property
+    def remaining_size(self) -> Optional[int]:
+        return None if self.chunked else self.remaining
+
+    def read1(self, size: int) -> bytes:
+        if self.eof or size == 0:
+            return b""
+
+        if self.chunked and self.chunk_remaining == 0:
+            # 次のチャンクのサイズを読み込む
+            chunk_size = parse_chunk_size(self.reader.read_line())
+            if chunk_size == 0:
+                # トレーラーは空行まで読み捨てる
+                while self.reader.read_line():
+                    pass
+                self.eof = True
+                return b""
+            self.total += chunk_size
+            if self.total > max_streamed_body_size():
+                raise HTTPError(413, "chunked body too large")
+            self.chunk_remaining = chunk_size
+
+        if self.chunked:
+            data = self.reader.read_some(min(size, self.chunk_remaining))
+            self.chunk_remaining -= len(data)
+            if self.chunk_remaining == 0:
+                # チャンクの後のCRLF
+                self.reader.read_exact(2)
+        else:
+            data = self.reader.read_some(min(size, self.remaining))
+            self.remaining -= len(data)
+            self.eof = self.remaining == 0
+        return data
+
+
+class AsyncBodyStream(RequestBodyStream):
+    """
+    asyncioのStreamReaderから必要になった分だけボディを受信して読み込むストリーム
+    スレッドプールで実行される同期的なviewからreadした場合は、イベントループに読み込みを依頼して待つ
+    """
+
+    def __init__(
+        self, reader: asyncio.StreamReader, content_length: int, chunked: bool, loop: asyncio.AbstractEventLoop,
+    ):
+        self.reader = reader
+        self.chunked = chunked
+        self.loop = loop
+        # Content-Lengthの場合の残りのバイト数
+        self.remaining = content_length
+        # chunkedの場合の読み込み中のチャンクの残りのバイト数と、これまでのボディのサイズ
+        self.chunk_remaining = 0
+        self.total = 0
+        self.eof = not chunked and content_length == 0
+
+    @property
+    def received(self) -> bool:
+        return self.eof
+
+    @property
+    def remaining_size(self) -> Optional[int]:
+        return None if self.chunked else self.remaining
+
+    def read1(self, size: int) -> bytes:
+        # イベントループのスレッドで待つと読み込みが進まなくなるので、別のスレッドから呼ばれる必要がある
+        try:
+            running_loop = asyncio.get_running_loop()
+        except RuntimeError:
+            running_loop = None
+        if running_loop is self.loop:
+            raise RuntimeError("async defのviewではawait request.stream.aread()を使ってください")
+        return asyncio.run_coroutine_threadsafe(self.aread1(size), self.loop).result()
+
+    async def aread1(self, size: int) -> bytes:
+        if self.eof or size == 0:
+            return b""
+
+        try:
+            if self.chunked and self.chunk_remaining == 0:
+                # 次のチャンクのサイズを読み込む
+                chunk_size = parse_chunk_size((await self.reader.readuntil(b"\r\n"))[:-2])
+                if chunk_size == 0:
+                    # トレーラーは空行まで読み捨てる
+                    while await self.reader.readuntil(b"\r\n") != b"\r\n":
+                        pass
+                    self.eof = True
+                    return b""
+                self.total += chunk_size
+                if self.total > max_streamed_body_size():
+                    raise HTTPError(413, "chunked body too large")
+                self.chunk_remaining = chunk_size
+
+            if self.chunked:
+                data = await self.reader.read(min(size, self.chunk_remaining))
+                if not data:
+                    raise asyncio.IncompleteReadError(b"", self.chunk_remaining)
+                self.chunk_remaining -= len(data)
+                if self.chunk_remaining == 0:
+                    # チャンクの後のCRLF
+                    await self.reader.readexactly(2)
+            else:
+                data = await self.reader.read(min(size, self.remaining))
+                if not data:
+                    raise asyncio.IncompleteReadError(b"", self.remaining)
+                self.remaining -= len(data)
+                self.eof = self.remaining == 0
+            return data
+
+        except asyncio.IncompleteReadError:
+            raise HTTPError(400, "connection closed while reading request body")
@@ -1,23 +1,163 @@
+import urllib.parse
+from typing import Dict, List, Mapping, Optional
+
+import settings
+from fango.http.errors import HTTPError
+from fango.http.headers import Headers
+from fango.http.limits import max_body_size
+from fango.http.multipart import UploadedFile, parse_multipart
+from fango.http.stream import EMPTY_BODY_STREAM, BytesBodyStream, RequestBodyStream
+
 class HTTPRequest:
+    """
+    クライアントから受信したリクエスト
+    リクエストごとに大量に生成されるので、__dict__を持たせずに属性をスロットに持つ
+    resetで別のリクエストとして使い回せる(RequestPoolを参照)
+    """
+    __slots__ = ("path", "method", "http_version", "headers", "params", "raw_head", "stream", "_body", "_form", "_files")
+
     path: str
     method: str
     http_version: str
-    headers: dict
-    body: bytes
+    # ヘッダ名の大文字小文字を区別しない
+    headers: Headers
     params: dict
+    # 受信したリクエストライン・ヘッダのバイト列
+    raw_head: bytes
+    # リクエストボディを少しずつ読み込むためのストリーム
+    stream: RequestBodyStream
 
     def __init__(
         self, path: str = "", method: str = "", http_version: str = "",
-        headers: dict = None, body: bytes = b"", params: dict = None,
+        headers: Mapping[str, str] = None, body: bytes = None, params: dict = None, stream: RequestBodyStream = None,
+        raw_head: bytes = b"",
     ):
+        self.headers = Headers()
+        self.params = {}
+        self.reset(path, method, http_version, headers, body, params, stream, raw_head)
+
+    def reset(
+        self, path: str = "", method: str = "", http_version: str = "",
+        headers: Mapping[str, str] = None, body: bytes = None, params: dict = None, stream: RequestBodyStream = None,
+        raw_head: bytes = b"",
+    ) -> None:
+        """
+        全ての属性を設定し直し、別のリクエストとして使えるようにする
+        headersとparamsを省略した場合は、持っているHeadersとdictを空にして使い回す
+        """
         if headers is None:
-            headers = {}
+            self.headers.reset()
+        elif isinstance(headers, Headers):
+            self.headers = headers
+        else:
+            self.headers.reset()
+            for name, value in headers.items():
+                self.headers.add(name, value)
         if params is None:
-            params = {}
-        
+            self.params.clear()
+        else:
+            self.params = params
+        if stream is None:
+            # ボディがない場合は読み込んでも状態が変わらないので、共通のストリームを使う
+            stream = BytesBodyStream(body) if body else EMPTY_BODY_STREAM
+
         self.path = path
         self.method = method
         self.http_version = http_version
-        self.headers = headers
-        self.body = body
-        self.params = params
\ No newline at end of file
+        self.raw_head = raw_head
+        self._body: Optional[bytes] = body
+        self.stream = stream
+        self._form: Optional[Dict[str, List[str]]] = None
+        self._files: Optional[Dict[str, List[UploadedFile]]] = None
+
+    def get_header(self, name: str, default: str = None) -> Optional[str]:
+        """
+        ヘッダ名の大文字小文字を区別せずにリクエストヘッダの値を取得する
+        """
+        return self.headers.get(name, default)
+
+    @property
+    def body(self) -> bytes:
+        """
+        リクエストボディ全体
+        最初にアクセスされたときに、ストリームからまだ読み込まれていない残りを全て読み込んで保持する
+        メモリに読み込むのでMAX_REQUEST_BODY_SIZEを超える場合は413とする
+        大きなボディを扱う場合はstreamから少しずつ読み込むこと
+        """
+        if self._body is None:
+            limit = max_body_size()
+            remaining_size = self.stream.remaining_size
+            if remaining_size is not None and remaining_size > limit:
+                # Content-Lengthで上限を超えるとわかっている場合は受信せずに413とする
+                raise HTTPError(413, f"request body too large to read into memory: {remaining_size}")
+            body = self.stream.read(limit + 1)
+            if len(body) > limit:
+                raise HTTPError(413, "request body too large to read into memory")
+            self._body = body
+        return self._body
+
+    @body.setter
+    def body(self, body: bytes) -> None:
+        self._body = body
+        self.stream = BytesBodyStream(body) if body else EMPTY_BODY_STREAM
+
+    @property
+    def form(self) -> Dict[str, List[str]]:
+        """
+        フォームから送信されたファイル以外の値
+        application/x-www-form-urlencodedとmultipart/form-dataに対応する
+        同じ名前の値が複数ある場合に備えて値はリストで持つ
+        """
+        if self._form is None:
+            self.parse_form()
+        return self._form
+
+    @property
+    def files(self) -> Dict[str, List[UploadedFile]]:
+        """
+        multipart/form-dataで送信されたファイル
+        """
+        if self._files is None:
+            self.parse_form()
+        return self._files
+
+    def parse_form(self) -> None:
+        content_type = self.get_header("Content-Type", "")
+        if content_type.lower().startswith("multipart/form-data"):
+            # ボディ全体を読み込まずに、ストリームから少しずつパースする
+            self._form, self._files = parse_multipart(self.stream, content_type)
+        elif not content_type or content_type.lower().startswith("application/x-www-form-urlencoded"):
+            # Content-Typeが指定されていない場合もフォームの値として扱う
+            self._form, self._files = urllib.parse.parse_qs(self.body.decode()), {}
+        else:
+            self._form, self._files = {}, {}
+
+
+class RequestPool:
+    """
+    使い終わったHTTPRequestを保持しておき、次のリクエストで使い回す
+    リクエストごとにオブジェクトを生成・破棄しないので、GCの対象になるオブジェクトが減る
+
+    releaseした後のHTTPRequestは別のリクエストとして使われるので、
+    viewやミドルウェアはレスポンスを返した後(ボディをイテレータで返す場合は送信し終わった後)にrequestを参照してはいけない
+    list.appendとlist.popはGILの下で不可分なので、複数のスレッドからロックなしで使える
+    """
+
+    def __init__(self, max_size: int):
+        self.max_size = max_size
+        self.free: List[HTTPRequest] = []
+
+    def acquire(self) -> HTTPRequest:
+        try:
+            return self.free.pop()
+        except IndexError:
+            return HTTPRequest()
+
+    def release(self, request: HTTPRequest) -> None:
+        # ボディやアップロードされたファイルを保持し続けないように、参照を外してから保持する
+        request.reset()
+        if len(self.free) < self.max_size:
+            self.free.append(request)
+
+
+request_pool = RequestPool(getattr(settings, "REQUEST_POOL_SIZE", 0))
@@ -1,11 +1,172 @@
-from typing import Optional
+import os
+from typing import BinaryIO, List, Optional, Tuple, Union
+
+from fango.http.streaming import ResponseBody
 
 class HTTPResponse:
+    """
+    view関数が返すレスポンス
+    bodyにはbytes(またはstr)の他に、チャンクを順番に返すイテレータ・ジェネレータ・async iteratorを渡せる
+    イテレータの場合はTransfer-Encoding: chunkedで、チャンクが生成されるたびにクライアントへ送信する
+    リクエストごとに生成されるので、__dict__を持たせずに属性をスロットに持つ
+    """
+    __slots__ = ("status_code", "content_type", "body", "headers")
+
     status_code: int
     content_type: Optional[str]
-    body: bytes
+    body: Union[bytes, ResponseBody]
+    # Content-Type、Content-Length以外に付与するレスポンスヘッダ
+    # 値をリストにすると、同じ名前のヘッダを値の数だけ送る(Set-Cookieなど)
+    # Date・Server・Content-Typeを指定した場合は、サーバが付けるものの代わりにそちらを送る
+    # Content-Length・Transfer-Encoding・Connection・Keep-Aliveはサーバが決めるので、指定しても送らない
+    headers: dict
+
+    def __init__(
+        self, status_code: int = 200, content_type: str = None, body: Union[bytes, ResponseBody] = b"", headers: dict = None,
+    ):
+        if headers is None:
+            headers = {}
 
-    def __init__(self, status_code: int = 200, content_type: str = None, body: bytes = b""):
         self.status_code = status_code
         self.content_type = content_type
-        self.body = body
\ No newline at end of file
+        self.body = body
+        self.headers = headers
+
+    def set_header(self, name: str, value: Union[str, int]) -> None:
+        """
+        nameのヘッダをvalueにする
+        大文字小文字だけが違う名前で指定済みのヘッダは置き換える
+        """
+        self.delete_header(name)
+        self.headers[name] = value
+
+    def add_header(self, name: str, value: Union[str, int]) -> None:
+        """
+        既に同じ名前のヘッダがあっても置き換えずに、もう1行ヘッダを追加する
+        """
+        key = self.find_header(name)
+        if key is None:
+            self.headers[name] = value
+        elif isinstance(self.headers[key], list):
+            self.headers[key].append(value)
+        else:
+            self.headers[key] = [self.headers[key], value]
+
+    def delete_header(self, name: str) -> None:
+        key = self.find_header(name)
+        if key is not None:
+            del self.headers[key]
+
+    def find_header(self, name: str) -> Optional[str]:
+        """
+        headersの中で、大文字小文字を区別せずにnameと一致する名前を返す
+        """
+        if name in self.headers:
+            return name
+        lower = name.lower()
+        for key in self.headers:
+            if key.lower() == lower:
+                return key
+        return None
+
+    @property
+    def is_streaming(self) -> bool:
+        """
+        ボディをイテレータから少しずつ生成して送信するか
+        """
+        return not isinstance(self.body, (bytes, bytearray, memoryview, str))
+
+    @property
+    def content_length(self) -> Optional[int]:
+        # ボディを少しずつ生成する場合は送信し終わるまで長さがわからない
+        if self.is_streaming:
+            return None
+        return len(self.body)
+
+
+class HeadResponse(HTTPResponse):
+    """
+    HEADリクエストへのレスポンス
+    GETのviewが返したレスポンスと同じヘッダを持つが、ボディは送信しない
+    """
+    __slots__ = ("_content_length",)
+
+    def __init__(self, response: HTTPResponse):
+        super().__init__(status_code=response.status_code, content_type=response.content_type, headers=response.headers)
+        # ボディを少しずつ生成するレスポンスの場合は長さがわからないのでNone
+        self._content_length = response.content_length
+
+    @property
+    def content_length(self) -> Optional[int]:
+        return self._content_length
+
+
+class FileSegment:
+    """
+    FileResponseのボディの一部
+    prefixのバイト列を送信した後、ファイルのoffsetからsizeバイトをsendfileで送信する
+    """
+    __slots__ = ("prefix", "offset", "size")
+
+    def __init__(self, prefix: bytes, offset: int, size: int):
+        self.prefix = memoryview(prefix)
+        self.offset = offset
+        self.size = size
+
+
+class FileResponse(HTTPResponse):
+    """
+    ファイルの内容をボディとするレスポンス
+    ファイルはメモリに読み込まず、サーバがヘッダを送信した後にsendfileでカーネルから直接送信する
+    """
+    __slots__ = ("file", "stat", "segments")
+
+    file: BinaryIO
+    stat: os.stat_result
+    # 送信するファイル内の範囲
+    # 通常はファイル全体の1つだけで、Rangeリクエストで複数の範囲を返す場合はmultipart/byterangesの区切りを挟む
+    segments: List[FileSegment]
+
+    def __init__(self, file: BinaryIO, status_code: int = 200, content_type: str = None, headers: dict = None):
+        super().__init__(status_code=status_code, content_type=content_type, headers=headers)
+        self.file = file
+        self.stat = os.fstat(file.fileno())
+        self.segments = [FileSegment(b"", 0, self.stat.st_size)]
+
+    @property
+    def size(self) -> int:
+        return self.stat.st_size
+
+    @property
+    def content_length(self) -> int:
+        return sum(len(segment.prefix) + segment.size for segment in self.segments)
+
+    def set_range(self, start: int, end: int) -> None:
+        """
+        ファイルのstartからendまで(endを含む)だけを送信する206レスポンスにする
+        """
+        self.status_code = 206
+        self.headers["Content-Range"] = f"bytes {start}-{end}/{self.size}"
+        self.segments = [FileSegment(b"", start, end - start + 1)]
+
+    def set_ranges(self, ranges: List[Tuple[int, int]], content_type: str, boundary: str) -> None:
+        """
+        ファイルの複数の範囲をmultipart/byterangesで送信する206レスポンスにする
+        content_typeは各パートのContent-Type
+        """
+        self.status_code = 206
+        self.content_type = f"multipart/byteranges; boundary={boundary}"
+
+        self.segments = []
+        for start, end in ranges:
+            part_header = (
+                f"\r\n--{boundary}\r\n"
+                f"Content-Type: {content_type}\r\n"
+                f"Content-Range: bytes {start}-{end}/{self.size}\r\n"
+                "\r\n"
+            )
+            self.segments.append(FileSegment(part_header.encode("latin-1"), start, end - start + 1))
+        self.segments.append(FileSegment(f"\r\n--{boundary}--\r\n".encode("latin-1"), 0, 0))
+
+    def close(self) -> None:
+        self.file.close()
@@ -0,0 +1,151 @@
+import time
+from email.utils import formatdate
+from functools import lru_cache
+from typing import List, Mapping, Optional, Set, Tuple, Union
+
+# 内容が変わらないヘッダの行は、あらかじめバイト列にしておく
+CONNECTION_CLOSE = b"Connection: close\r\n"
+TRANSFER_ENCODING_CHUNKED = b"Transfer-Encoding: chunked\r\n"
+CRLF = b"\r\n"
+
+# viewがheadersで指定すると、サーバが付けるものの代わりに使われるヘッダ
+OVERRIDABLE_HEADERS = frozenset(("date", "server", "content-type"))
+
+# ボディの区切り方と接続の扱いを示すヘッダ
+# サーバが送信方法に合わせて付けるので、viewがheadersで指定しても送らない
+# (値が食い違うヘッダを2つ送ると、クライアントやプロキシによって解釈が分かれてしまう)
+FRAMING_HEADERS = frozenset(("content-length", "transfer-encoding", "connection", "keep-alive"))
+
+# HTTPResponse.headersの値(同じ名前のヘッダを複数送る場合は値のリスト)
+HeaderValue = Union[str, int, List[Union[str, int]]]
+
+
+class DateClock:
+    """
+    Dateヘッダの行を1秒に1回だけ組み立て直す時計
+    全てのスレッド・サーバ実装で1つを共有する
+    """
+    __slots__ = ("_cache",)
+
+    def __init__(self):
+        # (組み立てた時刻(秒), Dateヘッダの行)
+        self._cache: Tuple[int, bytes] = (-1, b"")
+
+    def header(self) -> bytes:
+        now = int(time.time())
+        second, line = self._cache
+        if second != now:
+            # formatdateはロケールに関係なく英語の曜日・月名を使う
+            line = b"Date: " + formatdate(now, usegmt=True).encode("ascii") + CRLF
+            # タプルを1回の代入で置き換えるので、他のスレッドが組み立て途中の値を読むことはない
+            self._cache = (now, line)
+        return line
+
+
+date_clock = DateClock()
+
+
+@lru_cache(maxsize=None)
+def status_line(status: str) -> bytes:
+    """
+    レスポンスライン(例 HTTP/1.1 200 OK)
+    """
+    return f"HTTP/1.1 {status}\r\n".encode("ascii")
+
+
+@lru_cache(maxsize=None)
+def server_header(server_name: str) -> bytes:
+    return f"Server: {server_name}\r\n".encode("ascii") if server_name else b""
+
+
+@lru_cache(maxsize=None)
+def keep_alive_header(timeout: int) -> bytes:
+    """
+    Keep-Aliveのmaxは残りのリクエスト数なのでレスポンスごとに付け足す
+    """
+    return f"Connection: keep-alive\r\nKeep-Alive: timeout={timeout}, max=".encode("ascii")
+
+
+@lru_cache(maxsize=256)
+def content_type_header(content_type: str) -> bytes:
+    # Content-Typeの種類は限られているので、組み立てた行を使い回す
+    return encode_header("Content-Type", content_type)
+
+
+def encode_header(name: str, value: Union[str, int]) -> bytes:
+    """
+    ヘッダの1行をバイト列にする
+    改行を含む値はレスポンスに別のヘッダを紛れ込ませられるので、ValueErrorとする
+    """
+    line = f"{name}: {value}"
+    if "\r" in line or "\n" in line:
+        raise ValueError(f"header must not contain a line break: {line!r}")
+    return line.encode() + CRLF
+
+
+def encode_headers(headers: Mapping[str, HeaderValue]) -> Tuple[bytes, Set[str]]:
+    """
+    viewが指定したヘッダの行をまとめてバイト列にし、そのうちOVERRIDABLE_HEADERSに含まれるヘッダ名(小文字)と共に返す
+    値がリストの場合は、同じ名前のヘッダを値の数だけ送る(Set-Cookieなど)
+    FRAMING_HEADERSに含まれるヘッダは送らない
+    改行を含む値はレスポンスに別のヘッダを紛れ込ませられるので、ValueErrorとする
+    """
+    lines = []
+    overridden = set()
+    for name, value in headers.items():
+        key = name.lower()
+        if key in FRAMING_HEADERS:
+            continue
+        if key in OVERRIDABLE_HEADERS:
+            overridden.add(key)
+        if isinstance(value, list):
+            lines.extend(f"{name}: {item}" for item in value)
+        else:
+            lines.append(f"{name}: {value}")
+    if not lines:
+        return b"", overridden
+
+    # 1行ずつ調べずに、連結した後で行の区切り以外の改行がないかを数える
+    text = "\r\n".join(lines) + "\r\n"
+    if text.count("\n") != len(lines) or text.count("\r") != len(lines):
+        raise ValueError(f"header must not contain a line break: {headers!r}")
+    return text.encode(), overridden
+
+
+def build_response_head(
+    status: bytes,
+    headers: Mapping[str, HeaderValue],
+    server: bytes,
+    content_type: Optional[str],
+    content_length: Optional[int],
+    chunked: bool,
+    keep_alive: Optional[bytes],
+    remaining_requests: int,
+) -> bytes:
+    """
+    レスポンスラインから空行までを1つのバイト列にする
+    content_typeがNoneの場合はContent-Typeを、content_lengthがNoneの場合はContent-Lengthを付けない
+    keep_aliveはkeep_alive_headerの値で、Noneの場合は接続を閉じることを伝える
+    viewがheadersでDate・Server・Content-Typeを指定した場合は、そちらを使う
+    Content-Length・Transfer-Encoding・Connection・Keep-Aliveは常にサーバが決めた値を送る
+    """
+    view_lines, overridden = encode_headers(headers) if headers else (b"", ())
+
+    parts = [status]
+    if "date" not in overridden:
+        parts.append(date_clock.header())
+    if server and "server" not in overridden:
+        parts.append(server)
+    if content_length is not None:
+        parts.append(b"Content-Length: %d\r\n" % content_length)
+    elif chunked:
+        parts.append(TRANSFER_ENCODING_CHUNKED)
+    if keep_alive is not None:
+        parts.append(keep_alive + b"%d\r\n" % remaining_requests)
+    else:
+        parts.append(CONNECTION_CLOSE)
+    if content_type is not None and "content-type" not in overridden:
+        parts.append(content_type_header(content_type))
+    parts.append(view_lines)
+    parts.append(CRLF)
+    return b"".join(parts)
@@ -0,0 +1,131 @@
+import asyncio
+from typing import AsyncIterator, Iterator, Optional
+
+
+class RequestBodyStream:
+    """
+    リクエストボディを少しずつ読み込むためのファイルライクなオブジェクト
+    read(n)で読み込むか、forで一定サイズごとのチャンクを順番に取り出す
+    async defのviewからはaread(n)やasync forで読み込む
+    サブクラスはread1を実装する
+    """
+
+    # forで取り出すチャンクのサイズ
+    CHUNK_SIZE = 65536
+
+    def read1(self, size: int) -> bytes:
+        """
+        最大sizeバイトを読み込む
+        ボディの終わりに達した場合以外は1バイト以上を返すが、sizeバイトに満たない場合もある
+        """
+        raise NotImplementedError
+
+    @property
+    def received(self) -> bool:
+        """
+        ボディを全てクライアントから受信し終わっているか
+        受信し終わっていない場合、続くリクエストを読むにはボディを読み切る必要がある
+        """
+        raise NotImplementedError
+
+    @property
+    def remaining_size(self) -> Optional[int]:
+        """
+        まだ読み込んでいないボディのサイズ
+        chunkedなど、読み込み終わるまでわからない場合はNone
+        """
+        return None
+
+    def read(self, size: int = -1) -> bytes:
+        """
+        sizeバイトを読み込む
+        sizeが負の場合はボディの終わりまで全て読み込む
+        """
+        chunks = []
+        remaining = size
+        while remaining != 0:
+            chunk = self.read1(self.CHUNK_SIZE if remaining < 0 else remaining)
+            if not chunk:
+                break
+            chunks.append(chunk)
+            if remaining > 0:
+                remaining -= len(chunk)
+        return b"".join(chunks)
+
+    def drain(self) -> None:
+        """
+        残りのボディを読み捨てる
+        """
+        while self.read1(self.CHUNK_SIZE):
+            pass
+
+    def __iter__(self) -> Iterator[bytes]:
+        while True:
+            chunk = self.read1(self.CHUNK_SIZE)
+            if not chunk:
+                return
+            yield chunk
+
+    async def aread1(self, size: int) -> bytes:
+        # ブロッキングする読み込みはイベントループを止めないように別スレッドで行う
+        return await asyncio.to_thread(self.read1, size)
+
+    async def aread(self, size: int = -1) -> bytes:
+        """
+        readのasync版
+        """
+        chunks = []
+        remaining = size
+        while remaining != 0:
+            chunk = await self.aread1(self.CHUNK_SIZE if remaining < 0 else remaining)
+            if not chunk:
+                break
+            chunks.append(chunk)
+            if remaining > 0:
+                remaining -= len(chunk)
+        return b"".join(chunks)
+
+    async def __aiter__(self) -> AsyncIterator[bytes]:
+        while True:
+            chunk = await self.aread1(self.CHUNK_SIZE)
+            if not chunk:
+                return
+            yield chunk
+
+
+class BytesBodyStream(RequestBodyStream):
+    """
+    既に全て受信済みのボディを読み込むストリーム
+    """
+
+    def __init__(self, data: bytes = b""):
+        self.data = memoryview(data)
+        self.position = 0
+
+    @property
+    def received(self) -> bool:
+        return True
+
+    @property
+    def remaining_size(self) -> Optional[int]:
+        return len(self.data) - self.position
+
+    def read1(self, size: int) -> bytes:
+        chunk = bytes(self.data[self.position:self.position + size])
+        self.position += len(chunk)
+        return chunk
+
+    def read(self, size: int = -1) -> bytes:
+        # 全て読み込む場合もチャンクに分けずに一度に切り出す
+        if size < 0:
+            size = len(self.data) - self.position
+        return self.read1(size)
+
+    async def aread1(self, size: int) -> bytes:
+        # メモリ上のデータを読むだけなのでスレッドに渡す必要はない
+        return self.read1(size)
+
+
+# ボディのないリクエストで共通に使うストリーム
+# 空のボディは読み込んでも状態が変わらないので、複数のリクエストで共有できる
+EMPTY_BODY_STREAM = BytesBodyStream(b"")
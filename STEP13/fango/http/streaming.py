@@ -0,0 +1,85 @@
+import asyncio
+from concurrent.futures import Executor
+from typing import AsyncIterator, Iterator, Union
+
+# viewがレスポンスのボディとして返せるイテレータ
+# bytesまたはstrのチャンクを順番に返す
+ResponseBody = Union[Iterator[Union[bytes, str]], AsyncIterator[Union[bytes, str]]]
+
+
+def encode_chunk(chunk: bytes) -> bytes:
+    """
+    Transfer-Encoding: chunkedのチャンク1つ分のバイト列を生成する
+    """
+    return b"%x\r\n%b\r\n" % (len(chunk), chunk)
+
+
+# chunkedのボディの終端
+LAST_CHUNK = b"0\r\n\r\n"
+
+
+def to_bytes(chunk: Union[bytes, str]) -> bytes:
+    if isinstance(chunk, str):
+        return chunk.encode()
+    return bytes(chunk)
+
+
+def iter_body(body: ResponseBody) -> Iterator[bytes]:
+    """
+    レスポンスのボディのイテレータからチャンクを順番に取り出す
+    async iteratorの場合は、このスレッドでイベントループを回して取り出す
+    途中で送信をやめた場合もイテレータを閉じる
+    """
+    if not hasattr(body, "__aiter__"):
+        try:
+            for chunk in body:
+                yield to_bytes(chunk)
+        finally:
+            if hasattr(body, "close"):
+                body.close()
+        return
+
+    loop = asyncio.new_event_loop()
+    iterator = body.__aiter__()
+    try:
+        while True:
+            try:
+                chunk = loop.run_until_complete(iterator.__anext__())
+            except StopAsyncIteration:
+                return
+            yield to_bytes(chunk)
+    finally:
+        if hasattr(iterator, "aclose"):
+            loop.run_until_complete(iterator.aclose())
+        loop.run_until_complete(loop.shutdown_asyncgens())
+        loop.close()
+
+
+async def aiter_body(body: ResponseBody, executor: Executor = None) -> AsyncIterator[bytes]:
+    """
+    iter_bodyのasync版
+    通常のイテレータの場合は、ブロッキングする処理がイベントループを止めないようにスレッドプールで取り出す
+    """
+    if hasattr(body, "__aiter__"):
+        iterator = body.__aiter__()
+        try:
+            async for chunk in iterator:
+                yield to_bytes(chunk)
+        finally:
+            if hasattr(iterator, "aclose"):
+                await iterator.aclose()
+        return
+
+    loop = asyncio.get_running_loop()
+    iterator = iter(body)
+    # イテレータの終わりを示す値
+    end = object()
+    try:
+        while True:
+            chunk = await loop.run_in_executor(executor, next, iterator, end)
+            if chunk is end:
+                return
+            yield to_bytes(chunk)
+    finally:
+        if hasattr(iterator, "close"):
+            iterator.close()
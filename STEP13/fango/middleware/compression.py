@@ -0,0 +1,215 @@
+import gzip
+import threading
+import zlib
+from collections import OrderedDict
+from typing import Dict, Optional, Tuple
+
+import settings
+from fango.http.request import HTTPRequest
+from fango.http.response import HTTPResponse
+
+try:
+    import brotli
+except ImportError:
+    # brotliはインストールされている場合だけ使う
+    brotli = None
+
+# 圧縮するレスポンスの最小サイズのデフォルト値(バイト)
+# これより小さいレスポンスは圧縮してもヘッダの分で得をしないので圧縮しない
+DEFAULT_MIN_SIZE = 1024
+# 圧縮するContent-Typeのデフォルト値
+DEFAULT_TYPES = (
+    "text/html",
+    "text/css",
+    "text/plain",
+    "text/javascript",
+    "application/javascript",
+    "application/json",
+    "image/svg+xml",
+)
+# 圧縮結果のキャッシュに保持する合計サイズのデフォルト値(バイト)
+DEFAULT_CACHE_MAX_BYTES = 16 * 1024 * 1024
+
+
+def compress_brotli(body: bytes, level: int) -> bytes:
+    # brotliの品質は0~11なので、zlibの圧縮レベル(1~9)から換算する
+    return brotli.compress(body, quality=min(level + 2, 11))
+
+
+def compress_gzip(body: bytes, level: int) -> bytes:
+    # 同じ内容からは同じ結果になるように、gzipヘッダの時刻は0にする
+    return gzip.compress(body, compresslevel=level, mtime=0)
+
+
+def compress_deflate(body: bytes, level: int) -> bytes:
+    # HTTPのdeflateはzlib形式のデータを指す
+    return zlib.compress(body, level)
+
+
+# 対応している圧縮方式と圧縮関数
+# クライアントが同じ優先度で受け付ける場合は先に書いたものを選ぶ
+ENCODINGS = {"gzip": compress_gzip, "deflate": compress_deflate}
+if brotli is not None:
+    ENCODINGS = {"br": compress_brotli, **ENCODINGS}
+
+
+def parse_accept_encoding(value: str) -> Dict[str, float]:
+    """
+    Accept-Encoding(例 gzip, deflate;q=0.5, *;q=0)を圧縮方式と優先度(q値)の辞書に変換する
+    """
+    qualities = {}
+    for item in value.split(","):
+        coding, _, params = item.partition(";")
+        coding = coding.strip().lower()
+        if not coding:
+            continue
+
+        quality = 1.0
+        for param in params.split(";"):
+            key, _, param_value = param.partition("=")
+            if key.strip().lower() == "q":
+                try:
+                    quality = float(param_value)
+                except ValueError:
+                    quality = 0.0
+        qualities[coding] = quality
+    return qualities
+
+
+def negotiate_encoding(request: HTTPRequest, available=None) -> Optional[str]:
+    """
+    リクエストのAccept-Encodingから、レスポンスに使う圧縮方式を選ぶ
+    availableには選択肢となる圧縮方式を優先する順に渡す(省略した場合は対応している全ての方式)
+    圧縮しない場合はNoneを返す
+    """
+    if available is None:
+        available = ENCODINGS
+
+    accept_encoding = request.get_header("Accept-Encoding")
+    if not accept_encoding:
+        return None
+
+    qualities = parse_accept_encoding(accept_encoding)
+    best_encoding = None
+    best_quality = 0.0
+    for encoding in available:
+        quality = qualities.get(encoding, qualities.get("*", 0.0))
+        if quality > best_quality:
+            best_encoding = encoding
+            best_quality = quality
+    return best_encoding
+
+
+def is_compressible(content_type: Optional[str]) -> bool:
+    """
+    Content-Typeが圧縮する対象か判定する
+    """
+    if not content_type:
+        return False
+    mime_type = content_type.split(";", 1)[0].strip().lower()
+    return mime_type in getattr(settings, "COMPRESSION_TYPES", DEFAULT_TYPES)
+
+
+def add_vary(response: HTTPResponse, header: str) -> None:
+    """
+    レスポンスのVaryにheaderを追加する
+    """
+    vary = response.headers.get("Vary")
+    if vary is None:
+        response.headers["Vary"] = header
+    elif header.lower() not in (value.strip().lower() for value in vary.split(",")):
+        response.headers["Vary"] = f"{vary}, {header}"
+
+
+class CompressionCache:
+    """
+    圧縮結果のLRUキャッシュ
+    同じテンプレートの出力や静的ファイルは、一度だけ圧縮して結果を使い回す
+
+    キーは(圧縮方式, 圧縮前のボディ)とする
+    ボディ自体をキーにするのでハッシュの衝突で別の内容を返すことはない
+    bytesはハッシュ値を内部に保持するので、静的ファイルのキャッシュのように同じオブジェクトを返す場合は
+    2回目以降の検索でボディ全体を走査しない
+    """
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self.lock = threading.Lock()
+        self.entries: "OrderedDict[Tuple[str, bytes], bytes]" = OrderedDict()
+        self.total_bytes = 0
+
+    @staticmethod
+    def entry_size(key: Tuple[str, bytes], compressed: bytes) -> int:
+        _, body = key
+        return len(body) + len(compressed)
+
+    def get(self, key: Tuple[str, bytes]) -> Optional[bytes]:
+        with self.lock:
+            compressed = self.entries.get(key)
+            if compressed is not None:
+                self.entries.move_to_end(key)
+            return compressed
+
+    def set(self, key: Tuple[str, bytes], compressed: bytes) -> None:
+        size = self.entry_size(key, compressed)
+        if size > self.max_bytes:
+            return
+
+        with self.lock:
+            old_compressed = self.entries.pop(key, None)
+            if old_compressed is not None:
+                self.total_bytes -= self.entry_size(key, old_compressed)
+            self.entries[key] = compressed
+            self.total_bytes += size
+
+            # 上限を超えた分を古いものから破棄する
+            while self.total_bytes > self.max_bytes:
+                old_key, old_compressed = self.entries.popitem(last=False)
+                self.total_bytes -= self.entry_size(old_key, old_compressed)
+
+
+compression_cache = CompressionCache(getattr(settings, "COMPRESSION_CACHE_MAX_BYTES", DEFAULT_CACHE_MAX_BYTES))
+
+
+def compression(request: HTTPRequest, response: HTTPResponse) -> HTTPResponse:
+    """
+    Accept-Encodingに従ってレスポンスのボディを圧縮するミドルウェア
+    ボディをメモリに持っているレスポンスだけを対象とし、FileResponseは圧縮しない
+    (静的ファイルは、STATIC_ROOTに圧縮済みの.gzファイルがあればviewがそちらを返す)
+    """
+    if response.status_code != 200 or not isinstance(response.body, bytes):
+        return response
+    if not is_compressible(response.content_type):
+        return response
+
+    # 圧縮するかどうかがAccept-Encodingによって変わることを中継するキャッシュに伝える
+    add_vary(response, "Accept-Encoding")
+
+    if "Content-Encoding" in response.headers:
+        # 既に圧縮済み
+        return response
+    if len(response.body) < getattr(settings, "COMPRESSION_MIN_SIZE", DEFAULT_MIN_SIZE):
+        return response
+
+    encoding = negotiate_encoding(request)
+    if encoding is None:
+        return response
+
+    key = (encoding, response.body)
+    compressed = compression_cache.get(key)
+    if compressed is None:
+        compressed = ENCODINGS[encoding](response.body, getattr(settings, "COMPRESSION_LEVEL", 6))
+        compression_cache.set(key, compressed)
+
+    if len(compressed) >= len(response.body):
+        # 圧縮しても小さくならない場合はそのまま返す
+        return response
+
+    response.body = compressed
+    response.headers["Content-Encoding"] = encoding
+    etag = response.headers.get("ETag")
+    if etag is not None and not etag.startswith("W/"):
+        # 圧縮後のボディはバイト単位では圧縮前と一致しないので弱いETagにする
+        # If-None-Matchは弱い比較なので、再検証では圧縮前と同じく304を返せる
+        response.headers["ETag"] = "W/" + etag
+    return response
@@ -0,0 +1,147 @@
+import asyncio
+import socket
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import settings
+from fango.http.errors import HTTPError
+from fango.http.limits import max_header_size
+from fango.http.reader import AsyncBodyStream, body_framing
+from fango.http.request import HTTPRequest
+from fango.http.response import FileResponse, HTTPResponse
+from fango.server.handler import HTTPHandler
+from fango.server.log import get_logger
+from fango.server.server import Server
+
+class AsyncServer(Server):
+    """
+    asyncioを使ったサーバ
+    async defで定義されたviewはイベントループ上でそのままawaitし、
+    通常のviewはスレッドプールで実行する
+    """
+
+    def __init__(self):
+        self.handler = HTTPHandler()
+        self.executor = ThreadPoolExecutor(max_workers=getattr(settings, "EVENT_LOOP_EXECUTOR_SIZE", 8))
+
+    def serve(self, server_socket: socket.socket = None):
+        get_logger().info("サーバを起動します(asyncio)")
+
+        try:
+            asyncio.run(self.serve_async(server_socket))
+        finally:
+            get_logger().info("Server: サーバを停止します")
+            self.executor.shutdown(wait=False)
+
+    async def serve_async(self, server_socket: socket.socket = None) -> None:
+        # socket生成
+        if server_socket is None:
+            server_socket = self.create_server_socket()
+
+        # StreamReaderのバッファの上限をリクエストヘッダの最大サイズに合わせる
+        server = await asyncio.start_server(self.handle_client, sock=server_socket, limit=max_header_size())
+        async with server:
+            await server.serve_forever()
+
+    async def handle_client(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        # クライアントと接続済みのstreamを受け取りリクエスト処理してレスポンスを送信する
+        # Keep-Aliveの場合は同じ接続で次のリクエストを待ち、繰り返し処理する
+        client_address = writer.get_extra_info("peername")
+        keep_alive_timeout = getattr(settings, "KEEP_ALIVE_TIMEOUT", 5)
+        try:
+            request_count = 0
+            while True:
+                try:
+                    # 一定時間リクエストが来なかった場合は接続を閉じる
+                    request_head = await asyncio.wait_for(reader.readuntil(b"\r\n\r\n"), keep_alive_timeout)
+                except (asyncio.TimeoutError, asyncio.IncompleteReadError):
+                    break
+                except asyncio.LimitOverrunError:
+                    raise HTTPError(431, "request header too large")
+
+                started = time.monotonic()
+                # クライアントから送られてきたデータをキャプチャする
+                # ボディはストリームで読み込むのでリクエストライン・ヘッダのみ
+                self.handler.capture_request(request_head)
+
+                # HTTPリクエストをパースする
+                request = self.handler.parse_request_head(request_head)
+                request.stream = self.create_body_stream(request, reader, writer)
+                request_count += 1
+
+                response = await self.handler.handle_request_async(request, self.executor)
+
+                remaining_requests = self.handler.remaining_requests(request, request_count)
+                remaining_requests = self.handler.remaining_requests_after(request, response, remaining_requests)
+                keep_alive = remaining_requests > 0
+
+                await self.send_response(writer, response, request, keep_alive, remaining_requests)
+                self.handler.log_access(request, response, client_address, started)
+                self.handler.release_request(request)
+
+                if not keep_alive:
+                    break
+
+        except HTTPError as e:
+            # リクエストが不正な場合はエラーレスポンスを返して接続を閉じる
+            get_logger().warning(f"AsyncServer: 不正なリクエストを受信しました {e} remote_address: {client_address}")
+            response = self.handler.build_error_response(e.status_code)
+            writer.write(self.handler.build_response_bytes(response, HTTPRequest()))
+            await writer.drain()
+
+        except Exception:
+            # リクエストを処理中に例外が発生した場合エラーログを出力し
+            # 処理を続行する
+            get_logger().exception(f"AsyncServer: リクエストの処理中にエラーが発生しました remote_address: {client_address}")
+
+        finally:
+            writer.close()
+
+    async def send_response(
+        self, writer: asyncio.StreamWriter, response: HTTPResponse, request: HTTPRequest,
+        keep_alive: bool, remaining_requests: int,
+    ) -> None:
+        """
+        レスポンスを送信する
+        FileResponseの場合はヘッダを送信した後、ファイルをsendfileで送信する
+        ボディを少しずつ生成するレスポンスの場合は、チャンクが生成されるたびに送信する
+        """
+        # 大きなボディはヘッダと連結せずに書き込む
+        for buffer in self.handler.build_response_buffers(response, request, keep_alive, remaining_requests):
+            writer.write(buffer)
+        await writer.drain()
+
+        if response.is_streaming:
+            chunks = self.handler.aiter_response_chunks(response, request, self.executor)
+            try:
+                async for chunk in chunks:
+                    writer.write(chunk)
+                    await writer.drain()
+            finally:
+                await chunks.aclose()
+
+        if isinstance(response, FileResponse):
+            try:
+                loop = asyncio.get_running_loop()
+                for segment in response.segments:
+                    if segment.prefix:
+                        writer.write(segment.prefix)
+                        await writer.drain()
+                    if segment.size:
+                        await loop.sendfile(writer.transport, response.file, segment.offset, segment.size)
+            finally:
+                response.close()
+
+    def create_body_stream(
+        self, request: HTTPRequest, reader: asyncio.StreamReader, writer: asyncio.StreamWriter,
+    ) -> AsyncBodyStream:
+        """
+        Content-LengthかTransfer-Encoding: chunkedに従ってリクエストボディを読み込むストリームを生成する
+        ボディはviewが読み込むときに必要な分だけ受信する
+        """
+        content_length, chunked = body_framing(request)
+        if (content_length or chunked) and self.handler.get_header(request, "Expect", "").lower() == "100-continue":
+            # クライアントがボディの送信前に確認を待っている
+            writer.write(b"HTTP/1.1 100 Continue\r\n\r\n")
+
+        return AsyncBodyStream(reader, content_length, chunked, asyncio.get_running_loop())
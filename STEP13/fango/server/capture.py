@@ -0,0 +1,121 @@
+import os
+import random
+import threading
+import time
+from collections import deque
+from typing import List, Optional
+
+import settings
+from fango.server.log import BatchWriter, RotatingFile
+
+# 管理用のページで返すときに値を伏せるリクエストヘッダ(小文字)
+REDACTED_HEADERS = (b"authorization", b"proxy-authorization", b"cookie")
+
+
+class CapturedRequest:
+    """
+    キャプチャした受信データ1リクエスト分
+    """
+    __slots__ = ("time", "data")
+
+    def __init__(self, data: bytes):
+        self.time = time.time()
+        self.data = data
+
+    @property
+    def method(self) -> str:
+        return self.data.split(b" ", 1)[0].decode("latin-1")
+
+    def redacted(self) -> bytes:
+        """
+        認証情報を含むヘッダの値を伏せた受信データ
+        """
+        head_end = self.data.find(b"\r\n\r\n")
+        head, rest = (self.data, b"") if head_end == -1 else (self.data[:head_end], self.data[head_end:])
+        lines = head.split(b"\r\n")
+        for index, line in enumerate(lines[1:], 1):
+            name, separator, _ = line.partition(b":")
+            if separator and name.strip().lower() in REDACTED_HEADERS:
+                lines[index] = name + b": [REDACTED]"
+        return b"\r\n".join(lines) + rest
+
+    def to_bytes(self) -> bytes:
+        """
+        ファイルに書き出す形式にする
+        """
+        timestamp = time.strftime("%Y-%m-%dT%H:%M:%S", time.localtime(self.time)) + f".{int(self.time * 1000) % 1000:03d}"
+        return f"=== {timestamp} {len(self.data)} bytes ===\r\n".encode() + self.data + b"\r\n"
+
+
+class RequestCapture:
+    """
+    受信したリクエストの生データを、直近size件だけメモリに保持するリングバッファ
+    sample_rateの割合のリクエストだけをキャプチャする
+    writerを指定した場合は、キャプチャしたリクエストをバックグラウンドでファイルにも書き出す
+    """
+
+    def __init__(self, size: int, sample_rate: float = 1.0, writer: BatchWriter = None):
+        self.sample_rate = sample_rate
+        self.writer = writer
+        # maxlenを超えた分は古いものから捨てられる
+        self.buffer: "deque[CapturedRequest]" = deque(maxlen=size)
+
+    def capture(self, head: bytes, body: bytes = b"") -> None:
+        if self.sample_rate < 1.0 and random.random() >= self.sample_rate:
+            return
+        captured = CapturedRequest(head + body)
+        self.buffer.append(captured)
+        if self.writer is not None:
+            self.writer.put(captured)
+
+    def recent(self, limit: int = None, method: str = None) -> List[CapturedRequest]:
+        """
+        キャプチャしたリクエストを新しい順に返す
+        """
+        captured_requests = []
+        for captured in reversed(list(self.buffer)):
+            if method is not None and captured.method != method:
+                continue
+            captured_requests.append(captured)
+            if limit is not None and len(captured_requests) >= limit:
+                break
+        return captured_requests
+
+
+# プロセスごとに1つのキャプチャを使う
+# forkした子プロセスで書き出しスレッドが動くように、最初に使われたときに生成する
+_request_capture: Optional[RequestCapture] = None
+_request_capture_lock = threading.Lock()
+
+
+def get_request_capture() -> Optional[RequestCapture]:
+    """
+    受信したリクエストのキャプチャを返す
+    REQUEST_CAPTURE_ENABLEDがFalseの場合はNoneを返す
+    """
+    global _request_capture
+    if not getattr(settings, "REQUEST_CAPTURE_ENABLED", False):
+        return None
+
+    if _request_capture is None:
+        with _request_capture_lock:
+            if _request_capture is None:
+                writer = None
+                directory = getattr(settings, "REQUEST_CAPTURE_DIR", None)
+                if directory is not None:
+                    file = RotatingFile(
+                        os.path.join(directory, f"requests.{os.getpid()}.txt"),
+                        max_size=getattr(settings, "REQUEST_CAPTURE_MAX_FILE_SIZE", 10 * 1024 * 1024),
+                        backup_count=getattr(settings, "REQUEST_CAPTURE_BACKUP_COUNT", 5),
+                    )
+                    writer = BatchWriter(
+                        file, CapturedRequest.to_bytes,
+                        max_queue_size=getattr(settings, "REQUEST_CAPTURE_QUEUE_SIZE", 10000),
+                    )
+                    writer.start()
+                _request_capture = RequestCapture(
+                    size=getattr(settings, "REQUEST_CAPTURE_SIZE", 100),
+                    sample_rate=getattr(settings, "REQUEST_CAPTURE_SAMPLE_RATE", 1.0),
+                    writer=writer,
+                )
+    return _request_capture
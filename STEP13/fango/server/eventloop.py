@@ -0,0 +1,404 @@
+import os
+import selectors
+import socket
+import time
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Deque, Dict, Iterator, List, Optional, Tuple
+
+import settings
+from fango.http import parser
+from fango.http.errors import HTTPError
+from fango.http.request import HTTPRequest
+from fango.http.response import FileResponse
+from fango.server.handler import HTTPHandler, advance_buffers
+from fango.server.log import get_logger
+from fango.server.server import Server
+
+class Connection:
+    """
+    イベントループで管理するクライアントとの接続1つ分の状態
+    接続ごとにスレッドを持たないので、数万の接続を保持してもスタックは消費しない
+    """
+    __slots__ = (
+        "client_socket", "address", "recv_buffer", "send_buffers", "send_file", "send_stream", "stream_request",
+        "keep_alive", "request_count", "last_active", "head_checked",
+    )
+
+    def __init__(self, client_socket: socket.socket, address: Tuple[str, int]):
+        self.client_socket = client_socket
+        self.address = address
+        # クライアントから受信したがまだ処理していないデータ
+        self.recv_buffer = bytearray()
+        # クライアントへ送信待ちのデータ(ヘッダと大きなボディは別のバイト列のまま、sendmsgでまとめて送る)
+        # Noneの場合はレスポンスを送信中ではない
+        self.send_buffers: Optional[List[memoryview]] = None
+        # send_buffersを送信した後にsendfileで送信するファイル
+        self.send_file: Optional[FileResponse] = None
+        # send_buffersを送信した後に、チャンクを1つずつ生成して送信するレスポンスのボディ
+        self.send_stream: Optional[Iterator[bytes]] = None
+        # send_streamのリクエスト(チャンクを生成し終わるまではviewが参照している可能性があるので、それまで解放しない)
+        self.stream_request: Optional[HTTPRequest] = None
+        # レスポンスを送信した後も接続を維持するか
+        self.keep_alive = False
+        # この接続で処理したリクエスト数
+        self.request_count = 0
+        # 最後にデータを受信した時刻
+        self.last_active = time.monotonic()
+        # 受信中のリクエストのヘッダを確認したか(Expect: 100-continueへの応答は1回だけ送る)
+        self.head_checked = False
+
+
+class EventLoopServer(Server):
+    """
+    selectors(Linuxではepoll)を使ったシングルスレッドのノンブロッキングサーバ
+    接続の受付、リクエストの受信、レスポンスの送信は全てイベントループのスレッドで行い、
+    view関数の実行だけをスレッドプールに渡す
+    """
+
+    def __init__(self):
+        self.handler = HTTPHandler()
+        self.selector = selectors.DefaultSelector()
+        self.executor = ThreadPoolExecutor(max_workers=getattr(settings, "EVENT_LOOP_EXECUTOR_SIZE", 8))
+        self.keep_alive_timeout = getattr(settings, "KEEP_ALIVE_TIMEOUT", 5)
+
+        # リクエストの受信を待っている接続
+        # 最後にデータを受信した時刻が古い順に並べておき、タイムアウトした接続を先頭から閉じる
+        self.idle_connections: Dict[Connection, None] = {}
+
+        # view関数の実行やチャンクの生成が終わった接続と、送信するデータ
+        # スレッドプールから追加され、イベントループのスレッドで取り出される
+        # データがNoneの場合は処理に失敗したので接続を閉じる
+        self.completed: Deque[Tuple[Connection, Optional[List[bytes]]]] = deque()
+        # スレッドプールからイベントループを起こすためのsocketペア
+        self.wakeup_reader, self.wakeup_writer = socket.socketpair()
+        self.wakeup_reader.setblocking(False)
+        self.wakeup_writer.setblocking(False)
+
+    def serve(self, server_socket: socket.socket = None):
+        get_logger().info("サーバを起動します(イベントループ)")
+
+        try:
+            # socket生成
+            if server_socket is None:
+                server_socket = self.create_server_socket()
+            server_socket.setblocking(False)
+
+            self.selector.register(server_socket, selectors.EVENT_READ, self.accept)
+            self.selector.register(self.wakeup_reader, selectors.EVENT_READ, self.on_wakeup)
+
+            while True:
+                for key, mask in self.selector.select(timeout=1):
+                    if isinstance(key.data, Connection):
+                        self.on_event(key.data, mask)
+                    else:
+                        callback = key.data
+                        callback(key.fileobj, mask)
+
+                self.close_idle_connections()
+
+        finally:
+            get_logger().info("Server: サーバを停止します")
+            self.executor.shutdown(wait=False)
+
+    def accept(self, server_socket: socket.socket, mask: int) -> None:
+        # 1回の通知で受け付けられるだけ受け付ける
+        while True:
+            try:
+                (client_socket, address) = server_socket.accept()
+            except BlockingIOError:
+                return
+
+            client_socket.setblocking(False)
+            connection = Connection(client_socket, address)
+            self.selector.register(client_socket, selectors.EVENT_READ, connection)
+            self.idle_connections[connection] = None
+
+    def on_event(self, connection: Connection, mask: int) -> None:
+        if mask & selectors.EVENT_READ:
+            self.on_readable(connection)
+        if mask & selectors.EVENT_WRITE:
+            self.on_writable(connection)
+
+    def on_readable(self, connection: Connection) -> None:
+        try:
+            data = connection.client_socket.recv(65536)
+        except BlockingIOError:
+            return
+        except OSError:
+            self.close(connection)
+            return
+
+        if not data:
+            # クライアントが接続を閉じた
+            self.close(connection)
+            return
+
+        connection.recv_buffer += data
+        connection.last_active = time.monotonic()
+        # 受信したので待ち行列の末尾に並べ直す
+        self.idle_connections.pop(connection, None)
+        self.idle_connections[connection] = None
+
+        self.dispatch_request(connection)
+
+    def dispatch_request(self, connection: Connection) -> None:
+        """
+        受信済みのデータにリクエストが1つ分届いていれば、スレッドプールで処理を始める
+        """
+        try:
+            request_end = self.handler.find_request_end(connection.recv_buffer)
+        except HTTPError as e:
+            # リクエストが不正な場合はエラーレスポンスを返して接続を閉じる
+            get_logger().warning(f"EventLoopServer: 不正なリクエストを受信しました {e} remote_address: {connection.address}")
+            self.send_error(connection, e.status_code)
+            return
+
+        if request_end is None:
+            # リクエストがまだ全て届いていないので次の受信を待つ
+            if not connection.head_checked:
+                self.send_continue(connection)
+            return
+
+        request_bytes = bytes(connection.recv_buffer[:request_end])
+        del connection.recv_buffer[:request_end]
+        connection.request_count += 1
+        connection.head_checked = False
+
+        # レスポンスを返すまではこの接続からは読み込まない
+        self.selector.unregister(connection.client_socket)
+        self.idle_connections.pop(connection, None)
+
+        future = self.executor.submit(self.process, request_bytes, connection.request_count, connection.address)
+        future.add_done_callback(lambda f: self.on_processed(connection, f))
+
+    def send_continue(self, connection: Connection) -> None:
+        """
+        ヘッダまで届いてボディがまだ届いていないリクエストがExpect: 100-continueを指定していれば、
+        クライアントがボディの送信を始められるように100 Continueを送信する
+        """
+        header_end = connection.recv_buffer.find(b"\r\n\r\n")
+        if header_end == -1:
+            return
+        connection.head_checked = True
+
+        # ヘッダはfind_request_endでパースできることを確認済み
+        request = parser.parse_request_head(bytes(connection.recv_buffer[:header_end + 4]))
+        if self.handler.get_header(request, "Expect", "").lower() != "100-continue":
+            return
+        try:
+            # レスポンスを送信していない間なので送信バッファは空いており、この短いデータは1回で送信できる
+            connection.client_socket.send(b"HTTP/1.1 100 Continue\r\n\r\n")
+        except OSError:
+            self.close(connection)
+
+    def process(
+        self, request_bytes: bytes, request_count: int, address: Tuple[str, int],
+    ) -> Tuple[List[bytes], bool, Optional[FileResponse], Optional[Iterator[bytes]], Optional[HTTPRequest]]:
+        """
+        スレッドプール上でリクエストをパースしview関数を実行する
+        レスポンスのバイト列のリスト、レスポンスを送信した後も接続を維持するか、
+        続けてsendfileで送信するファイルのレスポンス、続けて送信するチャンクのイテレータ、
+        チャンクを送信し終わった後に解放するリクエストを返す
+        """
+        started = time.monotonic()
+        # クライアントから送られてきたデータをキャプチャする
+        self.handler.capture_request(request_bytes)
+        try:
+            request = self.handler.parse_http_request(request_bytes)
+        except HTTPError as e:
+            # リクエストが不正な場合はエラーレスポンスを返して接続を閉じる
+            response = self.handler.build_error_response(e.status_code)
+            return self.handler.build_response_buffers(response, HTTPRequest()), False, None, None, None
+
+        try:
+            response = self.handler.handle_request(request)
+        except HTTPError as e:
+            # viewがボディを読み込むときなどにリクエストが不正だとわかった場合も、エラーレスポンスを返して接続を閉じる
+            response = self.handler.build_error_response(e.status_code)
+            self.handler.log_access(request, response, address, started)
+            self.handler.release_request(request)
+            return self.handler.build_response_buffers(response, HTTPRequest()), False, None, None, None
+
+        remaining_requests = self.handler.remaining_requests(request, request_count)
+        remaining_requests = self.handler.remaining_requests_after(request, response, remaining_requests)
+        keep_alive = remaining_requests > 0
+        response_buffers = self.handler.build_response_buffers(response, request, keep_alive, remaining_requests)
+        send_file = response if isinstance(response, FileResponse) else None
+        send_stream = self.handler.iter_response_chunks(response, request) if response.is_streaming else None
+        # 送信はイベントループで行うので、レスポンスを生成し終えた時点で記録する
+        self.handler.log_access(request, response, address, started)
+        if send_stream is not None:
+            # ボディをイテレータから生成する場合は、送信し終わるまでrequestを参照している可能性がある
+            return response_buffers, keep_alive, send_file, send_stream, request
+        self.handler.release_request(request)
+        return response_buffers, keep_alive, send_file, None, None
+
+    def on_processed(self, connection: Connection, future: Future) -> None:
+        # スレッドプールのスレッドで呼ばれるので、イベントループに処理を戻す
+        try:
+            (
+                response_buffers, connection.keep_alive, connection.send_file,
+                connection.send_stream, connection.stream_request,
+            ) = future.result()
+        except Exception:
+            get_logger().exception(f"EventLoopServer: リクエストの処理中にエラーが発生しました remote_address: {connection.address}")
+            response_buffers = None
+
+        self.complete(connection, response_buffers)
+
+    def on_chunk(self, connection: Connection, future: Future) -> None:
+        # スレッドプールのスレッドで呼ばれるので、イベントループに処理を戻す
+        try:
+            chunk = future.result()
+        except Exception:
+            # 途中まで送信したので、エラーレスポンスは返せない
+            get_logger().exception(f"EventLoopServer: レスポンスのボディの生成中にエラーが発生しました remote_address: {connection.address}")
+            chunk = None
+        else:
+            if chunk is None:
+                # 全てのチャンクを送信した
+                connection.send_stream = None
+                self.release_stream_request(connection)
+                chunk = b""
+
+        self.complete(connection, None if chunk is None else [chunk])
+
+    def complete(self, connection: Connection, data: Optional[List[bytes]]) -> None:
+        """
+        スレッドプールでの処理が終わったことをイベントループに知らせ、dataを送信させる
+        """
+        self.completed.append((connection, data))
+        try:
+            self.wakeup_writer.send(b"\0")
+        except BlockingIOError:
+            # 既に起こす通知が溜まっている場合は追加しなくてよい
+            pass
+
+    def on_wakeup(self, wakeup_reader: socket.socket, mask: int) -> None:
+        try:
+            while wakeup_reader.recv(4096):
+                pass
+        except BlockingIOError:
+            pass
+
+        while self.completed:
+            connection, data = self.completed.popleft()
+            if data is None:
+                self.close(connection)
+                continue
+
+            connection.send_buffers = [memoryview(buffer) for buffer in data if buffer]
+            self.selector.register(connection.client_socket, selectors.EVENT_WRITE, connection)
+            self.on_writable(connection)
+
+    def on_writable(self, connection: Connection) -> None:
+        if connection.send_buffers is None:
+            return
+
+        try:
+            if connection.send_buffers:
+                advance_buffers(connection.send_buffers, connection.client_socket.sendmsg(connection.send_buffers))
+            if not connection.send_buffers and connection.send_file is not None:
+                self.send_file(connection)
+        except BlockingIOError:
+            return
+        except OSError:
+            self.close(connection)
+            return
+
+        if connection.send_buffers or connection.send_file is not None:
+            # 送りきれなかった分は次に書き込み可能になったときに送る
+            return
+
+        if connection.send_stream is not None:
+            # 次のチャンクを生成する
+            # 生成には時間がかかるかもしれないのでスレッドプールで行い、その間はこの接続への書き込みを待たない
+            self.selector.unregister(connection.client_socket)
+            future = self.executor.submit(next, connection.send_stream, None)
+            future.add_done_callback(lambda f: self.on_chunk(connection, f))
+            return
+
+        connection.send_buffers = None
+        if not connection.keep_alive:
+            # レスポンスを送り終えたら接続を閉じる
+            self.close(connection)
+            return
+
+        # 接続を維持する場合は次のリクエストを待つ
+        connection.last_active = time.monotonic()
+        self.selector.modify(connection.client_socket, selectors.EVENT_READ, connection)
+        self.idle_connections[connection] = None
+        # 既に次のリクエストを受信済みの場合はすぐに処理する
+        self.dispatch_request(connection)
+
+    def send_file(self, connection: Connection) -> None:
+        """
+        ファイルをsendfileで送信できるだけ送信する
+        送り終えた場合はファイルを閉じる
+        """
+        response = connection.send_file
+        while response.segments:
+            segment = response.segments[0]
+            # multipart/byterangesの区切りなど、ファイルの範囲の前に送るデータ
+            while segment.prefix:
+                sent = connection.client_socket.send(segment.prefix)
+                segment.prefix = segment.prefix[sent:]
+            while segment.size > 0:
+                sent = os.sendfile(connection.client_socket.fileno(), response.file.fileno(), segment.offset, segment.size)
+                if sent == 0:
+                    # ファイルが途中で短くなった
+                    raise OSError("file truncated while sending")
+                segment.offset += sent
+                segment.size -= sent
+            response.segments.pop(0)
+
+        response.close()
+        connection.send_file = None
+
+    def send_error(self, connection: Connection, status_code: int) -> None:
+        """
+        エラーレスポンスを送信して接続を閉じる
+        """
+        response = self.handler.build_error_response(status_code)
+        connection.send_buffers = [memoryview(self.handler.build_response_bytes(response, HTTPRequest()))]
+        connection.keep_alive = False
+        connection.recv_buffer.clear()
+
+        self.idle_connections.pop(connection, None)
+        self.selector.modify(connection.client_socket, selectors.EVENT_WRITE, connection)
+        self.on_writable(connection)
+
+    def close_idle_connections(self) -> None:
+        """
+        Keep-Aliveのタイムアウトまでにリクエストが届かなかった接続を閉じる
+        """
+        deadline = time.monotonic() - self.keep_alive_timeout
+        while self.idle_connections:
+            connection = next(iter(self.idle_connections))
+            if connection.last_active > deadline:
+                break
+            self.close(connection)
+
+    def close(self, connection: Connection) -> None:
+        self.idle_connections.pop(connection, None)
+        if connection.send_file is not None:
+            connection.send_file.close()
+            connection.send_file = None
+        if connection.send_stream is not None:
+            connection.send_stream.close()
+            connection.send_stream = None
+        self.release_stream_request(connection)
+        try:
+            self.selector.unregister(connection.client_socket)
+        except (KeyError, ValueError):
+            pass
+        connection.client_socket.close()
+
+    def release_stream_request(self, connection: Connection) -> None:
+        """
+        チャンクを生成し終わった(または途中で接続を閉じた)レスポンスのリクエストを解放する
+        """
+        if connection.stream_request is not None:
+            self.handler.release_request(connection.stream_request)
+            connection.stream_request = None
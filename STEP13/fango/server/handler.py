@@ -0,0 +1,322 @@
+import asyncio
+import importlib
+import inspect
+from concurrent.futures import Executor
+from functools import lru_cache
+from typing import AsyncIterator, Callable, Iterator, List, Optional, Tuple
+
+import settings
+from fango.http import parser, reader, serializer
+from fango.http.mime import MIME_TYPES, guess_content_type
+from fango.http.request import HTTPRequest, request_pool
+from fango.http.response import FileResponse, HTTPResponse, HeadResponse
+from fango.http.streaming import LAST_CHUNK, aiter_body, encode_chunk, iter_body
+from fango.server.capture import get_request_capture
+from fango.server.log import get_access_log
+from fango.urls.resolver import resolver
+
+# ミドルウェアはview関数が返したレスポンスを受け取り、加工したレスポンスを返す関数
+Middleware = Callable[[HTTPRequest, HTTPResponse], HTTPResponse]
+
+
+def advance_buffers(buffers: List[memoryview], sent: int) -> None:
+    """
+    sendmsgでsentバイト送信した後、送信済みの部分をbuffersの先頭から取り除く
+    """
+    while buffers and sent >= len(buffers[0]):
+        sent -= len(buffers.pop(0))
+    if sent:
+        buffers[0] = buffers[0][sent:]
+
+
+@lru_cache(maxsize=None)
+def load_middlewares() -> Tuple[Middleware, ...]:
+    """
+    settings.MIDDLEWAREに"モジュール名.関数名"で指定されたミドルウェアを読み込む
+    """
+    middlewares = []
+    for path in getattr(settings, "MIDDLEWARE", []):
+        module_name, _, function_name = path.rpartition(".")
+        middlewares.append(getattr(importlib.import_module(module_name), function_name))
+    return tuple(middlewares)
+
+
+class HTTPHandler:
+    """
+    HTTPリクエストのパース、view関数の呼び出し、レスポンスの組み立てを行う
+    どのサーバ実装(スレッド、イベントループ、asyncio)からも共通で使う
+    """
+
+    # 拡張子とMIME Typeの対応
+    MIME_TYPES = MIME_TYPES
+
+    # ステータスコードとステータスラインの対応
+    STATUS_LINES = {
+        200: "200 OK",
+        204: "204 No Content",
+        206: "206 Partial Content",
+        304: "304 Not Modified",
+        400: "400 Bad Request",
+        404: "404 Not Found",
+        405: "405 Method Not Allowed",
+        413: "413 Content Too Large",
+        416: "416 Range Not Satisfiable",
+        431: "431 Request Header Fields Too Large",
+        503: "503 Service Unavailable",
+    }
+
+    def find_request_end(self, buffer: bytes) -> Optional[int]:
+        """
+        バッファにリクエストが1つ分全て届いているか判定する
+        届いている場合はリクエストの終端の位置を返し、まだ届いていない場合はNoneを返す
+        """
+        # ボディの長さを調べるためだけにパースするので、プールのHTTPRequestは使わない
+        return reader.find_request_end(buffer, parser.parse_request_head)
+
+    @staticmethod
+    def get_header(request: HTTPRequest, name: str, default: str = None) -> Optional[str]:
+        """
+        ヘッダ名の大文字小文字を区別せずにリクエストヘッダの値を取得する
+        """
+        return request.get_header(name, default)
+
+    def should_keep_alive(self, request: HTTPRequest) -> bool:
+        """
+        レスポンスを返した後も接続を維持するか判定する
+        HTTP/1.1はConnection: closeが指定されない限り維持し、
+        HTTP/1.0はConnection: keep-aliveが指定された場合だけ維持する
+        """
+        connection = self.get_header(request, "Connection", "")
+        tokens = {token.strip().lower() for token in connection.split(",")}
+
+        if request.http_version == "HTTP/1.1":
+            return "close" not in tokens
+        elif request.http_version == "HTTP/1.0":
+            return "keep-alive" in tokens
+        return False
+
+    def remaining_requests(self, request: HTTPRequest, request_count: int) -> int:
+        """
+        request_count個目のリクエストを処理した後、同じ接続でさらに処理できるリクエスト数を返す
+        接続を維持しない場合は0を返す
+        """
+        if not self.should_keep_alive(request):
+            return 0
+        return max(getattr(settings, "KEEP_ALIVE_MAX_REQUESTS", 100) - request_count, 0)
+
+    def remaining_requests_after(self, request: HTTPRequest, response: HTTPResponse, remaining_requests: int) -> int:
+        """
+        レスポンスを送信した後も、同じ接続でremaining_requests個のリクエストを処理できるか確認する
+        接続を閉じる必要がある場合は0を返す
+        """
+        if not request.stream.received:
+            # viewがボディを読み切らなかった場合は、次のリクエストの位置がわからないので接続を閉じる
+            return 0
+        if response.is_streaming and not self.use_chunked(request):
+            # chunkedを使えない場合は、接続を閉じてボディの終わりを示す
+            return 0
+        return remaining_requests
+
+    @staticmethod
+    def use_chunked(request: HTTPRequest) -> bool:
+        """
+        ボディを少しずつ生成するレスポンスをTransfer-Encoding: chunkedで送信できるか
+        chunkedはHTTP/1.1から
+        """
+        return request.http_version == "HTTP/1.1"
+
+    def iter_response_chunks(self, response: HTTPResponse, request: HTTPRequest) -> Iterator[bytes]:
+        """
+        ボディを少しずつ生成するレスポンスの、送信するバイト列を順番に返す
+        """
+        chunked = self.use_chunked(request)
+        for chunk in iter_body(response.body):
+            # 空のチャンクは終端を意味するので送らない
+            if chunk:
+                yield encode_chunk(chunk) if chunked else chunk
+        if chunked:
+            yield LAST_CHUNK
+
+    async def aiter_response_chunks(
+        self, response: HTTPResponse, request: HTTPRequest, executor: Executor = None,
+    ) -> AsyncIterator[bytes]:
+        """
+        iter_response_chunksのasync版
+        """
+        chunked = self.use_chunked(request)
+        async for chunk in aiter_body(response.body, executor):
+            if chunk:
+                yield encode_chunk(chunk) if chunked else chunk
+        if chunked:
+            yield LAST_CHUNK
+
+    def parse_http_request(self, request: bytes) -> HTTPRequest:
+        # リクエスト全体を
+        # 1. リクエストライン・ヘッダ(1行目~空行)
+        # 2. リクエストボディ (空行~)
+        # に分けてパースする
+        header_end = request.index(b"\r\n\r\n") + 4
+        http_request = self.parse_request_head(request[:header_end])
+
+        request_body = request[header_end:]
+        _, chunked = reader.body_framing(http_request)
+        if chunked:
+            request_body = reader.decode_chunked(request_body)
+        http_request.body = request_body
+        return http_request
+
+    def parse_request_head(self, head: bytes) -> HTTPRequest:
+        # リクエストライン・ヘッダをパースする
+        # ヘッダは最初にアクセスされたときに解析される
+        # HTTPRequestは使い終わったものをプールから取り出して使い回す
+        return parser.parse_request_head(head, request_pool.acquire())
+
+    @staticmethod
+    def release_request(request: HTTPRequest) -> None:
+        """
+        レスポンスを送信し終わったリクエストをプールに戻す
+        """
+        request_pool.release(request)
+
+    def capture_request(self, head: bytes, body: bytes = b"") -> None:
+        """
+        REQUEST_CAPTURE_ENABLEDがTrueの場合、受信したデータをキャプチャする
+        Falseの場合は何もしない
+        """
+        request_capture = get_request_capture()
+        if request_capture is not None:
+            request_capture.capture(head, body)
+
+    def log_access(
+        self, request: HTTPRequest, response: HTTPResponse, address: Optional[Tuple[str, int]], started: float,
+    ) -> None:
+        """
+        ACCESS_LOG_ENABLEDがTrueの場合、アクセスログを書く
+        startedはリクエストの処理を始めたtime.monotonic()の値
+        """
+        access_log = get_access_log()
+        if access_log is not None:
+            access_log.log(request, response, address, started)
+
+    def build_error_response(self, status_code: int) -> HTTPResponse:
+        """
+        エラーのステータスコードに対応するレスポンスを生成する
+        """
+        body = f"<html><body><h1>{self.STATUS_LINES[status_code]}</h1></body></html>".encode()
+        return HTTPResponse(status_code=status_code, content_type="text/html; charset=UTF-8", body=body)
+
+    def handle_request(self, request: HTTPRequest) -> HTTPResponse:
+        """
+        URL解決してview関数を実行し、レスポンスを返す
+        """
+        view = resolver.resolve(request)
+
+        response = view(request)
+
+        # async defで定義されたviewの場合は、このスレッドでイベントループを回して完了を待つ
+        if inspect.isawaitable(response):
+            response = asyncio.run(response)
+
+        return self.prepare_response(request, response)
+
+    async def handle_request_async(self, request: HTTPRequest, executor: Executor = None) -> HTTPResponse:
+        """
+        イベントループ上でURL解決してview関数を実行し、レスポンスを返す
+        async defで定義されたviewはそのままawaitし、通常のviewはスレッドプールで実行する
+        """
+        view = resolver.resolve(request)
+
+        loop = asyncio.get_running_loop()
+        if inspect.iscoroutinefunction(view):
+            response = await view(request)
+        else:
+            response = await loop.run_in_executor(executor, view, request)
+
+        if load_middlewares():
+            # 圧縮などミドルウェアの処理はイベントループを止めないようにスレッドプールで行う
+            return await loop.run_in_executor(executor, self.prepare_response, request, response)
+        return self.prepare_response(request, response)
+
+    def prepare_response(self, request: HTTPRequest, response: HTTPResponse) -> HTTPResponse:
+        """
+        viewが返したレスポンスを送信できる形に整え、ミドルウェアを適用する
+        """
+        if isinstance(response.body, str):
+            response.body = response.body.encode()
+
+        for middleware in load_middlewares():
+            response = middleware(request, response)
+
+        if request.method == "HEAD":
+            # HEADはGETと同じヘッダを返すが、ボディは送信しない
+            self.discard_body(response)
+            response = HeadResponse(response)
+
+        return response
+
+    @staticmethod
+    def discard_body(response: HTTPResponse) -> None:
+        """
+        送信しないレスポンスのボディが持つファイルやイテレータを閉じる
+        """
+        if isinstance(response, FileResponse):
+            response.close()
+        elif response.is_streaming and hasattr(response.body, "close"):
+            response.body.close()
+
+    # ボディがこのサイズ以下の場合は、ヘッダと連結して1回で送信する
+    # 小さいボディはコピーする方が、送信を分けるより速い
+    COALESCE_BODY_SIZE = 16 * 1024
+
+    def build_response_buffers(
+        self, response: HTTPResponse, request: HTTPRequest, keep_alive: bool = False, remaining_requests: int = 0,
+    ) -> List[bytes]:
+        """
+        レスポンスを送信するバイト列のリストに変換する
+        大きなボディはヘッダと連結してコピーせず、[ヘッダ, ボディ]のように別のバイト列のまま返す
+        keep_aliveがTrueの場合は、レスポンスを返した後も接続を維持することをクライアントに伝える
+        FileResponseの場合はファイルの内容を含まないので、続けてファイルを送信する必要がある
+        ボディを少しずつ生成するレスポンスの場合も、続けてiter_response_chunksで送信する
+        """
+        response_head = self.build_response_head(response, request, keep_alive, remaining_requests)
+        if response.is_streaming or not response.body:
+            return [response_head]
+        if len(response.body) <= self.COALESCE_BODY_SIZE:
+            return [response_head + response.body]
+        return [response_head, response.body]
+
+    def build_response_bytes(
+        self, response: HTTPResponse, request: HTTPRequest, keep_alive: bool = False, remaining_requests: int = 0,
+    ) -> bytes:
+        """
+        レスポンスを1つのバイト列に変換する
+        ボディをコピーするので、エラーレスポンスなど小さいレスポンスに使う
+        """
+        return b"".join(self.build_response_buffers(response, request, keep_alive, remaining_requests))
+
+    def build_response_head(
+        self, response: HTTPResponse, request: HTTPRequest, keep_alive: bool = False, remaining_requests: int = 0,
+    ) -> bytes:
+        """
+        レスポンスラインからヘッダの終わりの空行までを構築する
+        Date・Server・Connectionなど毎回同じ行はバイト列にしたものを使い回し、1つのバイト列に連結する
+        """
+        # Content-Typeが指定されていない場合pathの拡張子から決める
+        if response.content_type is None:
+            response.content_type = guess_content_type(request.path)
+
+        # 204と304はボディを持たないので、ボディの長さや種類を示すヘッダは付けない
+        has_body = response.status_code not in (204, 304)
+        content_length = response.content_length if has_body else None
+        return serializer.build_response_head(
+            serializer.status_line(self.STATUS_LINES[response.status_code]),
+            response.headers,
+            serializer.server_header(getattr(settings, "SERVER_NAME", "FunaServer/0.1")),
+            response.content_type if has_body else None,
+            content_length,
+            # 長さがわからないのでchunkedで送る
+            # chunkedを使えない場合は、送信後に接続を閉じてボディの終わりを示す
+            has_body and content_length is None and response.is_streaming and self.use_chunked(request),
+            serializer.keep_alive_header(getattr(settings, "KEEP_ALIVE_TIMEOUT", 5)) if keep_alive else None,
+            remaining_requests,
+        )
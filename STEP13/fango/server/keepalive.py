@@ -0,0 +1,118 @@
+import queue
+import selectors
+import socket
+import time
+from threading import Thread
+from typing import Dict, Optional, Tuple
+
+from fango.http.reader import RequestReader
+from fango.server.log import get_logger
+
+
+class PooledConnection:
+    """
+    ワーカープールのキューで受け渡すクライアントとの接続
+    Keep-Aliveで次のリクエストを待つ間はIdleConnectionsに預けるので、受信済みのデータと処理したリクエスト数も持つ
+    """
+    __slots__ = ("client_socket", "address", "reader", "request_count", "idle_since")
+
+    def __init__(self, client_socket: socket.socket, address: Tuple[str, int]):
+        self.client_socket = client_socket
+        self.address = address
+        # 最初のリクエストを処理するワーカーが生成する
+        self.reader: Optional[RequestReader] = None
+        # この接続で処理したリクエスト数
+        self.request_count = 0
+        # IdleConnectionsに預けた時刻
+        self.idle_since = 0.0
+
+
+class IdleConnections(Thread):
+    """
+    Keep-Aliveで次のリクエストを待っている接続を預かり、selectorで監視するスレッド
+    ワーカーは次のリクエストが届くまでrecvでブロックせずに別の接続を処理できる
+    リクエストが届いた(読み込めるようになった)接続はワーカープールのキューに戻し、
+    timeout秒何も届かなかった接続は閉じる
+    """
+
+    def __init__(self, connection_queue: "queue.Queue[PooledConnection]", timeout: float):
+        super().__init__(daemon=True)
+        self.connection_queue = connection_queue
+        self.timeout = timeout
+        self.selector = selectors.DefaultSelector()
+
+        # 監視している接続
+        # 預けられた順(タイムアウトする順)に並べておき、タイムアウトした接続を先頭から閉じる
+        self.connections: Dict[PooledConnection, None] = {}
+
+        # ワーカーから預けられ、まだselectorに登録していない接続
+        self.parked: "queue.SimpleQueue[PooledConnection]" = queue.SimpleQueue()
+        # ワーカーからselectを起こすためのsocketペア
+        self.wakeup_reader, self.wakeup_writer = socket.socketpair()
+        self.wakeup_reader.setblocking(False)
+        self.wakeup_writer.setblocking(False)
+
+    def park(self, connection: PooledConnection) -> None:
+        """
+        ワーカーのスレッドから呼び出し、次のリクエストを待つ接続を預ける
+        """
+        connection.idle_since = time.monotonic()
+        self.parked.put(connection)
+        try:
+            self.wakeup_writer.send(b"\0")
+        except BlockingIOError:
+            # 既に起こすデータが溜まっている
+            pass
+
+    def run(self) -> None:
+        self.selector.register(self.wakeup_reader, selectors.EVENT_READ, None)
+        while True:
+            for key, _ in self.selector.select(timeout=1):
+                if key.data is None:
+                    self.on_wakeup()
+                else:
+                    self.resume(key.data)
+
+            self.close_idle_connections()
+
+    def on_wakeup(self) -> None:
+        try:
+            while self.wakeup_reader.recv(4096):
+                pass
+        except BlockingIOError:
+            pass
+
+        while True:
+            try:
+                connection = self.parked.get_nowait()
+            except queue.Empty:
+                return
+            self.selector.register(connection.client_socket, selectors.EVENT_READ, connection)
+            self.connections[connection] = None
+
+    def resume(self, connection: PooledConnection) -> None:
+        """
+        リクエストが届いた(またはクライアントが接続を閉じた)接続をワーカーに戻す
+        """
+        self.selector.unregister(connection.client_socket)
+        del self.connections[connection]
+        try:
+            self.connection_queue.put_nowait(connection)
+        except queue.Full:
+            # このスレッドはブロックできないので、キューが満杯の場合は接続を閉じる
+            get_logger().warning(f"IdleConnections: キューが満杯のため接続を閉じます remote_address: {connection.address}")
+            connection.client_socket.close()
+
+    def close_idle_connections(self) -> None:
+        """
+        タイムアウトまでに次のリクエストが来なかった接続を閉じる
+        """
+        deadline = time.monotonic() - self.timeout
+        while self.connections:
+            connection = next(iter(self.connections))
+            if connection.idle_since > deadline:
+                return
+            self.selector.unregister(connection.client_socket)
+            del self.connections[connection]
+            get_logger().debug(f"IdleConnections: Keep-Aliveがタイムアウトした接続を閉じます remote_address: {connection.address}")
+            connection.client_socket.close()
@@ -0,0 +1,316 @@
+import atexit
+import json
+import os
+import queue
+import random
+import sys
+import threading
+import time
+import traceback
+from typing import Any, BinaryIO, Callable, Optional, Tuple
+
+import settings
+from fango.http.request import HTTPRequest
+from fango.http.response import HTTPResponse
+
+# ログのレベル
+LEVELS = {"DEBUG": 10, "INFO": 20, "WARNING": 30, "ERROR": 40}
+
+
+class RotatingFile:
+    """
+    サイズが上限を超えたらpath.1, path.2, ...に名前を変えて新しいファイルに書き込む
+    backup_countより古いファイルは削除する
+    """
+
+    def __init__(self, path: str, max_size: int, backup_count: int):
+        self.path = path
+        self.max_size = max_size
+        self.backup_count = backup_count
+        self.file: Optional[BinaryIO] = None
+
+    def write(self, data: bytes) -> None:
+        if self.file is None:
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+            self.file = open(self.path, "ab")
+        if self.max_size and self.file.tell() and self.file.tell() + len(data) > self.max_size:
+            self.rotate()
+        self.file.write(data)
+
+    def rotate(self) -> None:
+        self.file.close()
+        for index in range(self.backup_count - 1, 0, -1):
+            source = f"{self.path}.{index}"
+            if os.path.exists(source):
+                os.replace(source, f"{self.path}.{index + 1}")
+        if self.backup_count > 0:
+            os.replace(self.path, f"{self.path}.1")
+        else:
+            os.remove(self.path)
+        self.file = open(self.path, "ab")
+
+    def flush(self) -> None:
+        if self.file is not None:
+            self.file.flush()
+
+
+class StreamFile:
+    """
+    標準出力・標準エラー出力にRotatingFileと同じ形で書き込む
+    """
+
+    def __init__(self, stream):
+        self.stream = stream
+
+    def write(self, data: bytes) -> None:
+        self.stream.buffer.write(data)
+
+    def flush(self) -> None:
+        self.stream.flush()
+
+
+class BatchWriter(threading.Thread):
+    """
+    キューに入れられたものをバックグラウンドでまとめてファイルに書き出すスレッド
+    書き出す形式への変換(format)もこのスレッドで行うので、キューに入れるスレッドは書き込みを待たない
+    キューが満杯の場合(書き込みが追いつかない場合)は書き出さずに捨てる
+    """
+
+    # 1回の書き込みでまとめて書き出す最大の数
+    BATCH_SIZE = 256
+
+    # キューに入れると書き出しスレッドを終了させる値
+    STOP = object()
+
+    def __init__(self, file, format: Callable[[Any], bytes], max_queue_size: int):
+        super().__init__(daemon=True)
+        self.file = file
+        self.format = format
+        self.max_queue_size = max_queue_size
+        # SimpleQueueはputでロックを待たない
+        self.queue: "queue.SimpleQueue[Any]" = queue.SimpleQueue()
+
+    def put(self, item: Any) -> None:
+        if self.max_queue_size and self.queue.qsize() >= self.max_queue_size:
+            return
+        self.queue.put(item)
+
+    def run(self) -> None:
+        while True:
+            batch = [self.queue.get()]
+            while len(batch) < self.BATCH_SIZE:
+                try:
+                    batch.append(self.queue.get_nowait())
+                except queue.Empty:
+                    break
+
+            stop = any(item is self.STOP for item in batch)
+            try:
+                self.file.write(b"".join(self.format(item) for item in batch if item is not self.STOP))
+                self.file.flush()
+            except Exception:
+                # ログの書き出しに失敗したことはログに書けないので標準エラー出力に出す
+                traceback.print_exc()
+            if stop:
+                return
+
+    def close(self, timeout: float = 1.0) -> None:
+        """
+        キューに残っているものを書き出してからスレッドを終了させる
+        """
+        if self.is_alive():
+            self.queue.put(self.STOP)
+            self.join(timeout)
+
+
+def open_log_file(path: Optional[str], stream) -> Any:
+    """
+    pathがNoneの場合はstreamに書き込む
+    """
+    if path is None:
+        return StreamFile(stream)
+    return RotatingFile(
+        path,
+        max_size=getattr(settings, "LOG_MAX_FILE_SIZE", 10 * 1024 * 1024),
+        backup_count=getattr(settings, "LOG_BACKUP_COUNT", 5),
+    )
+
+
+class Logger:
+    """
+    サーバの動作(起動・停止、エラーなど)のログ
+    levelより低いレベルのログは、メッセージを組み立てる前に捨てる
+    """
+
+    def __init__(self, writer: BatchWriter, level: int):
+        self.writer = writer
+        self.level = level
+
+    @staticmethod
+    def format(record: Tuple[float, str, str]) -> bytes:
+        created, level_name, message = record
+        timestamp = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(created))
+        return f"{timestamp} [{level_name}] {message}\n".encode()
+
+    def log(self, level_name: str, message: str) -> None:
+        if LEVELS[level_name] >= self.level:
+            self.writer.put((time.time(), level_name, message))
+
+    def debug(self, message: str) -> None:
+        self.log("DEBUG", message)
+
+    def info(self, message: str) -> None:
+        self.log("INFO", message)
+
+    def warning(self, message: str) -> None:
+        self.log("WARNING", message)
+
+    def error(self, message: str) -> None:
+        self.log("ERROR", message)
+
+    def exception(self, message: str) -> None:
+        """
+        処理中の例外のトレースバックを付けてERRORのログを書く
+        """
+        self.log("ERROR", f"{message}\n{traceback.format_exc().rstrip()}")
+
+
+class AccessLog:
+    """
+    リクエストごとのアクセスログ
+    formatは"common"(Common Log Format)、"combined"(Combined Log Format)、"json"(1行1つのJSON)のいずれか
+    sample_rateの割合のリクエストだけを記録する
+    """
+
+    # アクセスログの時刻の形式(例 18/Oct/2026:07:08:11 +0900)
+    TIME_FORMAT = "%d/%b/%Y:%H:%M:%S %z"
+
+    def __init__(self, writer: BatchWriter, format: str = "combined", sample_rate: float = 1.0):
+        if format not in ("common", "combined", "json"):
+            raise ValueError(f"unknown access log format: {format!r}")
+        self.writer = writer
+        self.format_name = format
+        self.sample_rate = sample_rate
+
+    def log(self, request: HTTPRequest, response: HTTPResponse, address: Optional[Tuple[str, int]], started: float) -> None:
+        """
+        リクエストを処理したスレッドから呼び出す
+        必要な値を取り出してキューに入れるだけで、文字列の組み立ては書き出しスレッドで行う
+        """
+        if self.sample_rate < 1.0 and random.random() >= self.sample_rate:
+            return
+        self.writer.put((
+            time.time(),
+            address[0] if address else "-",
+            request.method,
+            request.path,
+            request.http_version,
+            response.status_code,
+            response.content_length,
+            request.get_header("Referer"),
+            request.get_header("User-Agent"),
+            time.monotonic() - started,
+        ))
+
+    def format(self, record: tuple) -> bytes:
+        created, host, method, path, http_version, status_code, size, referer, user_agent, duration = record
+
+        if self.format_name == "json":
+            return json.dumps({
+                "time": created,
+                "remote_addr": host,
+                "method": method,
+                "path": path,
+                "protocol": http_version,
+                "status": status_code,
+                "bytes": size,
+                "referer": referer,
+                "user_agent": user_agent,
+                "duration_ms": round(duration * 1000, 3),
+            }, ensure_ascii=False).encode() + b"\n"
+
+        timestamp = time.strftime(self.TIME_FORMAT, time.localtime(created))
+        line = f'{host} - - [{timestamp}] "{method} {path} {http_version}" {status_code} {"-" if size is None else size}'
+        if self.format_name == "combined":
+            line += f' "{quote(referer)}" "{quote(user_agent)}"'
+        return line.encode("utf-8", "backslashreplace") + b"\n"
+
+
+def quote(value: Optional[str]) -> str:
+    if value is None:
+        return "-"
+    return value.replace("\\", "\\\\").replace('"', '\\"')
+
+
+# プロセスごとにログを書き出すスレッドを持つ
+# forkした子プロセスには親プロセスのスレッドは引き継がれないので、pidが変わったら生成し直す
+_logger: Optional[Logger] = None
+_access_log: Optional[AccessLog] = None
+_pid: Optional[int] = None
+_writers = []
+_lock = threading.Lock()
+
+
+def _setup() -> None:
+    global _logger, _access_log, _pid
+    with _lock:
+        if _pid == os.getpid():
+            return
+        _writers.clear()
+        max_queue_size = getattr(settings, "LOG_QUEUE_SIZE", 10000)
+
+        # 設定が不正な場合は、ログを書き出すスレッドを起動する前に例外を送出する
+        level = LEVELS[getattr(settings, "LOG_LEVEL", "INFO").upper()]
+        access_log = None
+        if getattr(settings, "ACCESS_LOG_ENABLED", True):
+            access_log = AccessLog(
+                None,
+                format=getattr(settings, "ACCESS_LOG_FORMAT", "combined"),
+                sample_rate=getattr(settings, "ACCESS_LOG_SAMPLE_RATE", 1.0),
+            )
+
+        writer = BatchWriter(open_log_file(getattr(settings, "LOG_FILE", None), sys.stderr), Logger.format, max_queue_size)
+        _logger = Logger(writer, level)
+        _writers.append(writer)
+
+        if access_log is not None:
+            access_log.writer = BatchWriter(
+                open_log_file(getattr(settings, "ACCESS_LOG_FILE", None), sys.stdout), access_log.format, max_queue_size,
+            )
+            _writers.append(access_log.writer)
+        _access_log = access_log
+
+        for writer in _writers:
+            writer.start()
+        _pid = os.getpid()
+
+
+def get_logger() -> Logger:
+    """
+    サーバの動作のログを返す
+    """
+    if _pid != os.getpid():
+        _setup()
+    return _logger
+
+
+def get_access_log() -> Optional[AccessLog]:
+    """
+    アクセスログを返す
+    ACCESS_LOG_ENABLEDがFalseの場合はNoneを返す
+    """
+    if _pid != os.getpid():
+        _setup()
+    return _access_log
+
+
+@atexit.register
+def flush_logs() -> None:
+    """
+    書き出していないログを全て書き出す
+    os._exitで終了する場合は、その前に呼び出す
+    """
+    if _pid != os.getpid():
+        return
+    for writer in _writers:
+        writer.close()
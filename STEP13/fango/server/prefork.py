@@ -0,0 +1,124 @@
+import os
+import signal
+import socket
+import time
+from typing import Dict, Optional, Type
+
+from fango.server.log import flush_logs, get_logger
+from fango.server.server import Server
+
+class PreforkServer:
+    """
+    複数のプロセスをforkしてリクエストを処理するマスタープロセス
+    子プロセスはそれぞれserver_classのサーバを動かし、
+    マスタープロセスは子プロセスを監視して異常終了したものを起動し直す
+    """
+
+    # 起動直後に終了した子プロセスを起動し直すまでの待ち時間(秒)
+    # 起動に失敗し続ける場合にforkを繰り返して負荷をかけないようにする
+    RESTART_INTERVAL = 1.0
+
+    def __init__(self, server_class: Type[Server], workers: int, reuse_port: bool = False):
+        """
+        reuse_portがFalseの場合は、マスタープロセスで生成したsocketを子プロセスが共有する
+        reuse_portがTrueの場合は、子プロセスがそれぞれSO_REUSEPORTを指定したsocketを生成する
+        """
+        self.server_class = server_class
+        self.workers = workers
+        self.reuse_port = reuse_port
+
+        self.server_socket: Optional[socket.socket] = None
+        # 子プロセスのpidと起動した時刻
+        self.children: Dict[int, float] = {}
+        self.stopping = False
+
+    def serve(self):
+        get_logger().info(f"サーバを起動します(prefork workers: {self.workers})")
+
+        signal.signal(signal.SIGTERM, self.stop)
+        signal.signal(signal.SIGINT, self.stop)
+
+        try:
+            if not self.reuse_port:
+                # 子プロセスに引き継ぐsocketを生成
+                self.server_socket = self.server_class().create_server_socket()
+
+            for _ in range(self.workers):
+                self.spawn()
+
+            self.supervise()
+
+        finally:
+            get_logger().info("Server: サーバを停止します")
+            self.stop_children()
+            if self.server_socket is not None:
+                self.server_socket.close()
+
+    def spawn(self) -> None:
+        """
+        子プロセスを1つforkしてサーバを動かす
+        """
+        pid = os.fork()
+        if pid != 0:
+            # マスタープロセス
+            self.children[pid] = time.monotonic()
+            return
+
+        # 子プロセス
+        # シグナルの扱いはデフォルトに戻し、マスタープロセスからのSIGTERMで終了する
+        signal.signal(signal.SIGTERM, signal.SIG_DFL)
+        signal.signal(signal.SIGINT, signal.SIG_IGN)
+        exit_code = 0
+        try:
+            server = self.server_class()
+            if self.reuse_port:
+                server.serve(server.create_server_socket(reuse_port=True))
+            else:
+                server.serve(self.server_socket)
+        except BaseException:
+            get_logger().exception("PreforkServer: 子プロセスが異常終了しました")
+            exit_code = 1
+        finally:
+            # マスタープロセスから引き継いだ後始末の処理を実行しないように即座に終了する
+            # os._exitではatexitが呼ばれないので、書き出していないログはここで書き出す
+            flush_logs()
+            os._exit(exit_code)
+
+    def supervise(self) -> None:
+        """
+        子プロセスの終了を待ち、停止中でなければ起動し直す
+        """
+        while not self.stopping:
+            try:
+                pid, status = os.wait()
+            except ChildProcessError:
+                return
+            except InterruptedError:
+                continue
+
+            started_at = self.children.pop(pid, None)
+            if started_at is None or self.stopping:
+                continue
+
+            get_logger().warning(f"PreforkServer: 子プロセスが終了したため起動し直します pid: {pid} status: {status}")
+            if time.monotonic() - started_at < self.RESTART_INTERVAL:
+                time.sleep(self.RESTART_INTERVAL)
+            self.spawn()
+
+    def stop(self, signum: int, frame) -> None:
+        self.stopping = True
+        self.stop_children()
+
+    def stop_children(self) -> None:
+        for pid in list(self.children):
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                self.children.pop(pid, None)
+
+        while self.children:
+            try:
+                pid, _ = os.wait()
+            except ChildProcessError:
+                break
+            self.children.pop(pid, None)
@@ -1,37 +1,104 @@
 import socket
+from queue import Full, Queue
+from typing import Optional, Tuple
 
+import settings
+from fango.server.keepalive import IdleConnections, PooledConnection
+from fango.server.log import get_logger
 from fango.server.worker import Worker
 
 class Server:
-    def create_server_socket(self) -> socket:
+    # ワーカーが全て埋まっていてキューも満杯の場合に即座に返すレスポンス
+    SERVICE_UNAVAILABLE_RESPONSE = (
+        b"HTTP/1.1 503 Service Unavailable\r\n"
+        b"Content-Type: text/html; charset=UTF-8\r\n"
+        b"Content-Length: 58\r\n"
+        b"Retry-After: 1\r\n"
+        b"Connection: Close\r\n"
+        b"\r\n"
+        b"<html><body><h1>503 Service Unavailable</h1></body></html>"
+    )
+
+    connection_queue: Optional["Queue[PooledConnection]"] = None
+
+    def create_server_socket(self, reuse_port: bool = False) -> socket:
         # 通信を待ち受けるためのserver_socketを生成
         # socket生成
         server_socket = socket.socket()
         server_socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        if reuse_port:
+            # 複数のプロセスがそれぞれ同じポートにbindし、カーネルに接続を振り分けさせる
+            server_socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
 
         # socketをlocalhostのポート8080に割り当てる
         server_socket.bind(("localhost", 8080))
-        server_socket.listen(10)
+        server_socket.listen(getattr(settings, "LISTEN_BACKLOG", 10))
         return server_socket
 
+    def start_worker_pool(self) -> None:
+        """
+        設定されたスレッド数のワーカーを起動しておき、接続はキュー経由で渡す
+        Keep-Aliveで次のリクエストを待つ接続はIdleConnectionsに預け、ワーカーを占有させない
+        WORKER_POOL_SIZEが0の場合は何もしない(接続ごとにスレッドを生成する)
+        """
+        pool_size = getattr(settings, "WORKER_POOL_SIZE", 0)
+        if pool_size <= 0:
+            return
+
+        self.connection_queue = Queue(maxsize=getattr(settings, "WORKER_QUEUE_SIZE", 0))
+        idle_connections = IdleConnections(self.connection_queue, getattr(settings, "KEEP_ALIVE_TIMEOUT", 5))
+        idle_connections.start()
+        for _ in range(pool_size):
+            Worker(connection_queue=self.connection_queue, idle_connections=idle_connections).start()
 
-    def serve(self):
-        print("=== サーバを起動します ===")
+    def dispatch(self, client_socket: socket.socket, address: Tuple[str, int]) -> None:
+        """
+        接続をワーカーに渡す
+        """
+        if self.connection_queue is None:
+            # クライアントを処理するスレッド作成
+            thread = Worker(client_socket, address)
+            # スレッドを実行
+            thread.start()
+            return
+
+        try:
+            self.connection_queue.put_nowait(PooledConnection(client_socket, address))
+        except Full:
+            # キューが満杯の場合はリクエストを読まずに503を返して接続を閉じる
+            get_logger().warning(f"Server: キューが満杯のため接続を拒否します remote_address: {address}")
+            self.reject(client_socket)
+
+    def reject(self, client_socket: socket.socket) -> None:
+        try:
+            # 受け付けスレッドを止めないように、送信でブロックし続けないようにする
+            client_socket.settimeout(1)
+            client_socket.sendall(self.SERVICE_UNAVAILABLE_RESPONSE)
+        except OSError:
+            pass
+        finally:
+            client_socket.close()
+
+    def serve(self, server_socket: socket.socket = None):
+        """
+        server_socketを指定した場合は、新しくsocketを生成せずにそのsocketで接続を待ち受ける
+        """
+        get_logger().info("サーバを起動します")
 
         try:
             # socket生成
-            server_socket = self.create_server_socket()
+            if server_socket is None:
+                server_socket = self.create_server_socket()
+
+            # ワーカースレッドを起動しておく
+            self.start_worker_pool()
 
             while True:
                 # 外部からの接続を待ちコネクションを確立
-                print("=== クライアントからの接続を待ちます ===")
                 (client_socket, address) = server_socket.accept()
-                print(f"=== クライアントとの接続が完了しました remote_address: {address} ===")
+                get_logger().debug(f"クライアントとの接続が完了しました remote_address: {address}")
+
+                self.dispatch(client_socket, address)
 
-                # クライアントを処理するスレッド作成
-                thread = Worker(client_socket, address)
-                # スレッドを実行
-                thread.start()
-        
         finally:
-            print("=== Server: サーバを停止します ===")
\ No newline at end of file
+            get_logger().info("Server: サーバを停止します")
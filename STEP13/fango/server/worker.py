@@ -1,131 +1,263 @@
-import re
-import traceback
-from datetime import datetime
-from re import Match
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from functools import partial
 from socket import socket
+from queue import Queue
 from threading import Thread
-from typing import Tuple, Optional
-from fango.urls.resolver import URLResolver
+from typing import Iterator, List, Tuple, Optional
 
+import settings
+from fango.http import parser
+from fango.http.errors import HTTPError
+from fango.http.reader import RequestReader, SocketBodyStream, body_framing
 from fango.http.request import HTTPRequest
-from fango.http.response import HTTPResponse
+from fango.http.response import FileResponse, HTTPResponse
+from fango.server.handler import HTTPHandler, advance_buffers
+from fango.server.keepalive import IdleConnections, PooledConnection
+from fango.server.log import get_logger
 
-class Worker(Thread):
+# パイプライニングで届いた複数のリクエストを並行に処理するスレッドプール
+# スレッドは最初に使われたときに生成される
+pipeline_executor = ThreadPoolExecutor(max_workers=getattr(settings, "PIPELINE_EXECUTOR_SIZE", 8))
 
-    # 拡張子とMIME Typeの対応
-    MIME_TYPES = {
-        "html": "text/html; charset=UTF-8",
-        "css": "text/css",
-        "png": "image/png",
-        "jpg": "image/jpg",
-        "gif": "image/gif",
-    }
+class Worker(HTTPHandler, Thread):
 
-    # ステータスコードとステータスラインの対応
-    STATUS_LINES = {
-        200: "200 OK",
-        404: "404 Not Found",
-        405: "405 Method Not Allowed",
-    }
-
-    def __init__(self, client_socket: socket, address: Tuple[str, int]):
-        super().__init__()
+    def __init__(
+        self, client_socket: socket = None, address: Tuple[str, int] = None,
+        connection_queue: "Queue[PooledConnection]" = None, idle_connections: IdleConnections = None,
+    ):
+        """
+        client_socketを指定した場合はその接続を1つだけ処理して終了する
+        connection_queueを指定した場合はプールのワーカーとして、キューから接続を取り出して処理し続ける
+        idle_connectionsを指定した場合は、Keep-Aliveで次のリクエストを待つ接続をそこに預ける
+        """
+        super().__init__(daemon=connection_queue is not None)
 
         self.client_socket = client_socket
         self.client_address = address
+        self.connection_queue = connection_queue
+        self.idle_connections = idle_connections
 
     def run(self) -> None:
+        if self.connection_queue is None:
+            self.handle_client(PooledConnection(self.client_socket, self.client_address))
+            return
+
+        # プールのワーカーとしてスレッドを使い回し、キューに来た接続を順番に処理する
+        while True:
+            connection = self.connection_queue.get()
+            self.client_socket, self.client_address = connection.client_socket, connection.address
+            try:
+                self.handle_client(connection)
+            except Exception:
+                # どんな例外が発生してもスレッドを終了させず、次の接続を処理する
+                get_logger().exception(f"Worker: 接続の処理中にエラーが発生しました remote_address: {self.client_address}")
+            finally:
+                self.connection_queue.task_done()
+
+    def handle_client(self, connection: PooledConnection) -> None:
         # クライアントと接続済みのsocketを受け取りリクエスト処理してレスポンスを送信する
+        # Keep-Aliveの場合は同じ接続で次のリクエストを待ち、繰り返し処理する
+        # IdleConnectionsに預けた接続は、次のリクエストが届くと別のワーカーがこのメソッドで続きを処理する
+        parked = False
         try:
-            # クライアントから送られてきたデータをバッファから取得
-            request_bytes = self.client_socket.recv(4096)
+            if connection.reader is None:
+                # 一定時間リクエストが来なかった場合は接続を閉じる
+                self.client_socket.settimeout(getattr(settings, "KEEP_ALIVE_TIMEOUT", 5))
+                # 受信したがまだ処理していないデータは、次のリクエストとしてreaderに残る
+                connection.reader = RequestReader(self.client_socket)
+            reader = connection.reader
+            request_count = connection.request_count
+            while True:
+                # クライアントから送られてきたリクエストを取得
+                # パイプライニングで複数のリクエストがまとめて届いている場合は全て取得する
+                requests = self.receive_requests(reader, request_count)
+                if not requests:
+                    # クライアントが接続を閉じた
+                    break
+                request_count += len(requests)
+                started = time.monotonic()
+
+                # レスポンスはリクエストの順番通りに返す
+                keep_alive = False
+                responses = self.handle_requests(requests)
+                try:
+                    for (request, remaining_requests), response in zip(requests, responses):
+                        remaining_requests = self.remaining_requests_after(request, response, remaining_requests)
+                        keep_alive = remaining_requests > 0
+                        self.send_response(response, request, keep_alive, remaining_requests)
+                        self.log_access(request, response, self.client_address, started)
+                        self.release_request(request)
+                        if not keep_alive:
+                            # 接続を閉じることを伝えたレスポンス(ボディの終わりを接続を閉じて示すものを含む)の後には
+                            # 何も送信できないので、残りのリクエストは処理せずに捨てる
+                            # (残りのリクエストはhandle_requestsが処理の終わった後に解放する)
+                            break
+                finally:
+                    responses.close()
+
+                if not keep_alive:
+                    break
+
+                if self.idle_connections is not None and not reader.buffered_size():
+                    # 次のリクエストがまだ届いていないので、届くまでは接続を預けて別の接続を処理する
+                    connection.request_count = request_count
+                    self.idle_connections.park(connection)
+                    parked = True
+                    return
 
-            # クライアントから送られてきたデータをファイルに書き出す
-            with open("server_recv.txt", "wb") as f:
-                f.write(request_bytes)
+        except TimeoutError:
+            # Keep-Aliveのタイムアウトまでに次のリクエストが来なかった
+            pass
 
-            # HTTPリクエストをパースする
-            request = self.parse_http_request(request_bytes)
+        except HTTPError as e:
+            # リクエストが不正な場合はエラーレスポンスを返して接続を閉じる
+            get_logger().warning(f"Worker: 不正なリクエストを受信しました {e} remote_address: {self.client_address}")
+            response = self.build_error_response(e.status_code)
+            try:
+                self.client_socket.sendall(self.build_response_bytes(response, HTTPRequest()))
+            except OSError:
+                # クライアントが既に接続を切断していた
+                get_logger().debug(f"Worker: エラーレスポンスを送信できませんでした remote_address: {self.client_address}")
 
-            view = URLResolver().resolve(request)
+        except Exception:
+            # リクエストを処理中に例外が発生した場合エラーログを出力し
+            # 処理を続行する
+            get_logger().exception(f"Worker: リクエストの処理中にエラーが発生しました remote_address: {self.client_address}")
+
+        finally:
+            # 例外が発生してもしなくても通信のcloseをする(IdleConnectionsに預けた場合を除く)
+            if not parked:
+                get_logger().debug(f"Worker: クライアントとの接続を終了します remote_address: {self.client_address}")
+                self.client_socket.close()
 
-            response = view(request)
+    def receive_requests(self, reader: RequestReader, request_count: int) -> List[Tuple[HTTPRequest, int]]:
+        """
+        リクエストが1つ届くまで受信し、
+        (リクエスト, その後同じ接続で処理できるリクエスト数)のリストを返す
+        パイプライニングで続くリクエストも受信済みの場合は、それらもまとめて返す
+        クライアントが接続を閉じた場合は空のリストを返す
+        """
+        max_requests = getattr(settings, "PIPELINE_MAX_DEPTH", 16)
 
-            if isinstance(response.body, str):
-                response.body = response.body.encode()
+        requests = []
+        request = self.read_request(reader)
+        while request is not None:
+            request_count += 1
+            remaining_requests = self.remaining_requests(request, request_count)
+            requests.append((request, remaining_requests))
 
-            response_line = self.build_response_line(response)
+            if remaining_requests == 0:
+                # 接続を閉じるリクエストより後のリクエストは処理しない
+                break
+            if not request.stream.received:
+                # ボディをストリームで読み込むリクエストの後ろには、まだボディの残りが届く
+                break
+            if len(requests) >= max_requests or not reader.has_complete_request(parser.parse_request_head):
+                break
+            request = self.read_request(reader)
 
-            response_header = self.build_response_header(response, request)
+        return requests
 
-            response_bytes = (response_line + response_header + "\r\n").encode() + response.body
+    def read_request(self, reader: RequestReader) -> Optional[HTTPRequest]:
+        """
+        リクエストを1つ読み込んでパースする
+        リクエストの読み込みを始める前にクライアントが接続を閉じた場合はNoneを返す
+        """
+        # リクエストライン・ヘッダを読み込んでパースする
+        request_head = reader.read_head()
+        if request_head is None:
+            return None
+        request = self.parse_request_head(request_head)
 
-            self.client_socket.send(response_bytes)
+        # ボディの長さはContent-LengthかTransfer-Encoding: chunkedで決まる
+        content_length, chunked = body_framing(request)
+        if not chunked and reader.buffered_size() >= content_length:
+            # ボディが既に全て届いている場合はそのまま読み込む
+            request.body = reader.read_exact(content_length)
+        else:
+            # まだ届いていない場合は、viewが読み込むときに必要な分だけ受信する
+            if self.get_header(request, "Expect", "").lower() == "100-continue":
+                # クライアントがボディの送信前に確認を待っている
+                self.client_socket.sendall(b"HTTP/1.1 100 Continue\r\n\r\n")
+            request.stream = SocketBodyStream(reader, content_length, chunked)
 
+        # クライアントから送られてきたデータをキャプチャする
+        # ボディをストリームで読み込む場合はリクエストライン・ヘッダのみ
+        self.capture_request(request_head, request.body if request.stream.received else b"")
 
-        except Exception:
-            # リクエストを処理中に例外が発生した場合コンソールにエラーログ出力し
-            # 処理を続行する
-            print("=== Worker: リクエストの処理中にエラーが発生しました ===")
-            traceback.print_exc()
+        return request
 
+    def handle_requests(self, requests: List[Tuple[HTTPRequest, int]]) -> Iterator[HTTPResponse]:
+        """
+        リクエストを処理し、リクエストの順番通りにレスポンスを返す
+        パイプライニングで複数のリクエストが届いた場合は、view関数をスレッドプールで並行に実行する
+        """
+        if len(requests) == 1:
+            yield self.handle_request(requests[0][0])
+            return
+
+        futures = [pipeline_executor.submit(self.handle_request, request) for request, _ in requests]
+        sent = 0
+        try:
+            for future in futures:
+                yield future.result()
+                sent += 1
         finally:
-            # 例外が発生してもしなくても通信のcloseをする
-            print(f"=== Worker: クライアントとの接続を終了します remote_address: {self.client_address} ===")
-            self.client_socket.close()
-
-    def parse_http_request(self, request: bytes) -> HTTPRequest:
-        # リクエスト全体を
-        # 1. リクエストライン(1行目)
-        # 2. リクエストヘッダ(2~空行)
-        # 3. リクエストボディ (空行~)
-        # にパースする
-        request_line, remain = request.split(b"\r\n", maxsplit=1)
-        request_header, request_body = remain.split(b"\r\n\r\n", maxsplit=1)
-
-        # リクエストラインをパースする(例 GET / HTTP/1.1)
-        method, path, http_version = request_line.decode().split(" ")
-
-        # リクエストヘッダを辞書にパースする
-        headers = {}
-        for header_row in request_header.decode().split("\r\n"):
-            key, value = re.split(r": *", header_row, maxsplit=1)
-            headers[key] = value
-        return HTTPRequest(method=method, path=path, http_version=http_version, headers=headers, body=request_body)
-
-
-    def build_response_line(self, response: HTTPResponse) -> str:
-        # レスポンスラインを構築する
-        status_line = self.STATUS_LINES[response.status_code]
-        return f"HTTP/1.1 {status_line}"
-
-    def build_response_header(self, response: HTTPResponse, request: HTTPRequest) -> str:
-        # レスポンスヘッダを構築する
-        # Content-Typeが指定されていない場合path
-        # pathから拡張子を取得
-        if response.content_type is None:
-            if "." in request.path:
-                ext = request.path.rsplit(".", maxsplit=1)[-1]
-                # 拡張子からMIME Typeを取得
-                # 知らない対応していない拡張子の場合はoctet-streamとする
-                response.content_type = self.MIME_TYPES.get(ext, "application/octet-stream")
-            else:
-                # pathに拡張子がない場合はhtml扱いとする
-                response.content_type = "text/html; charset=UTF-8"
-
-        
-        # レスポンスヘッダを生成
-        response_header = ""
-        response_header += f"Date: {datetime.utcnow().strftime('%a, %d %b %Y %H:%M:%S GMT')}\r\n"
-        response_header += "Host: FunaServer/0.1\r\n"
-        response_header += f"Content-Length: {len(response.body)}\r\n"
-        response_header += "Connection: Close\r\n"
-        response_header += f"Content-Type: {response.content_type}\r\n"
-
-        return response_header
-
-    def url_match(self, url_pattern: str, path: str) -> Optional[Match]:
-        # URLパターンを正規表現パターンに変化する
-        # '/user/<user_id>/profile' => '/user/(?P<user_id>[^/]+)/profile'
-        re_pattern = re.sub(r"<(.+?)>", r"(?P<\1>[^/]+)", url_pattern)
-        return re.match(re_pattern, path)
\ No newline at end of file
+            # 途中で送信に失敗した・接続を閉じることになった場合は、まだ始まっていない処理を取り消し、
+            # 既に始まっている処理のレスポンスは送信しないのでファイルやイテレータを閉じる
+            # リクエストはviewが使い終わってから解放する(処理中に再利用されないようにする)
+            for future, (request, _) in zip(futures[sent + 1:], requests[sent + 1:]):
+                if future.cancel():
+                    self.release_request(request)
+                else:
+                    future.add_done_callback(partial(self.discard_result, request))
+
+    def discard_result(self, request: HTTPRequest, future: Future) -> None:
+        if not future.cancelled() and future.exception() is None:
+            self.discard_body(future.result())
+        self.release_request(request)
+
+    def send_response(self, response: HTTPResponse, request: HTTPRequest, keep_alive: bool, remaining_requests: int) -> None:
+        """
+        レスポンスを送信する
+        FileResponseの場合はヘッダを送信した後、ファイルをsendfileで送信する
+        ボディを少しずつ生成するレスポンスの場合は、チャンクが生成されるたびに送信する
+        """
+        response_buffers = self.build_response_buffers(response, request, keep_alive, remaining_requests)
+
+        if response.is_streaming:
+            self.send_buffers(response_buffers)
+            chunks = self.iter_response_chunks(response, request)
+            try:
+                for chunk in chunks:
+                    self.client_socket.sendall(chunk)
+            finally:
+                chunks.close()
+            return
+
+        if not isinstance(response, FileResponse):
+            self.send_buffers(response_buffers)
+            return
+
+        try:
+            self.send_buffers(response_buffers)
+            for segment in response.segments:
+                if segment.prefix:
+                    self.client_socket.sendall(segment.prefix)
+                if segment.size:
+                    self.client_socket.sendfile(response.file, segment.offset, segment.size)
+        finally:
+            response.close()
+
+    def send_buffers(self, buffers: List[bytes]) -> None:
+        """
+        複数のバイト列を連結せずに、sendmsgでまとめて送信する
+        """
+        if len(buffers) == 1:
+            self.client_socket.sendall(buffers[0])
+            return
+
+        views = [memoryview(buffer) for buffer in buffers]
+        while views:
+            advance_buffers(views, self.client_socket.sendmsg(views))
@@ -0,0 +1,284 @@
+import ast
+import builtins
+import html
+import os
+import re
+import threading
+from typing import Dict, Iterator, List, Optional, Set
+
+import settings
+
+# テンプレートの構文
+# {{ 式 }}       式の値をHTMLエスケープして出力する({{ 式|safe }}の場合はエスケープしない)
+# {% for 変数 in 式 %} ... {% endfor %}
+# {% if 式 %} ... {% elif 式 %} ... {% else %} ... {% endif %}
+# {% include "テンプレート名" %}
+# {# コメント #}
+TOKEN_PATTERN = re.compile(r"({{.*?}}|{%.*?%}|{#.*?#})", re.DOTALL)
+SAFE_FILTER_PATTERN = re.compile(r"\|\s*safe\s*$")
+
+
+class TemplateSyntaxError(Exception):
+    """
+    テンプレートの構文が不正
+    """
+
+    def __init__(self, message: str, name: str, line: int):
+        super().__init__(f"{message} ({name}:{line})")
+
+
+class Markup(str):
+    """
+    エスケープせずにそのまま出力する文字列
+    """
+
+
+class Undefined:
+    """
+    コンテキストに存在しない変数の値
+    空文字として出力され、偽として扱われ、ループでは空のシーケンスとして扱われる
+    """
+
+    def __str__(self) -> str:
+        return ""
+
+    def __bool__(self) -> bool:
+        return False
+
+    def __iter__(self):
+        return iter(())
+
+
+UNDEFINED = Undefined()
+
+
+def escape(value) -> str:
+    """
+    値を文字列にしてHTMLエスケープする
+    Markupの場合はそのまま返す
+    """
+    if isinstance(value, Markup):
+        return value
+    return html.escape(str(value))
+
+
+class CodeGenerator:
+    """
+    テンプレートのソースを、出力する文字列を順番にyieldするPythonのジェネレータ関数のソースに変換する
+    """
+
+    def __init__(self, source: str, name: str):
+        self.source = source
+        self.name = name
+        self.lines: List[str] = []
+        self.indent = 1
+        # 閉じていないブロック(for, if)の種類
+        self.blocks: List[str] = []
+        # ブロックの中身が空でないか
+        self.block_has_body: List[bool] = []
+        # forで束縛している変数(includeしたテンプレートにも渡す)
+        self.loop_variables: List[Set[str]] = []
+        # テンプレートの式で参照している変数
+        self.names: Set[str] = set()
+        self.line_number = 1
+
+    def error(self, message: str) -> TemplateSyntaxError:
+        return TemplateSyntaxError(message, self.name, self.line_number)
+
+    def emit(self, code: str) -> None:
+        self.lines.append("    " * self.indent + code)
+        if self.block_has_body:
+            self.block_has_body[-1] = True
+
+    def parse_expression(self, expression: str) -> str:
+        """
+        式の構文を確認し、参照している変数を記録する
+        """
+        try:
+            tree = ast.parse(expression.strip(), mode="eval")
+        except SyntaxError:
+            raise self.error(f"invalid expression: {expression.strip()!r}")
+        self.collect_names(tree)
+        return expression.strip()
+
+    def collect_names(self, tree: ast.AST) -> None:
+        for node in ast.walk(tree):
+            if isinstance(node, ast.Name) and isinstance(node.ctx, ast.Load):
+                self.names.add(node.id)
+
+    def open_block(self, kind: str) -> None:
+        self.blocks.append(kind)
+        self.block_has_body.append(False)
+        self.indent += 1
+
+    def close_block(self, kind: str) -> None:
+        if not self.blocks or self.blocks[-1] != kind:
+            raise self.error(f"unexpected end{kind}")
+        if not self.block_has_body.pop():
+            self.lines.append("    " * self.indent + "pass")
+        self.blocks.pop()
+        self.indent -= 1
+
+    def generate(self) -> str:
+        for token in TOKEN_PATTERN.split(self.source):
+            if not token:
+                continue
+
+            if token.startswith("{{"):
+                self.generate_output(token[2:-2])
+            elif token.startswith("{%"):
+                self.generate_statement(token[2:-2].strip())
+            elif token.startswith("{#"):
+                pass
+            else:
+                self.emit(f"yield {token!r}")
+            self.line_number += token.count("\n")
+
+        if self.blocks:
+            raise self.error(f"unclosed {self.blocks[-1]}")
+
+        # 参照している変数は、最初にコンテキストからローカル変数に取り出しておく
+        # 存在しない変数は組み込み関数かUndefinedになる
+        header = ["def render(_context):"]
+        for name in sorted(self.names):
+            if name.startswith("_"):
+                raise TemplateSyntaxError(f"variable names must not start with '_': {name}", self.name, 1)
+            default = f"_builtins.{name}" if hasattr(builtins, name) else "_undefined"
+            header.append(f"    {name} = _context.get({name!r}, {default})")
+        # 何も出力しないテンプレートでもジェネレータ関数にする
+        header.append("    if False:\n        yield ''")
+        return "\n".join(header + self.lines) + "\n"
+
+    def generate_output(self, expression: str) -> None:
+        if SAFE_FILTER_PATTERN.search(expression):
+            expression = SAFE_FILTER_PATTERN.sub("", expression)
+            self.emit(f"yield _str({self.parse_expression(expression)})")
+        else:
+            self.emit(f"yield _escape({self.parse_expression(expression)})")
+
+    def generate_statement(self, statement: str) -> None:
+        keyword, _, argument = statement.partition(" ")
+        keyword, argument = keyword.strip(), argument.strip()
+
+        if keyword == "for":
+            target, separator, iterable = argument.partition(" in ")
+            if not separator:
+                raise self.error(f"invalid for statement: {statement!r}")
+            try:
+                target_tree = ast.parse(f"{target.strip()} = None").body[0].targets[0]
+            except (SyntaxError, AttributeError, IndexError):
+                raise self.error(f"invalid for target: {target.strip()!r}")
+            self.emit(f"for {target.strip()} in {self.parse_expression(iterable)}:")
+            self.open_block("for")
+            self.loop_variables.append({
+                node.id for node in ast.walk(target_tree) if isinstance(node, ast.Name)
+            })
+        elif keyword == "endfor":
+            self.close_block("for")
+            self.loop_variables.pop()
+        elif keyword == "if":
+            self.emit(f"if {self.parse_expression(argument)}:")
+            self.open_block("if")
+        elif keyword in ("elif", "else"):
+            if not self.blocks or self.blocks[-1] != "if":
+                raise self.error(f"unexpected {keyword}")
+            self.close_block("if")
+            if keyword == "elif":
+                self.emit(f"elif {self.parse_expression(argument)}:")
+            else:
+                self.emit("else:")
+            self.open_block("if")
+        elif keyword == "endif":
+            self.close_block("if")
+        elif keyword == "include":
+            # includeしたテンプレートには、コンテキストにforの変数を加えて渡す
+            variables = sorted(set().union(*self.loop_variables)) if self.loop_variables else []
+            context = "{**_context" + "".join(f", {name!r}: {name}" for name in variables) + "}"
+            self.emit(f"yield from _include({self.parse_expression(argument)}, {context})")
+        else:
+            raise self.error(f"unknown tag: {keyword!r}")
+
+
+class Template:
+    """
+    コンパイル済みのテンプレート
+    """
+
+    def __init__(self, source: str, name: str, loader: "TemplateLoader" = None, mtime_ns: int = 0):
+        self.name = name
+        self.loader = loader
+        self.mtime_ns = mtime_ns
+
+        code = compile(CodeGenerator(source, name).generate(), name, "exec")
+        namespace = {
+            "_escape": escape,
+            "_str": str,
+            "_include": self.include,
+            "_undefined": UNDEFINED,
+            "_builtins": builtins,
+        }
+        exec(code, namespace)
+        self.function = namespace["render"]
+
+    def include(self, name: str, context: dict) -> Iterator[str]:
+        if self.loader is None:
+            raise LookupError(f"cannot include {name!r} without a loader")
+        return self.loader.get_template(name).generate(context)
+
+    def generate(self, context: dict) -> Iterator[str]:
+        """
+        テンプレートを評価し、出力する文字列を順番に返す
+        """
+        return self.function(context)
+
+    def render(self, context: dict) -> str:
+        return "".join(self.generate(context))
+
+
+class TemplateLoader:
+    """
+    ディレクトリからテンプレートを読み込み、コンパイルした結果をキャッシュする
+    auto_reloadがTrueの場合は、使うたびにファイルの更新日時を確認し、変更されていればコンパイルし直す
+    Falseの場合は一度コンパイルしたテンプレートはファイルを確認せずに使い続ける
+    """
+
+    def __init__(self, directory: str, auto_reload: bool = False):
+        self.directory = directory
+        self.auto_reload = auto_reload
+        self.lock = threading.Lock()
+        self.templates: Dict[str, Template] = {}
+
+    def get_template(self, name: str) -> Template:
+        template = self.templates.get(name)
+        if template is not None and not self.auto_reload:
+            return template
+
+        path = os.path.join(self.directory, name)
+        if template is not None and os.stat(path).st_mtime_ns == template.mtime_ns:
+            return template
+
+        with self.lock:
+            with open(path, encoding="utf-8") as f:
+                mtime_ns = os.fstat(f.fileno()).st_mtime_ns
+                source = f.read()
+            template = Template(source, name, self, mtime_ns)
+            self.templates[name] = template
+        return template
+
+
+_loader: Optional[TemplateLoader] = None
+_loader_lock = threading.Lock()
+
+
+def get_loader() -> TemplateLoader:
+    """
+    TEMPLATES_DIRのテンプレートを読み込むローダーを返す
+    """
+    global _loader
+    if _loader is None:
+        with _loader_lock:
+            if _loader is None:
+                _loader = TemplateLoader(
+                    settings.TEMPLATES_DIR, auto_reload=getattr(settings, "TEMPLATE_DEBUG", False),
+                )
+    return _loader
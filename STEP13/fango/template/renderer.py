@@ -1,10 +1,37 @@
-import os
+from typing import Iterator
 
 import settings
+from fango.template.engine import get_loader
 
-def render(template_name: str, context: dict):
-    template_path = os.path.join(settings.TEMPLATES_DIR, template_name)
-    with open(template_path) as f:
-        template = f.read()
+# render_streamが1回に返すチャンクの目安のサイズのデフォルト値(文字数)
+DEFAULT_STREAM_CHUNK_SIZE = 8192
 
-    return template.format(**context)
\ No newline at end of file
+def render(template_name: str, context: dict) -> str:
+    """
+    TEMPLATES_DIRのテンプレートをcontextで評価した文字列を返す
+    テンプレートは初回にコンパイルしてキャッシュし、以降はファイルを読み込まない
+    """
+    template = get_loader().get_template(template_name)
+    return template.render(context)
+
+def render_stream(template_name: str, context: dict, encoding: str = "utf-8") -> Iterator[bytes]:
+    """
+    テンプレートを評価しながら、出力をエンコードしたチャンクを順番に返す
+    HTTPResponseのbodyに渡すと、ページ全体を組み立てずにチャンクができるたびにクライアントへ送信される
+    細かい出力はTEMPLATE_STREAM_CHUNK_SIZE程度の大きさになるまでまとめてから返す
+    """
+    chunk_size = getattr(settings, "TEMPLATE_STREAM_CHUNK_SIZE", DEFAULT_STREAM_CHUNK_SIZE)
+    template = get_loader().get_template(template_name)
+
+    buffer = []
+    buffered_size = 0
+    for text in template.generate(context):
+        buffer.append(text)
+        buffered_size += len(text)
+        if buffered_size >= chunk_size:
+            yield "".join(buffer).encode(encoding)
+            buffer.clear()
+            buffered_size = 0
+
+    if buffer:
+        yield "".join(buffer).encode(encoding)
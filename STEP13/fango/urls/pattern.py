@@ -1,26 +1,132 @@
-from ast import Call
-from lib2to3.pgen2.token import OP
 import re
-from re import Match
-from typing import Callable, Optional
+import uuid
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
 
 from fango.http.request import HTTPRequest
 from fango.http.response import HTTPResponse
 
+class Converter:
+    """
+    URLパターンの<型:名前>の型
+    regexにマッチした文字列をto_pythonで変換してviewに渡す
+    """
+
+    def __init__(self, regex: str, to_python: Callable[[str], Any] = str):
+        self.regex = regex
+        self.to_python = to_python
+
+
+# 型名と変換方法の対応
+# <名前>のように型を省略した場合はstrとする
+CONVERTERS: Dict[str, Converter] = {
+    "str": Converter(r"[^/]+"),
+    "int": Converter(r"[0-9]+", int),
+    "slug": Converter(r"[-a-zA-Z0-9_]+"),
+    "uuid": Converter(r"[0-9a-fA-F]{8}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-[0-9a-fA-F]{12}", uuid.UUID),
+    # 残りのpath全体(/を含む)にマッチする。パターンの最後のセグメントにだけ書ける
+    "path": Converter(r".+"),
+}
+
+# <型:名前>または<名前>
+PARAMETER_PATTERN = re.compile(r"<(?:(?P<converter>[a-zA-Z_][a-zA-Z0-9_]*):)?(?P<name>[a-zA-Z_][a-zA-Z0-9_]*)>")
+
+
+class Segment:
+    """
+    URLパターンを/で区切った1つ分
+    パラメータを含まない場合はtextと完全に一致するセグメントだけにマッチする
+    """
+    __slots__ = ("text", "regex", "converters", "is_rest")
+
+    def __init__(self, text: str):
+        self.text = text
+        # パラメータの名前と変換方法
+        self.converters: List[Tuple[str, Converter]] = []
+        self.regex: Optional[re.Pattern] = None
+        # <path:名前>だけからなり、残りのpath全体にマッチするか
+        self.is_rest = False
+
+        regex = ""
+        position = 0
+        for match in PARAMETER_PATTERN.finditer(text):
+            converter_name = match.group("converter") or "str"
+            if converter_name not in CONVERTERS:
+                raise ValueError(f"unknown converter {converter_name!r} in URL pattern segment {text!r}")
+            if converter_name == "path" and match.group(0) != text:
+                raise ValueError(f"<path:...> must be a whole segment: {text!r}")
+
+            converter = CONVERTERS[converter_name]
+            regex += re.escape(text[position:match.start()]) + f"({converter.regex})"
+            self.converters.append((match.group("name"), converter))
+            self.is_rest = converter_name == "path"
+            position = match.end()
+
+        if self.converters:
+            self.regex = re.compile(regex + re.escape(text[position:]))
+
+    def match(self, segment: str) -> Optional[Dict[str, Any]]:
+        """
+        セグメントがマッチした場合はパラメータの辞書を返し、マッチしなかった場合はNoneを返す
+        """
+        match = self.regex.fullmatch(segment)
+        if match is None:
+            return None
+        try:
+            return {
+                name: converter.to_python(value)
+                for (name, converter), value in zip(self.converters, match.groups())
+            }
+        except ValueError:
+            return None
+
+
 class URLPattern:
+    """
+    pathとview関数の対応
+    パターンは生成時に一度だけ解析しておき、リクエストごとには解析しない
+    ex) '/user/<int:user_id>/profile'
+
+    methodsにはviewが受け付けるメソッドを指定する(省略した場合はGETのみ)
+    GETを受け付ける場合はHEADも受け付け、GETのviewを実行してボディを送信せずに返す
+    OPTIONSと、受け付けないメソッドへの405はviewを呼ばずにURLResolverが返す
+    """
     pattern: str
     view: Callable[[HTTPRequest], HTTPResponse]
+    methods: Tuple[str, ...]
+    segments: List[Segment]
 
-    def __init__(self, pattern: str, view: Callable[[HTTPRequest], HTTPResponse]):
+    def __init__(
+        self, pattern: str, view: Callable[[HTTPRequest], HTTPResponse], methods: Iterable[str] = ("GET",),
+    ):
         self.pattern = pattern
         self.view = view
+        self.methods = tuple(method.upper() for method in methods)
+        self.segments = [Segment(text) for text in pattern.split("/")]
+        if any(segment.is_rest for segment in self.segments[:-1]):
+            raise ValueError(f"<path:...> must be the last segment: {pattern!r}")
 
-    def match(self, path: str) -> Optional[Match]:
+    def match(self, path: str) -> Optional[Dict[str, Any]]:
         """
         pathがURLパターンにマッチするか判定する
-        マッチした場合はMatchオブジェクトを返し、マッチしなかった場合はNoneを返す
+        マッチした場合はパラメータの辞書を返し、マッチしなかった場合はNoneを返す
         """
-        # URLパターンを正規表現パターンに変換する
-        # ex) '/user/<user_id>/profile' => '/user/(?P<user_id>[^/]+)/profile'
-        pattern = re.sub(r"<(.+?)>", r"(?P<\1>[^/]+)", self.pattern)
-        return re.match(pattern, path)
+        parts = path.split("/")
+        params = {}
+        for index, segment in enumerate(self.segments):
+            if segment.is_rest:
+                segment_params = segment.match("/".join(parts[index:]))
+            elif index >= len(parts):
+                return None
+            elif segment.regex is None:
+                segment_params = {} if parts[index] == segment.text else None
+            else:
+                segment_params = segment.match(parts[index])
+            if segment_params is None:
+                return None
+            params.update(segment_params)
+            if segment.is_rest:
+                return params
+
+        if len(parts) != len(self.segments):
+            return None
+        return params
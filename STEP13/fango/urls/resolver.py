@@ -1,21 +1,180 @@
-from typing import Callable
+from typing import Any, Callable, Dict, List, Optional, Tuple
 
 from fango.http.request import HTTPRequest
 from fango.http.response import HTTPResponse
-from fango.views.static import static
+from fango.urls.pattern import Segment, URLPattern
+from fango.views.static import not_found, static, static_file_exists
 from urls import url_patterns
 
+View = Callable[[HTTPRequest], HTTPResponse]
+
+# 静的ファイルが受け付けるメソッド
+STATIC_METHODS = ("GET", "HEAD", "OPTIONS")
+
+
+class RouteNode:
+    """
+    URLパターンをセグメントごとに辿る木の節
+    """
+    __slots__ = ("static", "dynamic", "rest", "views", "allow", "method_not_allowed", "options")
+
+    def __init__(self):
+        # パラメータを含まないセグメントの子(セグメントの文字列で引く)
+        self.static: Dict[str, RouteNode] = {}
+        # パラメータを含むセグメントの子(同じ書き方のセグメントは同じ子を共有する)
+        self.dynamic: Dict[str, Tuple[Segment, RouteNode]] = {}
+        # <path:...>で残りのpath全体にマッチする子
+        self.rest: Dict[str, Tuple[Segment, RouteNode]] = {}
+        # ここでpathが終わる場合の、メソッドとviewの対応
+        self.views: Dict[str, View] = {}
+        # 受け付けるメソッドの一覧(Allowヘッダの値)
+        self.allow = ""
+        # 受け付けないメソッドに405を返すviewと、OPTIONSに受け付けるメソッドの一覧を返すview
+        # viewを登録したときに生成し、リクエストごとには生成しない
+        self.method_not_allowed: Optional[View] = None
+        self.options: Optional[View] = None
+
+    def add_view(self, methods: Tuple[str, ...], view: View) -> None:
+        for method in methods:
+            # 同じpathとメソッドの組が複数ある場合は先に書いたものを使う
+            self.views.setdefault(method, view)
+        # GETのviewはHEADでも使う(ボディはサーバが送信しない)
+        if "GET" in self.views:
+            self.views.setdefault("HEAD", self.views["GET"])
+        self.allow = ", ".join(sorted({*self.views, "OPTIONS"}))
+        self.method_not_allowed = method_not_allowed(self.allow)
+        self.options = options(self.allow)
+
+
+def method_not_allowed(allow: str) -> View:
+    """
+    pathは存在するがメソッドを受け付けない場合の、405を返すviewを生成する
+    """
+    def view(request: HTTPRequest) -> HTTPResponse:
+        body = b"<html><body><h1>405 Method Not Allowed</h1></body></html>"
+        return HTTPResponse(body=body, content_type="text/html; charset=UTF-8", status_code=405, headers={"Allow": allow})
+    return view
+
+
+def options(allow: str) -> View:
+    """
+    OPTIONSに対して、受け付けるメソッドの一覧を返すviewを生成する
+    """
+    def view(request: HTTPRequest) -> HTTPResponse:
+        return HTTPResponse(status_code=204, headers={"Allow": allow})
+    return view
+
+
+# 静的ファイルへのGET・HEAD以外のリクエストに返すview
+static_method_not_allowed = method_not_allowed(", ".join(STATIC_METHODS))
+static_options = options(", ".join(STATIC_METHODS))
+
+
+def static_other_methods(request: HTTPRequest) -> HTTPResponse:
+    """
+    URLパターンにマッチしないpathへのGET・HEAD以外のリクエストを処理する
+    静的ファイルが存在する場合だけ405(OPTIONSの場合は204)を返し、存在しない場合は404を返す
+    """
+    if not static_file_exists(request.path.partition("?")[0]):
+        return not_found(request)
+    if request.method == "OPTIONS":
+        return static_options(request)
+    return static_method_not_allowed(request)
+
+
 class URLResolver:
-    def resolve(self, request: HTTPRequest) -> Callable[[HTTPRequest], HTTPResponse]:
+    """
+    URLパターンをセグメントの木にまとめておき、pathのセグメントを順に辿ってURL解決を行う
+    解決にかかる時間はURLパターンの数ではなくpathのセグメント数で決まる
+
+    同じ位置では、パラメータを含まないセグメントを優先し、
+    次にパラメータを含むセグメント、<path:...>の順に、それぞれurls.pyに書いた順で試す
+    pathが一致した節では、メソッドとviewの表からviewを選ぶ
+    """
+
+    def __init__(self, url_patterns: List[URLPattern]):
+        self.root = RouteNode()
+        for url_pattern in url_patterns:
+            self.add(url_pattern)
+
+    def add(self, url_pattern: URLPattern) -> None:
+        node = self.root
+        for segment in url_pattern.segments:
+            if segment.is_rest:
+                children = node.rest
+            elif segment.regex is None:
+                node = node.static.setdefault(segment.text, RouteNode())
+                continue
+            else:
+                children = node.dynamic
+            if segment.text not in children:
+                children[segment.text] = (segment, RouteNode())
+            node = children[segment.text][1]
+
+        node.add_view(url_pattern.methods, url_pattern.view)
+
+    def find(self, path: str) -> Optional[Tuple[RouteNode, Dict[str, Any]]]:
+        """
+        pathにマッチする節とパラメータを返す
+        マッチするURLパターンがない場合はNoneを返す
+        """
+        return self.find_from(self.root, path.split("/"), 0)
+
+    def find_from(self, node: RouteNode, parts: List[str], index: int) -> Optional[Tuple[RouteNode, Dict[str, Any]]]:
+        if index == len(parts):
+            if not node.views:
+                return None
+            return node, {}
+
+        part = parts[index]
+        child = node.static.get(part)
+        if child is not None:
+            result = self.find_from(child, parts, index + 1)
+            if result is not None:
+                return result
+
+        for segment, child in node.dynamic.values():
+            params = segment.match(part)
+            if params is None:
+                continue
+            result = self.find_from(child, parts, index + 1)
+            if result is not None:
+                found_node, child_params = result
+                params.update(child_params)
+                return found_node, params
+
+        if node.rest:
+            rest = "/".join(parts[index:])
+            for segment, child in node.rest.values():
+                params = segment.match(rest)
+                if params is not None:
+                    return child, params
+
+        return None
+
+    def resolve(self, request: HTTPRequest) -> View:
         """
         URL解決を行う
-        pathにマッチするurlパターンが存在した場合は対応するviewを返す
-        存在しなかった場合はNoneを返す
+        pathにマッチするurlパターンが存在した場合は、メソッドに対応するviewを返す
+        存在しなかった場合は静的ファイルを返すviewを返す
         """
-        for url_pattern in url_patterns:
-            match = url_pattern.match(request.path)
-            if match:
-                request.params.update(match.groupdict())
-                return url_pattern.view
+        # クエリ文字列はURL解決に使わない
+        path = request.path.partition("?")[0]
+
+        result = self.find(path)
+        if result is None:
+            if request.method in ("GET", "HEAD"):
+                return static
+            return static_other_methods
+
+        node, params = result
+        view = node.views.get(request.method)
+        if view is None:
+            return node.options if request.method == "OPTIONS" else node.method_not_allowed
+
+        request.params.update(params)
+        return view
+
 
-        return static
\ No newline at end of file
+# urls.pyを読み込んだときに一度だけURLパターンの木を組み立てる
+resolver = URLResolver(url_patterns)
@@ -0,0 +1,41 @@
+import json
+import urllib.parse
+
+import settings
+from fango.http.request import HTTPRequest
+from fango.http.response import HTTPResponse
+from fango.server.capture import get_request_capture
+
+def captured_requests(request: HTTPRequest) -> HTTPResponse:
+    """
+    キャプチャした直近のリクエストを新しい順にJSONで返す
+    クエリ文字列で件数(limit)とメソッド(method)を指定できる
+    ex) /admin/requests?limit=10&method=POST
+
+    REQUEST_CAPTURE_ADMIN_ENABLEDがFalseの場合やキャプチャが無効の場合は404を返す
+    Authorization・Cookieなど認証情報を含むヘッダの値は伏せて返す
+    """
+    request_capture = get_request_capture() if getattr(settings, "REQUEST_CAPTURE_ADMIN_ENABLED", False) else None
+    if request_capture is None:
+        body = b"<html><body><h1>404 Not Found</h1></body></html>"
+        return HTTPResponse(body=body, content_type="text/html; charset=UTF-8", status_code=404)
+
+    query = urllib.parse.parse_qs(urllib.parse.urlsplit(request.path).query)
+    try:
+        limit = int(query["limit"][0]) if "limit" in query else None
+    except ValueError:
+        limit = None
+    method = query["method"][0].upper() if "method" in query else None
+
+    captured = [
+        {
+            "time": item.time,
+            "size": len(item.data),
+            # 生データはバイト列なので、1バイトを1文字に対応させて文字列にする
+            "data": item.redacted().decode("latin-1"),
+        }
+        for item in request_capture.recent(limit, method)
+    ]
+    body = json.dumps(captured, ensure_ascii=False, indent=2)
+
+    return HTTPResponse(body=body, content_type="application/json", headers={"Cache-Control": "no-store"})
@@ -1,9 +1,41 @@
 import os
-import traceback
+import secrets
+from typing import Optional
 
 import settings
+from fango.cache.static import get_static_cache
+from fango.http.conditional import is_not_modified, make_etag, make_last_modified
+from fango.http.mime import guess_content_type
+from fango.http.ranges import if_range_matches, parse_range
 from fango.http.request import HTTPRequest
-from fango.http.response import HTTPResponse
+from fango.http.response import FileResponse, HTTPResponse
+from fango.middleware.compression import add_vary, is_compressible, negotiate_encoding
+from fango.server.log import get_logger
+
+def get_static_file_path(path: str) -> str:
+    """
+    リクエストのpathに対応する静的ファイルのpathを返す
+    キャッシュのキーを揃えるために正規化し、STATIC_ROOTの外を指している場合はFileNotFoundErrorを送出する
+    """
+    static_root = getattr(settings, "STATIC_ROOT")
+    # pathの先頭の/を削除し相対パスにしておく
+    static_file_path = os.path.normpath(os.path.join(static_root, path.lstrip("/")))
+    if not static_file_path.startswith(os.path.join(static_root, "")):
+        raise FileNotFoundError(static_file_path)
+    return static_file_path
+
+
+def static_file_exists(path: str) -> bool:
+    try:
+        return os.path.isfile(get_static_file_path(path))
+    except FileNotFoundError:
+        return False
+
+
+def not_found(request: HTTPRequest) -> HTTPResponse:
+    response_body = b"<html><body><h1>404 Not Found</h1></body></html>"
+    return HTTPResponse(body=response_body, content_type="text/html;", status_code=404)
+
 
 def static(request: HTTPRequest) -> HTTPResponse:
     """
@@ -11,23 +43,98 @@ def static(request: HTTPRequest) -> HTTPResponse:
     """
 
     try:
-        static_root = getattr(settings, "STATIC_ROOT")
+        static_file_path = get_static_file_path(request.path)
+        content_type = guess_content_type(static_file_path)
 
-        # pathの先頭の/を削除し相対パスにしておく
-        relative_path = request.path.lstrip("/")
-        # ファイルのpathを取得
-        static_file_path = os.path.join(static_root, relative_path)
+        # Rangeが指定された場合は、その範囲だけをファイルから直接送信する
+        range_header = request.get_header("Range") if request.method == "GET" else None
 
-        with open(static_file_path, "rb") as f:
-            response_body = f.read()
+        # 圧縮済みの.gzファイルがあり、クライアントがgzipを受け付ける場合はそちらを返す
+        precompressed = (
+            range_header is None
+            and getattr(settings, "STATIC_PRECOMPRESSED", False)
+            and is_compressible(content_type)
+        )
+        if precompressed and negotiate_encoding(request, ("gzip",)) == "gzip":
+            try:
+                response = serve_file(request, static_file_path + ".gz", content_type, None)
+            except FileNotFoundError:
+                pass
+            else:
+                if response.status_code == 200:
+                    response.headers["Content-Encoding"] = "gzip"
+                add_vary(response, "Accept-Encoding")
+                return response
 
-        content_type = None
-        return HTTPResponse(body=response_body, content_type=content_type, status_code=200)
+        response = serve_file(request, static_file_path, content_type, range_header)
+        if precompressed:
+            add_vary(response, "Accept-Encoding")
+        return response
 
-    except OSError:
+    except OSError as e:
         # ファイルを取得できなかった場合はログを出力して404を返す
-        traceback.print_exc()
+        # 404自体はアクセスログに記録されるので、理由はDEBUGのときだけ出力する
+        get_logger().debug(f"static: ファイルを取得できませんでした {e!r}")
+        return not_found(request)
+
+
+def serve_file(request: HTTPRequest, path: str, content_type: str, range_header: Optional[str]) -> HTTPResponse:
+    """
+    pathのファイルの内容をcontent_typeとして返すレスポンスを生成する
+    ファイルが存在しない場合はOSErrorを送出する
+    """
+    # 小さいファイルはキャッシュしたメモリ上の内容を返す
+    static_cache = get_static_cache()
+    if static_cache is not None and range_header is None:
+        entry = static_cache.get(path)
+        if entry is not None:
+            if is_not_modified(request, entry.headers["ETag"], entry.mtime):
+                return not_modified(entry.headers)
+            return HTTPResponse(body=entry.body, content_type=content_type, status_code=200, headers=dict(entry.headers))
 
-        response_body = b"<html><body><h1>404 Not Found</h1></body></html>"
-        content_type = "text/html;"
-        return HTTPResponse(body=response_body, content_type=content_type, status_code=404)
+    # ファイルの内容は読み込まず、サーバがsendfileで送信する
+    f = open(path, "rb")
+
+    try:
+        response = FileResponse(f, content_type=content_type, status_code=200)
+    except OSError:
+        f.close()
+        raise
+
+    response.headers["ETag"] = make_etag(response.stat)
+    response.headers["Last-Modified"] = make_last_modified(response.stat)
+    response.headers["Accept-Ranges"] = "bytes"
+    if is_not_modified(request, response.headers["ETag"], response.stat.st_mtime):
+        response.close()
+        return not_modified(response.headers)
+
+    if range_header is not None and if_range_matches(request, response.headers["ETag"], response.stat.st_mtime):
+        ranges = parse_range(range_header, response.size)
+        if ranges == []:
+            response.close()
+            return range_not_satisfiable(response.size)
+        if ranges is not None and len(ranges) == 1:
+            response.set_range(*ranges[0])
+        elif ranges is not None:
+            response.set_ranges(ranges, content_type, secrets.token_hex(16))
+    return response
+
+
+def not_modified(headers: dict) -> HTTPResponse:
+    """
+    クライアントのキャッシュが有効な場合に返す、ボディを持たない304レスポンスを生成する
+    """
+    return HTTPResponse(status_code=304, headers={
+        "ETag": headers["ETag"],
+        "Last-Modified": headers["Last-Modified"],
+    })
+
+
+def range_not_satisfiable(size: int) -> HTTPResponse:
+    """
+    Rangeで指定された範囲がファイルの外を指している場合に返す416レスポンスを生成する
+    """
+    response_body = b"<html><body><h1>416 Range Not Satisfiable</h1></body></html>"
+    return HTTPResponse(
+        status_code=416, content_type="text/html;", body=response_body, headers={"Content-Range": f"bytes */{size}"},
+    )
@@ -7,4 +7,207 @@ BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 STATIC_ROOT = os.path.join(BASE_DIR, "static")
 
 # テンプレートファイルを置くディレクトリ
-TEMPLATES_DIR = os.path.join(BASE_DIR, "templates")
\ No newline at end of file
+TEMPLATES_DIR = os.path.join(BASE_DIR, "templates")
+
+# テンプレートのデバッグモード
+# Trueの場合はテンプレートを使うたびにファイルの更新日時を確認し、変更されていればコンパイルし直す
+# Falseの場合は初回にコンパイルした結果を使い続け、ファイルを読み込まない
+TEMPLATE_DEBUG = False
+
+# render_streamが1回に送信するチャンクの目安のサイズ(文字数)
+TEMPLATE_STREAM_CHUNK_SIZE = 8192
+
+# ワーカースレッドプールのスレッド数
+# 0を指定した場合はプールを使わず、接続ごとにスレッドを生成する
+WORKER_POOL_SIZE = 16
+
+# ワーカースレッドに渡す前の接続を溜めておくキューの長さ
+# キューが満杯の場合は503を返して接続を閉じる
+WORKER_QUEUE_SIZE = 128
+
+# 接続待ちキューの長さ(listenのbacklog)
+LISTEN_BACKLOG = 128
+
+# 使用するサーバの実装
+# "thread": 接続をワーカースレッドで処理する
+# "eventloop": selectorsを使ったシングルスレッドのイベントループで処理する
+# "asyncio": asyncioで処理する(async defのviewを直接awaitできる)
+SERVER_ENGINE = "thread"
+
+# イベントループ(eventloop, asyncio)で同期的なview関数を実行するスレッドプールのスレッド数
+EVENT_LOOP_EXECUTOR_SIZE = 8
+
+# forkするプロセス数(起動時に--workersで上書きできる)
+# 1の場合はforkせずに起動したプロセスで処理する
+WORKERS = 1
+
+# Trueの場合、forkした子プロセスがそれぞれSO_REUSEPORTでsocketを生成する
+# Falseの場合、マスタープロセスで生成したsocketを子プロセスが共有する
+REUSE_PORT = False
+
+# レスポンスのServerヘッダに入れるサーバ名(空文字列の場合はServerヘッダを付けない)
+SERVER_NAME = "FunaServer/0.1"
+
+# Keep-Alive: 次のリクエストを待つ最大時間(秒)
+# この時間リクエストが来なかった接続は閉じる
+KEEP_ALIVE_TIMEOUT = 5
+
+# Keep-Alive: 1つの接続で処理するリクエストの最大数
+KEEP_ALIVE_MAX_REQUESTS = 100
+
+# パイプライニング: 1つの接続で同時に処理するリクエストの最大数
+PIPELINE_MAX_DEPTH = 16
+
+# パイプライニングで届いたリクエストのview関数を並行に実行するスレッドプールのスレッド数
+PIPELINE_EXECUTOR_SIZE = 8
+
+# リクエストライン・ヘッダの最大サイズ(バイト)
+# 超えた場合は431を返す
+MAX_REQUEST_HEADER_SIZE = 65536
+
+# メモリに読み込むリクエストボディの最大サイズ(バイト)
+# request.body、application/x-www-form-urlencodedのフォーム、
+# リクエスト全体を受信してから処理するイベントループのサーバ(SERVER_ENGINE = "eventloop")に適用する
+# 超えた場合は413を返す
+MAX_REQUEST_BODY_SIZE = 10 * 1024 * 1024
+
+# request.streamから少しずつ読み込むリクエストボディの最大サイズ(バイト)
+# multipart/form-dataのアップロードなど、メモリに載せずに処理するボディに適用する
+# 超えた場合は413を返す
+MAX_STREAMED_BODY_SIZE = 1024 * 1024 * 1024
+
+# multipart/form-data: アップロードされたファイルをメモリに保持する上限(バイト)
+# 超えた場合は一時ファイルに書き出す
+MULTIPART_SPOOL_THRESHOLD = 1024 * 1024
+
+# multipart/form-data: ファイル以外のフィールドの値の最大サイズ(バイト)
+MULTIPART_MAX_FIELD_SIZE = 1024 * 1024
+
+# multipart/form-data: 1つのボディに含められるパートの最大数
+# 超えた場合は413を返す
+MULTIPART_MAX_PARTS = 1000
+
+# multipart/form-data: 1つのボディでメモリに保持する合計サイズの上限(バイト)
+# フィールドの値と、ファイルのうち一時ファイルに書き出すまでメモリに保持する分を合計する
+# 超えた場合は413を返す
+MULTIPART_MAX_MEMORY = 10 * 1024 * 1024
+
+# 静的ファイルのキャッシュ: 小さいファイルの内容をメモリに保持するか
+STATIC_CACHE_ENABLED = True
+
+# 静的ファイルのキャッシュ: 保持するファイルの合計サイズの上限(バイト)
+# 超えた場合は最も長く使われていないものから破棄する
+STATIC_CACHE_MAX_BYTES = 64 * 1024 * 1024
+
+# 静的ファイルのキャッシュ: キャッシュするファイルの最大サイズ(バイト)
+# 超えるファイルはキャッシュせずsendfileで送信する
+STATIC_CACHE_MAX_FILE_SIZE = 1024 * 1024
+
+# 静的ファイルのキャッシュ: ファイルの変更を検知する方法
+# "mtime": 取得のたびに更新日時を確認する
+# "inotify": inotifyで変更を監視する(Linuxのみ。使えない場合は"mtime"になる)
+STATIC_CACHE_INVALIDATION = "inotify"
+
+# view関数が返したレスポンスに順に適用するミドルウェア("モジュール名.関数名")
+MIDDLEWARE = [
+    "fango.middleware.compression.compression",
+]
+
+# レスポンスの圧縮: 圧縮するレスポンスの最小サイズ(バイト)
+COMPRESSION_MIN_SIZE = 1024
+
+# レスポンスの圧縮: 圧縮するContent-Type
+COMPRESSION_TYPES = (
+    "text/html",
+    "text/css",
+    "text/plain",
+    "text/javascript",
+    "application/javascript",
+    "application/json",
+    "image/svg+xml",
+)
+
+# レスポンスの圧縮: 圧縮レベル(1~9)
+COMPRESSION_LEVEL = 6
+
+# レスポンスの圧縮: 圧縮結果のキャッシュに保持する合計サイズの上限(バイト)
+COMPRESSION_CACHE_MAX_BYTES = 16 * 1024 * 1024
+
+# 静的ファイル: STATIC_ROOTに圧縮済みの.gzファイルがあれば、gzipを受け付けるクライアントにはそちらを返すか
+STATIC_PRECOMPRESSED = True
+
+# レスポンスのキャッシュ: cache_pageを適用したviewのレスポンスを保持する合計サイズの上限(バイト)
+# 超えた場合は最も長く使われていないものから破棄する
+RESPONSE_CACHE_MAX_BYTES = 16 * 1024 * 1024
+
+# レスポンスのキャッシュ: 同じキーのviewを実行している最中のリクエストが、その結果を待つ最大時間(秒)
+# 超えた場合は待たずに自分でviewを呼び出す
+RESPONSE_CACHE_WAIT_TIMEOUT = 10.0
+
+# リクエストのキャプチャ: 受信したリクエストの生データを記録するか(デバッグ用)
+# Falseの場合はキャプチャのための処理やディスクへの書き込みを一切行わない
+REQUEST_CAPTURE_ENABLED = False
+
+# リクエストのキャプチャ: Trueの場合は/admin/requestsで直近のリクエストを確認できる
+# /admin/requestsには認証がなく、接続できる全てのクライアントに受信データを返すので、
+# 開発時など信頼できるネットワークでだけ有効にすること(Authorization・Cookieの値は伏せて返す)
+REQUEST_CAPTURE_ADMIN_ENABLED = False
+
+# リクエストのキャプチャ: メモリに保持する直近のリクエストの数
+REQUEST_CAPTURE_SIZE = 100
+
+# リクエストのキャプチャ: キャプチャするリクエストの割合(0.0~1.0)
+REQUEST_CAPTURE_SAMPLE_RATE = 1.0
+
+# リクエストのキャプチャ: キャプチャしたリクエストをバックグラウンドで書き出すディレクトリ
+# Noneの場合はファイルに書き出さずメモリにだけ保持する
+REQUEST_CAPTURE_DIR = os.path.join(BASE_DIR, "captures")
+
+# リクエストのキャプチャ: 書き出すファイルの最大サイズ(バイト)
+# 超えた場合はファイル名に.1, .2, ...を付けて新しいファイルに書き込む
+REQUEST_CAPTURE_MAX_FILE_SIZE = 10 * 1024 * 1024
+
+# リクエストのキャプチャ: 残しておく古いファイルの数
+REQUEST_CAPTURE_BACKUP_COUNT = 5
+
+# リクエストのキャプチャ: 書き出しを待っているリクエストの最大数
+# 書き出しが追いつかずに超えた場合は、ファイルへの書き出しを諦める(メモリには保持する)
+REQUEST_CAPTURE_QUEUE_SIZE = 10000
+
+# ログ: 出力するサーバの動作のログの最低レベル("DEBUG", "INFO", "WARNING", "ERROR")
+# "DEBUG"の場合は接続の開始・終了も出力する
+LOG_LEVEL = "INFO"
+
+# ログ: サーバの動作のログを書き出すファイル(Noneの場合は標準エラー出力)
+LOG_FILE = None
+
+# アクセスログ: リクエストごとにアクセスログを出力するか
+ACCESS_LOG_ENABLED = True
+
+# アクセスログ: 形式
+# "common": Common Log Format
+# "combined": Combined Log Format(Common Log FormatにRefererとUser-Agentを加えたもの)
+# "json": 1リクエスト1行のJSON
+ACCESS_LOG_FORMAT = "combined"
+
+# アクセスログ: アクセスログを書き出すファイル(Noneの場合は標準出力)
+ACCESS_LOG_FILE = None
+
+# アクセスログ: 記録するリクエストの割合(0.0~1.0)
+ACCESS_LOG_SAMPLE_RATE = 1.0
+
+# ログ: ファイルに書き出す場合の最大サイズ(バイト)
+# 超えた場合はファイル名に.1, .2, ...を付けて新しいファイルに書き込む
+LOG_MAX_FILE_SIZE = 10 * 1024 * 1024
+
+# ログ: ファイルに書き出す場合に残しておく古いファイルの数
+LOG_BACKUP_COUNT = 5
+
+# ログ: 書き出しを待っているログの最大数
+# 書き出しが追いつかずに超えた場合は、ログを捨てる
+LOG_QUEUE_SIZE = 10000
+
+# 使い終わったHTTPRequestを使い回すために保持しておく最大数(0の場合は使い回さない)
+# 使い回す場合、viewはレスポンスを返した後(ボディをイテレータで返す場合は送信し終わった後)にrequestを参照してはいけない
+# __slots__にしたことで生成のコストは十分小さく、使い回しても速くならなかった(benchmarks/request_allocations.py)ので、既定では使い回さない
+REQUEST_POOL_SIZE = 0
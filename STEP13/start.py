@@ -1,4 +1,28 @@
+import argparse
+
+import settings
+from fango.server.async_server import AsyncServer
+from fango.server.eventloop import EventLoopServer
+from fango.server.prefork import PreforkServer
 from fango.server.server import Server
 
+# SERVER_ENGINEの設定値とサーバの実装の対応
+SERVERS = {
+    "thread": Server,
+    "eventloop": EventLoopServer,
+    "asyncio": AsyncServer,
+}
+
 if __name__ == "__main__":
-    Server().serve()
\ No newline at end of file
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "--workers", type=int, default=getattr(settings, "WORKERS", 1),
+        help="forkするプロセス数(1の場合はforkせずにこのプロセスで処理する)",
+    )
+    args = parser.parse_args()
+
+    server_class = SERVERS[getattr(settings, "SERVER_ENGINE", "thread")]
+    if args.workers > 1:
+        PreforkServer(server_class, args.workers, reuse_port=getattr(settings, "REUSE_PORT", False)).serve()
+    else:
+        server_class().serve()
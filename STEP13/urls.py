@@ -1,10 +1,16 @@
 import views
+from fango.cache.response import cache_page
 from fango.urls.pattern import URLPattern
+from fango.views.capture import captured_requests
 
 # pathとview関数の対応
 url_patterns = [
     URLPattern("/now", views.now),
-    URLPattern("/show_request", views.show_request),
-    URLPattern("/parameters", views.parameters),
-    URLPattern("/user/<user_id>/profile", views.user_profile),
+    URLPattern("/stream", views.stream),
+    URLPattern("/show_request", views.show_request, methods=["GET", "POST", "PUT", "PATCH", "DELETE"]),
+    URLPattern("/parameters", views.parameters, methods=["POST"]),
+    # 同じユーザーのページは同じ内容になるので、レスポンスを60秒間キャッシュする
+    URLPattern("/user/<int:user_id>/profile", cache_page(60)(views.user_profile)),
+    # キャプチャした直近のリクエスト(REQUEST_CAPTURE_ENABLEDがTrueの場合のみ)
+    URLPattern("/admin/requests", captured_requests),
 ]
\ No newline at end of file
@@ -1,10 +1,10 @@
-import urllib.parse
+import time
 from datetime import datetime
 from pprint import pformat
 
 from fango.http.request import HTTPRequest
 from fango.http.response import HTTPResponse
-from fango.template.renderer import render
+from fango.template.renderer import render, render_stream
 
 
 def now(request: HTTPRequest) -> HTTPResponse:
@@ -13,24 +13,37 @@ def now(request: HTTPRequest) -> HTTPResponse:
 
     return HTTPResponse(body=body)
 
+def stream(request: HTTPRequest) -> HTTPResponse:
+    # ボディをジェネレータで返すと、1行生成するたびにchunkedでクライアントへ送信される
+    def generate_body():
+        yield "<html><body><ul>"
+        for _ in range(5):
+            yield f"<li>{datetime.now()}</li>"
+            time.sleep(0.5)
+        yield "</ul></body></html>"
+
+    return HTTPResponse(body=generate_body())
+
 def show_request(request: HTTPRequest) -> HTTPResponse:
-    context = {"request": request, "headers": pformat(request.headers),"body": request.body.decode("utf-8", "ignore")}
-    body = render("show_request.html", context)
+    context = {"request": request, "headers": pformat(dict(request.headers)),"body": request.body.decode("utf-8", "ignore")}
+    # リクエストボディをそのまま表示するのでページが大きくなりうる
+    # ページ全体を組み立てずに、テンプレートを評価しながら少しずつ送信する
+    body = render_stream("show_request.html", context)
 
     return HTTPResponse(body=body)
 
 def parameters(request: HTTPRequest) -> HTTPResponse:
-    if request.method == "GET":
-        body = b"<html><body><h1>405 Method Not Allowed</h1></body></html>"
+    # POST以外のメソッドにはURLResolverが405を返すので、ここではPOSTだけを扱う
+    # multipart/form-dataの場合、ファイルはメモリに載せきらずに一時ファイルに書き出される
+    post_params = request.form
+    files = {
+        name: [(f.filename, f.content_type, f.size) for f in uploaded_files]
+        for name, uploaded_files in request.files.items()
+    }
+    context = {"post_params": pformat(post_params), "files": pformat(files)}
+    body = render("parameters.html", context)
 
-        return HTTPResponse(body=body, status_code=405)
-    
-    elif request.method == "POST":
-        post_params = urllib.parse.parse_qs(request.body.decode())
-        context = {"post_params": pformat(post_params)}
-        body = render("parameters.html", context)
-
-        return HTTPResponse(body=body)
+    return HTTPResponse(body=body)
 
 def user_profile(request: HTTPRequest) -> HTTPResponse:
     user_id = request.params["user_id"]